@@ -0,0 +1,262 @@
+from board import Board, QBoard, CaptureOption, BOARD_HEADER, BOARD_MAGIC, SNAPSHOT_VERSION, zobrist_keys
+import argparse
+import contextlib
+import json
+import platform
+import random
+import struct
+import sys
+import time
+
+SIZES = [8,16,32,64,100]
+BRANCHES = [1,16,256,4096]
+
+def population(size):
+    """The amount of rows each player starts with in the scenarios of a given size."""
+    return max(1,size // 8)
+
+def bench_board_step(size,branches,rng):
+    """`Board.move()` with a single step forward."""
+    board = Board(size,population(size))
+    step = rng.choice([move for move in board.legal_moves(1) if abs(move[2]) == 1])
+    return board.copy, lambda board: board.move(*step,1)
+
+def bench_capture_chain(size,branches,rng):
+    """`Board.move()` for every capture of a chain, zigzagging up the board from the bottom left."""
+    squares = [[0 for column in range(size)] for row in range(size)]
+    length = min(6,(size - 2) // 2)
+    squares[0][0] = 1
+    for capture in range(length):
+        squares[2*capture+1][1] = -1
+    # One more piece of the opponent, so the game doesn't end with the last capture.
+    squares[size-1][size-1] = -1
+    board = position(squares)
+    # Make the board find its capture options, before it's copied.
+    board.capture_options
+
+    chain = [(2*(capture % 2),2*capture,2 - 4*(capture % 2),2) for capture in range(length)]
+    def run(board):
+        for move in chain:
+            board.move(*move,1)
+    return board.copy, run
+
+def bench_quantum_move(size,branches,rng):
+    """`Board.quantum_move()`, which checks whether a piece can be split."""
+    board = Board(size,population(size))
+    row = population(size) - 1
+    tiles = [(column,row) for column in range(size) if board.quantum_move(column,row,1)]
+    x_pos, y_pos = rng.choice(tiles)
+    return lambda: board, lambda board: board.quantum_move(x_pos,y_pos,1)
+
+def bench_still_valid(size,branches,rng):
+    """`CaptureOption.still_valid()` for every capture any piece could try, on a board in the middle of a game."""
+    board = random_boards(size,size,rng)[-1]
+    options = [CaptureOption(piece,x_pos,y_pos,x_dir,y_dir)
+               for y_pos, row in enumerate(board.board) for x_pos, piece in enumerate(row) if piece != 0
+               for x_dir, y_dir in [(2,2),(2,-2),(-2,2),(-2,-2)]]
+    def run(board):
+        for option in options:
+            option.still_valid(board.board)
+    return lambda: board, run
+
+def bench_quantum_split(size,branches,rng):
+    """`QBoard.quantum_split()` of a piece of player 1 on a board with the given amount of positions."""
+    quantum = random_qboard(size,branches,rng)
+    first = quantum.board_list[0]
+    tiles = [(x_pos,y_pos) for y_pos, row in enumerate(first.board) for x_pos, piece in enumerate(row)
+             if piece == 1 and first.quantum_move(x_pos,y_pos,1)]
+    x_pos, y_pos = rng.choice(tiles)
+    return quantum.copy, lambda quantum: quantum.quantum_split(x_pos,y_pos,1)
+
+def bench_qboard_move(size,branches,rng):
+    """`QBoard.move()` with a step of player 1 on a board with the given amount of positions."""
+    quantum = random_qboard(size,branches,rng)
+    step = rng.choice([move for move in quantum.board_list[0].legal_moves(1) if abs(move[2]) == 1])
+    return quantum.copy, lambda quantum: quantum.move(*step,1)
+
+def bench_update_quantum_board(size,branches,rng):
+    """`QBoard.update_quantum_board()`, which counts every tile of every position from scratch."""
+    quantum = random_qboard(size,branches,rng)
+    return lambda: quantum, lambda quantum: quantum.update_quantum_board()
+
+# Every benchmark, and whether it depends on the amount of positions of a quantum board.
+BENCHMARKS = {
+    'board_step': (bench_board_step, False),
+    'capture_chain': (bench_capture_chain, False),
+    'quantum_move': (bench_quantum_move, False),
+    'still_valid': (bench_still_valid, False),
+    'quantum_split': (bench_quantum_split, True),
+    'qboard_move': (bench_qboard_move, True),
+    'update_quantum_board': (bench_update_quantum_board, True),
+}
+
+def random_boards(size,count,rng):
+    """Make the given amount of different positions, by taking random steps from the start of the game and from each other.
+    Player 1 stays below the middle of the board and player -1 above it, so no two positions can collide and nobody can capture."""
+    start = Board(size,population(size))
+    regions = {1: (0,size // 2 - 2), -1: (size // 2 + 1,size - 1)}
+    boards = [start]
+    seen = {start.square_hash()}
+
+    for attempt in range(1000 * count):
+        if len(boards) >= count:
+            break
+        parent = rng.choice(boards)
+        user = rng.choice([1,-1])
+        lowest, highest = regions[user]
+        x_pos, y_pos = rng.randrange(size), rng.randrange(lowest,highest + 1)
+        x_dir = rng.choice([-1,1])
+        if parent.board[y_pos][x_pos] != user or not lowest <= y_pos + user <= highest:
+            continue
+        if not parent.is_legal(x_pos,y_pos,x_dir,user,user):
+            continue
+
+        board = parent.copy()
+        board.move(x_pos,y_pos,x_dir,user,user)
+        if board.square_hash() not in seen:
+            seen.add(board.square_hash())
+            boards.append(board)
+
+    if len(boards) < count:
+        raise ValueError("Can't make {} different positions on a board of size {}.".format(count,size))
+    return boards[:count]
+
+def position(squares,turn=1):
+    """Make a board holding the given squares, through a snapshot, so it counts its pieces and works out its hash itself."""
+    size = len(squares)
+    square_keys, side_key = zobrist_keys(size)
+    zobrist = side_key if turn == -1 else 0
+    for y_pos, row in enumerate(squares):
+        for x_pos, piece in enumerate(row):
+            if piece != 0:
+                zobrist ^= square_keys[piece][y_pos*size+x_pos]
+    header = struct.pack(BOARD_HEADER,BOARD_MAGIC,SNAPSHOT_VERSION,0,0,turn,size,zobrist)
+    return Board.from_bytes(header + bytes(piece % 256 for row in squares for piece in row))
+
+def random_qboard(size,branches,rng):
+    """Make a quantum board that stores the given amount of different positions."""
+    quantum = QBoard(size,population(size))
+    quantum.board_list = random_boards(size,branches,rng)
+    quantum.multiplicity = [1 for board in quantum.board_list]
+    quantum.update_quantum_board()
+    return quantum
+
+def measure(prepare,run,repeat=5,min_time=0.02):
+    """Time a benchmark. Every call of `run` gets its own state from `prepare`, which isn't timed.
+    The amount of calls per sample grows until a sample takes at least `min_time` seconds.
+    Returns the seconds per call of every sample, and the amount of calls per sample."""
+    number = 1
+    while True:
+        seconds = _sample(prepare,run,number)
+        if seconds >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    samples = [seconds / number]
+    for sample in range(repeat - 1):
+        samples.append(_sample(prepare,run,number) / number)
+    return samples, number
+
+def _sample(prepare,run,number):
+    states = [prepare() for call in range(number)]
+    start = time.perf_counter()
+    for state in states:
+        run(state)
+    return time.perf_counter() - start
+
+def run_benchmarks(names=None,sizes=SIZES,branches=BRANCHES,seed=0,repeat=5,min_time=0.02,max_squares=10**7,output=None):
+    """Run the benchmarks on every board size and amount of positions, and return a report that can be stored as JSON.
+    Every case draws its scenario from a generator seeded with the seed, the benchmark and the case, so reruns time the same positions.
+    Keyword arguments:
+    names -> the benchmarks to run, from `BENCHMARKS`; all of them if None
+    sizes -> the board sizes to run every benchmark on
+    branches -> the amounts of positions to run the benchmarks of quantum boards on
+    seed -> the seed of the scenarios
+    repeat -> the amount of samples to take of every case
+    min_time -> the least amount of seconds a sample takes
+    max_squares -> cases with more squares than this, counted over all positions, are skipped
+    output -> a file object to write a line about every case to as it's done; nothing is written if None"""
+    if names is None:
+        names = list(BENCHMARKS)
+    results = []
+    skipped = []
+
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError("Unknown benchmark '{}', pick one of {}.".format(name,', '.join(BENCHMARKS)))
+        benchmark, quantum = BENCHMARKS[name]
+        for size in sizes:
+            for count in (branches if quantum else [1]):
+                case = {'name': name, 'size': size, 'branches': count}
+                if size * size * count > max_squares:
+                    skipped.append(case)
+                    continue
+
+                rng = random.Random('{} {} {} {}'.format(seed,name,size,count))
+                # With sys.stdout set to None, the warnings of jumps over friendly pieces aren't printed.
+                with contextlib.redirect_stdout(None):
+                    prepare, run = benchmark(size,count,rng)
+                    samples, number = measure(prepare,run,repeat,min_time)
+
+                samples.sort()
+                case.update({'best': samples[0], 'median': samples[len(samples) // 2], 'number': number, 'repeat': repeat})
+                results.append(case)
+                if output is not None:
+                    output.write("{:<22}{:>5}{:>6}  {:>12.3f} us\n".format(name,size,count,case['best'] * 1e6))
+                    output.flush()
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'results': results,
+        'skipped': skipped,
+    }
+
+def compare(report,baseline,tolerance=0.25):
+    """Compare a report with a baseline report, case by case on the best time, and return the cases that got slower
+    by more than the tolerance, as dictionaries with the `name`, `size`, `branches`, both times and their `ratio`."""
+    previous = {(case['name'],case['size'],case['branches']): case['best'] for case in baseline['results']}
+    regressions = []
+    for case in report['results']:
+        key = (case['name'],case['size'],case['branches'])
+        if key not in previous or previous[key] <= 0:
+            continue
+        ratio = case['best'] / previous[key]
+        if ratio > 1 + tolerance:
+            regressions.append({'name': case['name'], 'size': case['size'], 'branches': case['branches'],
+                                'best': case['best'], 'baseline': previous[key], 'ratio': ratio})
+    return regressions
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Time the hot paths of Board, QBoard and CaptureOption.")
+    parser.add_argument('--benchmarks',nargs='+',choices=list(BENCHMARKS),help="the benchmarks to run; all of them by default")
+    parser.add_argument('--sizes',nargs='+',type=int,default=SIZES)
+    parser.add_argument('--branches',nargs='+',type=int,default=BRANCHES)
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--repeat',type=int,default=5)
+    parser.add_argument('--min-time',type=float,default=0.02)
+    parser.add_argument('--max-squares',type=int,default=10**7,help="skip cases with more squares than this over all positions")
+    parser.add_argument('--output',help="file to write the report to, as JSON")
+    parser.add_argument('--baseline',help="report to compare with; slower cases make the exit code 1")
+    parser.add_argument('--tolerance',type=float,default=0.25,help="how much slower than the baseline a case may be")
+    options = parser.parse_args(arguments)
+
+    report = run_benchmarks(options.benchmarks,options.sizes,options.branches,options.seed,options.repeat,
+                            options.min_time,options.max_squares,sys.stdout)
+    if options.output:
+        with open(options.output,'w') as output:
+            json.dump(report,output,indent=1)
+
+    regressions = []
+    if options.baseline:
+        with open(options.baseline) as baseline:
+            regressions = compare(report,json.load(baseline),options.tolerance)
+        for case in regressions:
+            print("Slower: {} (size {}, {} positions) takes {:.3f} us, {:.2f} times the baseline".format(
+                case['name'],case['size'],case['branches'],case['best'] * 1e6,case['ratio']))
+        print("{} of {} cases got slower than the baseline.".format(len(regressions),len(report['results'])))
+    return regressions
+
+if __name__ == '__main__':
+    sys.exit(1 if main(sys.argv[1:]) else 0)
@@ -0,0 +1,293 @@
+from board import Move, CaptureOption
+import copy
+
+# The four diagonal directions a piece can travel in, as (x_dir, y_dir).
+DIRECTIONS = [(1,1),(-1,1),(1,-1),(-1,-1)]
+
+class BitBoard:
+    def __init__(self,size,population):
+        """Create a new board to play a game of checkers on, stored as bitboards.
+        The class plays by exactly the same rules as `Board` and returns the same `Move` values,
+        but every square check is done with integer masks instead of nested lists.
+        Keyword arguments:
+        size -> the size of the board
+        population -> the amount of rows each player has populated with pieces"""
+
+        if size < 2 * population:
+            raise ValueError("Game board not big enough to fit population for both players.")
+
+        self.size = size
+        self.finished = False
+
+        # Every row gets one extra guard column, so a diagonal shift can never wrap
+        # a piece from one side of the board to the other.
+        self.__width = size + 1
+
+        row_mask = (1 << size) - 1
+        self.__playable = 0
+        for row in range(size):
+            self.__playable |= row_mask << (row * self.__width)
+        self.__first_row = row_mask
+        self.__last_row = row_mask << ((size - 1) * self.__width)
+
+        # Precomputed shift amounts for every diagonal direction.
+        self.__shifts = [y_dir * self.__width + x_dir for x_dir, y_dir in DIRECTIONS]
+
+        self.pieces = {1: 0, -1: 0}
+        for row in range(size):
+            if row < population or row > size - population - 1:
+                for column in range(size):
+                    if (row+column) % 2 == 0:
+                        player = 1
+                        if row > size - population - 1:
+                            player = -1
+                        self.pieces[player] |= self.__bit(column,row)
+
+    def __repr__(self):
+        """Display the board to the terminal, if wished."""
+        board = self.board
+        answer = '\n'
+        for i in range(len(self)):
+            for j in range(len(self)):
+                if (i+j)%2 == 0:
+                    answer += '{}'.format(board[i][j])
+                else:
+                    answer += '-'
+                answer += '\t'
+            answer += '\n'
+        return answer
+
+    def __len__(self):
+        """Return the size of the board. One dimension is provided, not all squares comined."""
+        return self.size
+
+    @property
+    def board(self):
+        """The current game state as a list of lists, in the same layout as `Board.board`."""
+        return [[self.__piece_at(self.__bit(column,row)) for column in range(self.size)] for row in range(self.size)]
+
+    @property
+    def capture_options(self):
+        """All captures that are currently possible, as a list of `CaptureOption` objects."""
+        options = []
+        for user in [1,-1]:
+            for direction, killers in enumerate(self.__capture_masks(user)):
+                x_dir, y_dir = DIRECTIONS[direction]
+                for x_pos, y_pos in self.__squares(killers):
+                    options.append(CaptureOption(user,x_pos,y_pos,2*x_dir,2*y_dir))
+        return options
+
+    def move(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Move a certain piece, if possible.
+        The function returns an that explains whether the move has been made, and why so/not."""
+
+        if self.finished == True:
+            return Move.finish
+
+        if not self.__on_the_board(x_pos+x_dir, y_pos+y_dir):
+            return Move.out_of_bounds
+
+        # A list-backed board would wrap negative coordinates around; there's no such thing on a bitboard.
+        if not self.__on_the_board(x_pos, y_pos):
+            return Move.no_piece_found
+
+        origin = self.__bit(x_pos,y_pos)
+        moving_piece = self.__piece_at(origin)
+
+        if moving_piece == 0 or user * moving_piece < 0:
+            return Move.no_piece_found
+
+        if not self.__valid_direction(x_dir,y_dir):
+            return Move.invalid_destination
+
+        destination = self.__bit(x_pos+x_dir,y_pos+y_dir)
+        if destination & self.__occupied():
+            return Move.path_blocked
+
+        if self.__has_capture(moving_piece):
+            if not self.__is_capture_move(moving_piece,x_pos,y_pos,x_dir,y_dir):
+                return Move.capture_ignored
+
+        if abs(x_dir) == 1:
+            return self.__move_single_tile(moving_piece,origin,destination,y_dir,user)
+
+        if abs(x_dir) == 2:
+            victim = self.__bit(x_pos+(x_dir//2),y_pos+(y_dir//2))
+            return self.__move_double_tile(moving_piece,origin,victim,destination,user)
+
+        raise NotImplementedError("This code should not be reached!")
+
+    def quantum_move(self,x_pos,y_pos,user):
+        """This function tests if it is possible to make a quantum move for this function."""
+        if not self.__on_the_board(x_pos,y_pos):
+            return False
+
+        for x_dir in [-1,1]:
+            if not self.__is_quiet_step(x_pos,y_pos,x_dir,user,user):
+                return False
+        return True
+
+    def copy(self):
+        """Return an independent copy of the board."""
+        duplicate = copy.copy(self)
+        duplicate.pieces = dict(self.pieces)
+        return duplicate
+
+    def legal_moves(self,user):
+        """Yield every move `move()` would accept from the user: the same moves `Board.legal_moves()` yields.
+        Captures come first; if the user has to capture, nothing else is yielded."""
+        if self.finished:
+            return
+
+        captures = self.__capture_masks(user)
+        if any(captures):
+            for direction, killers in enumerate(captures):
+                x_dir, y_dir = DIRECTIONS[direction]
+                for x_pos, y_pos in self.__squares(killers):
+                    yield (x_pos,y_pos,2*x_dir,2*y_dir)
+            return
+
+        empty = self.__playable & ~self.__occupied()
+        for x_pos, y_pos in self.__squares(self.pieces[user]):
+            # Regular steps can only go forward.
+            for x_dir in [-1,1]:
+                if self.__on_the_board(x_pos+x_dir,y_pos+user) and self.__bit(x_pos+x_dir,y_pos+user) & empty:
+                    yield (x_pos,y_pos,x_dir,user)
+
+            # Without any capture to make, jumping over a friendly piece is allowed as well.
+            for x_dir, y_dir in [(2,2),(-2,2),(2,-2),(-2,-2)]:
+                if self.__on_the_board(x_pos+x_dir,y_pos+y_dir) and self.__bit(x_pos+x_dir,y_pos+y_dir) & empty:
+                    if not self.__bit(x_pos+(x_dir//2),y_pos+(y_dir//2)) & empty:
+                        yield (x_pos,y_pos,x_dir,y_dir)
+
+    def play(self,move,user):
+        """Make a move as yielded by `legal_moves()`."""
+        return self.move(move[0],move[1],move[2],move[3],user)
+
+    def __move_single_tile(self,moving_piece,origin,destination,y_dir,user):
+        if self.__walks_backwards(moving_piece, y_dir):
+            return Move.invalid_destination
+
+        self.pieces[moving_piece] ^= origin | destination
+
+        if self.__reached_end():
+            self.finished = True
+            self.winner = user
+            return Move.finish
+
+        return Move.success_opponents_turn
+
+    def __move_double_tile(self,moving_piece,origin,victim,destination,user):
+        victim_piece = self.__piece_at(victim)
+        if victim_piece == 0:
+            return Move.no_victim_found
+
+        if victim_piece == moving_piece:
+            # `Board` keeps track of its captures in a list and complains when jumping over a friendly piece,
+            # as that capture can't be found in there. Keep the boards indistinguishable.
+            print("WARNING: Failed attempt to remove a CaptureOption that wasn\'t present.")
+
+        self.pieces[victim_piece] ^= victim
+        self.pieces[moving_piece] ^= origin | destination
+
+        another_capture_found = False
+        for killers in self.__capture_masks(moving_piece):
+            if killers & destination:
+                another_capture_found = True
+                break
+
+        if self.__victory_found():
+            self.finished = True
+            self.winner = user
+            return Move.finish
+
+        if another_capture_found:
+            return Move.success_same_turn
+        return Move.success_opponents_turn
+
+    def __is_quiet_step(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Check whether a single step would be accepted and hand the turn to the opponent, without making it."""
+        if self.finished or not self.__on_the_board(x_pos+x_dir,y_pos+y_dir):
+            return False
+
+        moving_piece = self.__piece_at(self.__bit(x_pos,y_pos))
+        if moving_piece == 0 or user * moving_piece < 0:
+            return False
+        if self.__bit(x_pos+x_dir,y_pos+y_dir) & self.__occupied():
+            return False
+        if self.__has_capture(moving_piece) or self.__walks_backwards(moving_piece,y_dir):
+            return False
+
+        if moving_piece == 1:
+            return y_pos + y_dir != self.size - 1 and not self.__reached_end()
+        return y_pos + y_dir != 0 and not self.__reached_end()
+
+    def __capture_masks(self,user):
+        """Return, per direction in `DIRECTIONS`, a mask of all pieces of the user that can capture that way."""
+        own = self.pieces[user]
+        opponent = self.pieces[-user]
+        empty = self.__playable & ~(own | opponent)
+
+        masks = []
+        for shift in self.__shifts:
+            victims = opponent & self.__shift(empty,-shift)
+            masks.append(own & self.__shift(victims,-shift))
+        return masks
+
+    def __has_capture(self,user):
+        for killers in self.__capture_masks(user):
+            if killers:
+                return True
+        return False
+
+    def __is_capture_move(self,user,x_pos,y_pos,x_dir,y_dir):
+        if abs(x_dir) != 2:
+            return False
+        return self.__piece_at(self.__bit(x_pos+(x_dir//2),y_pos+(y_dir//2))) == -user
+
+    def __victory_found(self):
+        return self.__reached_end() or self.pieces[1] == 0 or self.pieces[-1] == 0
+
+    def __reached_end(self):
+        return bool(self.pieces[1] & self.__last_row or self.pieces[-1] & self.__first_row)
+
+    def __shift(self,mask,amount):
+        if amount > 0:
+            return (mask << amount) & self.__playable
+        return (mask >> -amount) & self.__playable
+
+    def __occupied(self):
+        return self.pieces[1] | self.pieces[-1]
+
+    def __piece_at(self,bit):
+        if self.pieces[1] & bit:
+            return 1
+        if self.pieces[-1] & bit:
+            return -1
+        return 0
+
+    def __squares(self,mask):
+        """Yield the `(x_pos,y_pos)` of every bit of the mask, row by row."""
+        while mask:
+            lowest = mask & -mask
+            y_pos, x_pos = divmod(lowest.bit_length() - 1, self.__width)
+            yield x_pos, y_pos
+            mask ^= lowest
+
+    def __bit(self,x,y):
+        return 1 << (y * self.__width + x)
+
+    def __on_the_board(self,x,y):
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def __valid_direction(self,x_direction,y_direction):
+        if abs(x_direction) != abs(y_direction):
+            return False
+        if abs(x_direction) == 0:
+            return False
+        if abs(x_direction) > 2:
+            return False
+        return True
+
+    def __walks_backwards(self,user,direction):
+        return user * direction < 0
@@ -1,6 +1,11 @@
+from collections import namedtuple
 from enum import Enum
+import array
 import random
 import copy
+import math
+import struct
+import sys
 
 class Move(Enum):
     success_opponents_turn = 1
@@ -17,6 +22,7 @@ class Move(Enum):
     friendly_piece = 10
 
     quantum_not_ready = 11
+    branch_limit = 12
 
 class Board:
     def __init__(self,size, population):
@@ -28,18 +34,36 @@ class Board:
         if size < 2 * population:
             raise ValueError("Game board not big enough to fit population for both players.")
 
-        self.board = [[0 for row in range(size)] for column in range(size)]
-        self.capture_options = []
+        self.__rows = [[0 for row in range(size)] for column in range(size)]
+        self.capture_options = CaptureIndex()
+
+        # Copies share their rows and capture options until they alter them. Bit y is set for every row this board owns.
+        self.__owned_rows = (1 << size) - 1
+        self.__owns_options = True
         self.finished = False
+        self.winner = None
+
+        # Player 1 opens the game. The turn passes on as the moves are made.
+        self.turn = 1
+
+        # Moves made through make_move() can be taken back with unmake_move().
+        self.undo_stack = []
+        self.__journal = None
+
+        # The Zobrist hash of the position and the side to move, kept up to date with every square that changes.
+        self.__square_keys, self.__side_key = zobrist_keys(size)
+        self.zobrist = 0
     
         for row in range(size):
             # Only populate the given row amount for each player.
             if row < population or row > size - population - 1:
                 for column in range(size):
                     if (row+column) % 2 == 0:
-                        self.board[row][column] = 1
+                        self.__rows[row][column] = 1
                         if row > size - population - 1:
-                            self.board[row][column] = -1
+                            self.__rows[row][column] = -1
+                        self.zobrist ^= self.__square_keys[self.__rows[row][column]][row*size+column]
+        self.__count_pieces()
     
     def __repr__(self):
         """Display the board to the terminal, if wished."""
@@ -47,7 +71,7 @@ class Board:
         for i in range(len(self)):
             for j in range(len(self)):
                 if (i+j)%2 == 0:
-                    answer += '{}'.format(self.board[i][j])
+                    answer += '{}'.format(self.__rows[i][j])
                 else:
                     answer += '-'
                 answer += '\t'
@@ -56,37 +80,33 @@ class Board:
 
     def __len__(self):
         """Return the size of the board. One dimension is provided, not all squares comined."""
-        return len(self.board)
+        return len(self.__rows)
+
+    @property
+    def board(self):
+        """The game state as a list of rows, `board[y_pos][x_pos]`.  
+        Rows that are shared with a copy are copied first, so writing to them never alters another board.  
+        Such writes don't update the piece counters, `zobrist` or the capture options of the board."""
+        if self.__owned_rows != (1 << len(self.__rows)) - 1:
+            for y_pos in range(len(self.__rows)):
+                self.__own_row(y_pos)
+        return self.__rows
+
+    @board.setter
+    def board(self,rows):
+        self.__rows = rows
+        self.__owned_rows = (1 << len(rows)) - 1
 
     def move(self,x_pos,y_pos,x_dir,y_dir,user):
         """Move a certain piece, if possible.  
         The function returns an that explains whether the move has been made, and why so/not."""
 
-        if self.finished == True:
-            return Move.finish
-
-        size = len(self)
-        if not self.__on_the_board(x_pos+x_dir, y_pos+y_dir):
-            return Move.out_of_bounds
-
-        moving_piece = self.board[y_pos][x_pos]
-
-        if moving_piece == 0 or user * moving_piece < 0:
-            return Move.no_piece_found
-
-        if not self.__valid_direction(x_dir,y_dir):
-            return Move.invalid_destination
+        refusal = self.__check_move(x_pos,y_pos,x_dir,y_dir,user)
+        if refusal is not None:
+            return refusal
 
-        if self.board[y_pos+y_dir][x_pos+x_dir] != 0:
-            return Move.path_blocked
-        
-        # List of moves the user can make if captures are possible.
-        user_capture_options = [forced_move for forced_move in self.capture_options if forced_move.user == moving_piece]
+        moving_piece = self.__rows[y_pos][x_pos]
 
-        if user_capture_options != []:
-            if not self.__is_capture_move(moving_piece,x_pos,y_pos,x_dir,y_dir):
-                return Move.capture_ignored
-        
         if abs(x_dir) == 1:
             return self.__move_single_tile(moving_piece,x_pos,y_pos,x_dir,y_dir,user)
 
@@ -97,31 +117,216 @@ class Board:
         # However, may this filter ever need to be altered, here's a handy error to let you know that you did something wrong.
         raise NotImplementedError("This code should not be reached!")
 
+    def is_legal(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Return whether `move()` would accept the given move, without making it."""
+        return self.__check_move(x_pos,y_pos,x_dir,y_dir,user) is None
+
+    def make_move(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Make a move just like `move()`, but remember how to take it back.  
+        Every call adds one entry to `undo_stack`, even if the move was refused, so each call can be paired with `unmake_move()`."""
+        self.__journal = UndoEntry(self.finished,self.winner,self.turn,self.zobrist)
+        try:
+            return self.move(x_pos,y_pos,x_dir,y_dir,user)
+        finally:
+            self.undo_stack.append(self.__journal)
+            self.__journal = None
+
+    def _apply_outcome(self,outcome):
+        """Take over a move that `make_move()` made on a copy of this board in another process, as described in `parallel.py`.  
+        Just like `make_move()`, it adds an entry to `undo_stack` and returns the answer of the move."""
+        answer, squares, removed_options, added_options, finished, winner, turn, zobrist = outcome
+        entry = UndoEntry(self.finished,self.winner,self.turn,self.zobrist)
+
+        for x_pos, y_pos, value in squares:
+            entry.squares.append((x_pos,y_pos,self.__rows[y_pos][x_pos]))
+            self.__write_square(x_pos,y_pos,value)
+
+        if removed_options or added_options:
+            self.__own_capture_options()
+        for option in removed_options:
+            option = CaptureOption(*option)
+            entry.removed_options.append((self.capture_options.remove(option),option))
+        for option in added_options:
+            option = CaptureOption(*option)
+            self.capture_options.add(option)
+            entry.added_options.append(option)
+
+        self.finished = finished
+        self.winner = winner
+        self.turn = turn
+        self.zobrist = zobrist
+        self.undo_stack.append(entry)
+        return Move(answer)
+
+    def unmake_move(self):
+        """Take back the last move made with `make_move()`."""
+        entry = self.undo_stack.pop()
+
+        for x_pos, y_pos, value in reversed(entry.squares):
+            self.__write_square(x_pos,y_pos,value)
+
+        # Removed options remember where they used to be, so the original order comes back as well.
+        if entry.added_options or entry.removed_options:
+            self.__own_capture_options()
+        for option in entry.added_options:
+            self.capture_options.discard(option)
+        for index, option in reversed(entry.removed_options):
+            self.capture_options.insert(index,option)
+
+        self.finished = entry.finished
+        self.winner = entry.winner
+        self.turn = entry.turn
+        self.zobrist = entry.zobrist
+
+    def copy(self):
+        """Return an independent copy of the board, without its undo history.  
+        The copy shares its rows and capture options with the original. Whichever board alters a row or its capture options first
+        makes its own copy of them, so a move only copies the rows it writes to."""
+        duplicate = copy.copy(self)
+        duplicate.__rows = list(self.__rows)
+        duplicate.undo_stack = []
+
+        self.__owned_rows = 0
+        duplicate.__owned_rows = 0
+        # A board loaded with from_bytes() might not have found its capture options yet; then each board finds its own.
+        if 'capture_options' in self.__dict__:
+            self.__owns_options = False
+            duplicate.__owns_options = False
+        return duplicate
+
+    def legal_moves(self,user):
+        """Yield every move `move()` would accept from the user, as `(x_pos,y_pos,x_dir,y_dir)` tuples.  
+        The board isn't altered. Captures come first; if the user has to capture, nothing else is yielded.  
+        After a `Move.success_same_turn`, ask again for the same user to find the next capture of the chain."""
+        if self.finished:
+            return
+
+        if self.capture_options.has_user(user):
+            for option in self.capture_options.for_user(user):
+                yield (option.x_pos,option.y_pos,option.x_dir,option.y_dir)
+            return
+
+        size = len(self)
+        for y_pos, row in enumerate(self.__rows):
+            for x_pos, piece in enumerate(row):
+                if piece == 0 or user * piece < 0:
+                    continue
+
+                # Regular steps can only go forward.
+                for x_dir in [-1,1]:
+                    if 0 <= x_pos + x_dir < size and 0 <= y_pos + piece < size:
+                        if self.__rows[y_pos+piece][x_pos+x_dir] == 0:
+                            yield (x_pos,y_pos,x_dir,piece)
+
+                # Without any capture to make, jumping over a friendly piece is allowed as well.
+                for x_dir, y_dir in [(2,2),(-2,2),(2,-2),(-2,-2)]:
+                    if 0 <= x_pos + x_dir < size and 0 <= y_pos + y_dir < size:
+                        if self.__rows[y_pos+y_dir][x_pos+x_dir] == 0 and self.__rows[y_pos+(y_dir//2)][x_pos+(x_dir//2)] != 0:
+                            yield (x_pos,y_pos,x_dir,y_dir)
+
+    def play(self,move,user):
+        """Make a move as yielded by `legal_moves()`."""
+        return self.move(move[0],move[1],move[2],move[3],user)
+
+    def __getattr__(self,name):
+        # A board loaded with from_bytes() only finds its capture options once they're asked for.
+        if name == 'capture_options':
+            self.capture_options = self.__find_capture_options()
+            self.__owns_options = True
+            return self.capture_options
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__,name))
+
+    def to_bytes(self):
+        """Return a snapshot of the position: a small header followed by one signed byte per square, row by row.  
+        The undo history isn't stored."""
+        header = struct.pack(BOARD_HEADER,BOARD_MAGIC,SNAPSHOT_VERSION,int(self.finished),self.winner or 0,self.turn,len(self),self.zobrist)
+        squares = array.array('b')
+        for row in self.__rows:
+            squares.fromlist(row)
+        return header + squares.tobytes()
+
+    @classmethod
+    def from_bytes(cls,data):
+        """Load a snapshot made by `to_bytes()`. Any bytes-like object works, like a `memoryview` of an mmap.  
+        The capture options are only worked out when they're first needed."""
+        view = memoryview(data)
+        magic, version, finished, winner, turn, size, zobrist = _unpack_header(BOARD_HEADER,BOARD_MAGIC,view,0)
+        offset = struct.calcsize(BOARD_HEADER)
+        squares = view[offset:offset+size*size]
+        if len(squares) < size * size:
+            raise ValueError("The snapshot has been cut off.")
+        return cls._restore(squares.cast('b'),0,size,finished,winner,turn,zobrist)
+
+    @classmethod
+    def _restore(cls,squares,offset,size,finished,winner,turn,zobrist):
+        """Build a board from a block of squares, starting at the given offset, without making the capture options."""
+        board = cls.__new__(cls)
+        board.__rows = [squares[offset+row*size:offset+(row+1)*size].tolist() for row in range(size)]
+        board.__owned_rows = (1 << size) - 1
+        board.__owns_options = True
+        board.finished = bool(finished)
+        board.winner = winner or None
+        board.turn = turn
+        board.undo_stack = []
+        board.__journal = None
+        board.__square_keys, board.__side_key = zobrist_keys(size)
+        board.zobrist = zobrist
+        board.__count_pieces()
+        return board
+
+    def square_hash(self):
+        """Return the Zobrist hash of the squares only, leaving out the side to move."""
+        if self.turn == -1:
+            return self.zobrist ^ self.__side_key
+        return self.zobrist
+
+    def piece_count(self,user):
+        """Return the amount of pieces the user has left on the board."""
+        if user == 1:
+            return self.__player1_pieces
+        return self.__player2_pieces
+
+    def piece_at(self,x_pos,y_pos):
+        """Return the piece on a tile: 1, -1, or 0 if it's empty."""
+        return self.__rows[y_pos][x_pos]
+
+    def occupied(self):
+        """Return a list of `(x_pos,y_pos,piece)` for every piece on the board, row by row."""
+        return [(x_pos,y_pos,piece) for y_pos, row in enumerate(self.__rows) if any(row)
+                for x_pos, piece in enumerate(row) if piece != 0]
+
+    def same_squares(self,other):
+        """Return whether both boards have the same pieces on the same squares."""
+        return self.__rows == other.__rows
+
+    def pass_turn(self,user):
+        """Put the user on turn without making a move, keeping `zobrist` up to date.  
+        A QBoard uses this on the playouts that refused a move the others made, so every playout agrees on whose turn it is."""
+        self.__pass_turn(user)
+
     def quantum_move(self,x_pos,y_pos,user):
         """This function tests if it is possible to make a quantum move for this function."""
-        test_board_left = copy.deepcopy(self)
-        test_board_right = copy.deepcopy(self)
-
         if not self.__on_the_board(x_pos,y_pos):
             return False
 
-        if test_board_left.move(x_pos,y_pos,-1,user,user) == Move.success_opponents_turn:
-            return test_board_right.move(x_pos,y_pos,1,user,user) == Move.success_opponents_turn
-        return False
+        # Both halves of the split need to be regular steps that hand over the turn to the opponent.
+        for x_dir in [-1,1]:
+            if self.__check_move(x_pos,y_pos,x_dir,user,user) is not None:
+                return False
+            if self.__finishes_step(x_pos+x_dir,y_pos+user,self.__rows[y_pos][x_pos]):
+                return False
+        return True
 
     def __move_single_tile(self,moving_piece,x_pos,y_pos,x_dir,y_dir,user):
         # * The piece makes a normal move.
         size = len(self)
-
-        if self.__walks_backwards(moving_piece, y_dir):
-            return Move.invalid_destination
         
         # * If everything else goes right, finally make the move to the location.
-        self.board[y_pos+y_dir][x_pos+x_dir] = moving_piece
-        self.board[y_pos][x_pos] = 0
+        self.__set_square(x_pos+x_dir,y_pos+y_dir,moving_piece)
+        self.__set_square(x_pos,y_pos,0)
 
         # * Refresh all CaptureOptions and add new potential ones.
-        self.capture_options = [forced_move for forced_move in self.capture_options if forced_move.still_valid(self.board)]
+        self.__refresh_capture_options()
 
         # Look for kills that appear now the user has left the space empty.
         for killer_coords in [(2,2),(2,-2),(-2,2),(-2,-2)]:
@@ -131,10 +336,7 @@ class Board:
             y_direct = killer_coords[1]
 
             if x_killer in range(size) and y_killer in range(size):
-                order = CaptureOption(self.board[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
-
-                if order.still_valid(self.board) and order not in self.capture_options:
-                    self.capture_options.append(order)
+                self.__consider_capture(x_killer,y_killer,x_direct,y_direct)
 
         # Look for kills that appear because the user stepped on the new tile.
         for killer_coords in [(1,1),(1,-1),(-1,1),(-1,-1)]:
@@ -144,10 +346,7 @@ class Board:
             y_direct = 2*killer_coords[1]
 
             if x_killer in range(size) and y_killer in range(size):
-                order = CaptureOption(self.board[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
-
-                if order.still_valid(self.board) and order not in self.capture_options:
-                    self.capture_options.append(order)
+                self.__consider_capture(x_killer,y_killer,x_direct,y_direct)
 
         # Last, look if the user could kill someone next turn.
         # When taking a small step, this isn't important, but taking this action separately is crucial
@@ -158,14 +357,12 @@ class Board:
             x_direct = killer_coords[0]
             y_direct = killer_coords[1]
 
-            order = CaptureOption(self.board[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
+            self.__consider_capture(x_killer,y_killer,x_direct,y_direct)
 
-            if order.still_valid(self.board) and order not in self.capture_options:
-                self.capture_options.append(order)
+        self.__pass_turn(-user)
 
         if self.__reached_end():
-            self.finished = True
-            self.winner = user
+            self.__finish(user)
             return Move.finish
 
         return Move.success_opponents_turn
@@ -173,24 +370,21 @@ class Board:
     def __move_double_tile(self,moving_piece,x_pos,y_pos,x_dir,y_dir,user):
         # * The piece attempts to capture another piece.
         size = len(self)
-
-        if self.board[y_pos+(y_dir//2)][x_pos+(x_dir//2)] == 0:
-            return Move.no_victim_found
         
         try:
-            self.capture_options.remove(CaptureOption(moving_piece,x_pos,y_pos,x_dir,y_dir))
+            self.__remove_capture_option(CaptureOption(moving_piece,x_pos,y_pos,x_dir,y_dir))
         except ValueError:
             # This move should've been present as a CaptureOption.
             # However, if it wasn't, it doesn't need to stop the whole program,
             # a warning should suffice.
             print("WARNING: Failed attempt to remove a CaptureOption that wasn\'t present.")
 
-        self.board[y_pos][x_pos] = 0
-        self.board[y_pos+(y_dir//2)][x_pos+(x_dir//2)] = 0
-        self.board[y_pos+y_dir][x_pos+x_dir] = moving_piece
+        self.__set_square(x_pos,y_pos,0)
+        self.__set_square(x_pos+(x_dir//2),y_pos+(y_dir//2),0)
+        self.__set_square(x_pos+x_dir,y_pos+y_dir,moving_piece)
 
         # * Refresh all CaptureOptions and add new potential ones.
-        self.capture_options = [forced_move for forced_move in self.capture_options if forced_move.still_valid(self.board)]
+        self.__refresh_capture_options()
 
         # Look for kills that appear now the user has left their own space empty.
         for killer_coords in [(2,2),(2,-2),(-2,2),(-2,-2)]:
@@ -200,10 +394,7 @@ class Board:
             y_direct = killer_coords[1]
 
             if x_killer in range(size) and y_killer in range(size):
-                order = CaptureOption(self.board[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
-
-                if order.still_valid(self.board) and order not in self.capture_options:
-                    self.capture_options.append(order)
+                self.__consider_capture(x_killer,y_killer,x_direct,y_direct)
 
         # Look for kills that appear now the user has left the victim's space empty.
         for killer_coords in [(2,2),(2,-2),(-2,2),(-2,-2)]:
@@ -213,10 +404,7 @@ class Board:
             y_direct = killer_coords[1]
 
             if x_killer in range(size) and y_killer in range(size):
-                order = CaptureOption(self.board[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
-
-                if order.still_valid(self.board) and order not in self.capture_options:
-                    self.capture_options.append(order)
+                self.__consider_capture(x_killer,y_killer,x_direct,y_direct)
 
         # Look for kills that appear because the user stepped on the new tile.
         for killer_coords in [(1,1),(1,-1),(-1,1),(-1,-1)]:
@@ -226,10 +414,7 @@ class Board:
             y_direct = 2*killer_coords[1]
 
             if x_killer in range(size) and y_killer in range(size):
-                order = CaptureOption(self.board[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
-
-                if order.still_valid(self.board) and order not in self.capture_options:
-                    self.capture_options.append(order)
+                self.__consider_capture(x_killer,y_killer,x_direct,y_direct)
 
         # Last, look if the user could kill someone next turn.
         # When taking a small step, this isn't important, but taking this action separately is crucial
@@ -241,42 +426,185 @@ class Board:
             x_direct = killer_coords[0]
             y_direct = killer_coords[1]
 
-            order = CaptureOption(self.board[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
-
-            if order.still_valid(self.board) and order not in self.capture_options:
-                self.capture_options.append(order)
+            if self.__consider_capture(x_killer,y_killer,x_direct,y_direct):
                 another_capture_found = True
 
+        if another_capture_found and not self.__victory_found():
+            self.__pass_turn(user)
+        else:
+            self.__pass_turn(-user)
+
         if self.__victory_found():
-            self.finished = True
-            self.winner = user
+            self.__finish(user)
             return Move.finish
 
         if another_capture_found:
             return Move.success_same_turn
         return Move.success_opponents_turn
 
-    def __victory_found(self):
-        if 1 in self.board[-1] or -1 in self.board[0]:
-            return True
-        
-        player1_found = False
-        player2_found = False
-        
-        for row in self.board:
-            if 1 in row:
-                player1_found = True
-                if player2_found:
-                    return False
-            if -1 in row:
-                player2_found = True
-                if player1_found:
-                    return False
+    def __check_move(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Return the reason why a move can't be made, or None if `move()` would accept it."""
+
+        if self.finished == True:
+            return Move.finish
+
+        if not self.__on_the_board(x_pos+x_dir, y_pos+y_dir):
+            return Move.out_of_bounds
+
+        moving_piece = self.__rows[y_pos][x_pos]
+
+        if moving_piece == 0 or user * moving_piece < 0:
+            return Move.no_piece_found
+
+        if not self.__valid_direction(x_dir,y_dir):
+            return Move.invalid_destination
+
+        if self.__rows[y_pos+y_dir][x_pos+x_dir] != 0:
+            return Move.path_blocked
         
+        # The user has to capture if possible.
+        if self.capture_options.has_user(moving_piece):
+            if not self.__is_capture_move(moving_piece,x_pos,y_pos,x_dir,y_dir):
+                return Move.capture_ignored
+
+        if abs(x_dir) == 1 and self.__walks_backwards(moving_piece, y_dir):
+            return Move.invalid_destination
+
+        if abs(x_dir) == 2 and self.__rows[y_pos+(y_dir//2)][x_pos+(x_dir//2)] == 0:
+            return Move.no_victim_found
+
+        return None
+
+    def __set_square(self,x_pos,y_pos,value):
+        previous_value = self.__rows[y_pos][x_pos]
+        if self.__journal is not None:
+            self.__journal.squares.append((x_pos,y_pos,previous_value))
+        self.__write_square(x_pos,y_pos,value)
+
+        # Coordinates just off the board wrap around, like the list index does.
+        size = len(self)
+        square = (y_pos % size) * size + (x_pos % size)
+        if previous_value != 0:
+            self.zobrist ^= self.__square_keys[previous_value][square]
+        if value != 0:
+            self.zobrist ^= self.__square_keys[value][square]
+
+    def __write_square(self,x_pos,y_pos,value):
+        """Put a value on a square and keep the piece counters up to date, without touching the hash or the undo history."""
+        row = self.__own_row(y_pos)
+        previous_value = row[x_pos]
+        row[x_pos] = value
+        if previous_value != 0:
+            self.__count_piece(previous_value,y_pos,-1)
+        if value != 0:
+            self.__count_piece(value,y_pos,1)
+
+    def __count_piece(self,piece,y_pos,change):
+        """Add a piece that appears on a row to the counters, or take it off with a change of -1."""
+        if piece == 1:
+            self.__player1_pieces += change
+            if y_pos % len(self.__rows) == len(self.__rows) - 1:
+                self.__player1_at_end += change
+        else:
+            self.__player2_pieces += change
+            if y_pos % len(self.__rows) == 0:
+                self.__player2_at_end += change
+
+    def __count_pieces(self):
+        """Count the pieces of both players from scratch, and how many of them have reached the other end of the board."""
+        self.__player1_pieces = sum(row.count(1) for row in self.__rows)
+        self.__player2_pieces = sum(row.count(-1) for row in self.__rows)
+        # A board of size 0 has no rows at all.
+        self.__player1_at_end = self.__rows[-1].count(1) if self.__rows else 0
+        self.__player2_at_end = self.__rows[0].count(-1) if self.__rows else 0
+
+    def __own_row(self,y_pos):
+        """Return a row that can be written to, copying it first if it's shared with another board."""
+        bit = 1 << (y_pos % len(self.__rows))
+        if not self.__owned_rows & bit:
+            self.__rows[y_pos] = list(self.__rows[y_pos])
+            self.__owned_rows |= bit
+        return self.__rows[y_pos]
+
+    def __own_capture_options(self):
+        if not self.__owns_options:
+            self.capture_options = self.capture_options.copy()
+            self.__owns_options = True
+
+    def __pass_turn(self,user):
+        if user != self.turn:
+            self.zobrist ^= self.__side_key
+            self.turn = user
+
+    def __consider_capture(self,x_killer,y_killer,x_direct,y_direct):
+        """Add the capture as a CaptureOption if it is possible and not known yet. Returns whether it was added."""
+        key = (self.__rows[y_killer][x_killer],x_killer,y_killer,x_direct,y_direct)
+        if key in self.capture_options:
+            return False
+
+        order = CaptureOption(*key)
+        if not order.still_valid(self.__rows):
+            return False
+
+        self.__own_capture_options()
+        self.capture_options.add(order)
+        if self.__journal is not None:
+            self.__journal.added_options.append(order)
         return True
 
+    def __remove_capture_option(self,order):
+        self.__own_capture_options()
+        index = self.capture_options.remove(order)
+        if self.__journal is not None:
+            self.__journal.removed_options.append((index,order))
+
+    def __refresh_capture_options(self):
+        """Drop every CaptureOption that is no longer valid."""
+        kept = 0
+        for forced_move in list(self.capture_options):
+            if forced_move.still_valid(self.__rows):
+                kept += 1
+                continue
+
+            self.__own_capture_options()
+            self.capture_options.discard(forced_move)
+            if self.__journal is not None:
+                # Store the position the option would have if it were put back right now.
+                self.__journal.removed_options.append((kept,forced_move))
+
+    def __find_capture_options(self):
+        """Look for every capture on the board from scratch."""
+        options = CaptureIndex()
+        for y_pos, row in enumerate(self.__rows):
+            for x_pos, piece in enumerate(row):
+                if piece == 0:
+                    continue
+                for x_dir, y_dir in [(2,2),(2,-2),(-2,2),(-2,-2)]:
+                    option = CaptureOption(piece,x_pos,y_pos,x_dir,y_dir)
+                    if option.still_valid(self.__rows):
+                        options.add(option)
+        return options
+
+    def __finish(self,user):
+        self.finished = True
+        self.winner = user
+
+    def __finishes_step(self,x_pos,y_pos,moving_piece):
+        """Return whether a regular step of the piece onto the given tile would end the game."""
+        if self.__reached_end():
+            return True
+        if moving_piece == 1:
+            return y_pos == len(self) - 1
+        return y_pos == 0
+
+    def __victory_found(self):
+        # The counters are kept up to date with every square that changes, so no row needs to be looked at.
+        if self.__reached_end():
+            return True
+        return self.__player1_pieces == 0 or self.__player2_pieces == 0
+
     def __reached_end(self):
-        return 1 in self.board[-1] or -1 in self.board[0]
+        return self.__player1_at_end > 0 or self.__player2_at_end > 0
 
     def __on_the_board(self,x,y):
         if x in range(len(self)) and y in range(len(self)):
@@ -293,23 +621,106 @@ class Board:
         return True
     
     def __is_capture_move(self,user,x_pos,y_pos,x_dir,y_dir):
-        return CaptureOption(user,x_pos,y_pos,x_dir,y_dir) in self.capture_options
+        return (user,x_pos,y_pos,x_dir,y_dir) in self.capture_options
 
     def __walks_backwards(self,user,direction):
         return user * direction < 0
 
-class CaptureOption:
-    def __init__(self,user,x_pos,y_pos,x_dir,y_dir):
+# Zobrist keys are drawn from a fixed seed, so every process agrees on the hash of a position.
+ZOBRIST_SEED = 0x51C4EC
+_zobrist_tables = {}
+
+def zobrist_keys(size):
+    """Return the Zobrist keys for a board of the given size.  
+    The first value maps each player to a 64-bit key per square (`y_pos*size+x_pos`), the second is the key of player -1 being on turn."""
+    if size not in _zobrist_tables:
+        generator = random.Random(ZOBRIST_SEED * 1000 + size)
+        square_keys = {player: [generator.getrandbits(64) for square in range(size*size)] for player in [1,-1]}
+        _zobrist_tables[size] = (square_keys, generator.getrandbits(64))
+    return _zobrist_tables[size]
+
+def _mix_hash(value):
+    """Scramble a 64-bit hash, so that adding up the hashes of several boards doesn't cancel out the Zobrist keys."""
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+# Snapshots start with a header; the squares follow as signed bytes.
+SNAPSHOT_VERSION = 1
+BOARD_MAGIC = b'QCBD'
+QBOARD_MAGIC = b'QCQB'
+# Magic, version, finished, winner, turn, size and hash.
+BOARD_HEADER = '<4sBBbbHQ'
+# Magic, version, size and the amount of playouts, padded so the multiplicities that follow are aligned.
+QBOARD_HEADER = '<4sBxHQ'
+
+def _pack_words(values):
+    """Pack numbers as little-endian 64-bit words."""
+    words = array.array('Q',values)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tobytes()
+
+def _unpack_words(view,offset,count):
+    words = array.array('Q')
+    words.frombytes(view[offset:offset+8*count])
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tolist()
+
+def _unpack_header(layout,magic,view,offset):
+    if len(view) < offset + struct.calcsize(layout):
+        raise ValueError("The snapshot has been cut off.")
+    header = struct.unpack_from(layout,view,offset)
+    if header[0] != magic:
+        raise ValueError("The data isn't a snapshot of the right kind.")
+    if header[1] != SNAPSHOT_VERSION:
+        raise ValueError("Snapshots of version {} can't be read.".format(header[1]))
+    return header
+
+def make_rng(rng):
+    """Return the random generator for measurements: a new `random.Random` for a seed, or the generator as it is.  
+    None stands for the `random` module itself; it isn't stored, so the board can still be pickled."""
+    if isinstance(rng,int):
+        return random.Random(rng)
+    return rng
+
+class Measurement(namedtuple('Measurement',['x_pos','y_pos','outcome'])):
+    """A measurement of a tile on a quantum board, and the piece that was found there: 1, -1 or 0 for an empty tile."""
+    __slots__ = ()
+
+    def outcome_at(self,x_pos,y_pos):
+        """Return the outcome, after checking that the measurement was made on the given tile."""
+        if (self.x_pos,self.y_pos) != (x_pos,y_pos):
+            raise ValueError("The recorded measurement of ({},{}) doesn't match the measurement of ({},{}).".format(self.x_pos,self.y_pos,x_pos,y_pos))
+        return self.outcome
+
+class MeasurementRequired(Exception):
+    """Raised by a quantum board that replays its measurements strictly, when it has to measure a tile beyond the recorded ones.  
+    `outcomes` holds every piece the measurement could find on the tile."""
+    def __init__(self,x_pos,y_pos,outcomes):
+        super().__init__("The tile ({},{}) has to be measured, but no measurement was recorded for it.".format(x_pos,y_pos))
         self.x_pos = x_pos
         self.y_pos = y_pos
-        self.x_dir = x_dir
-        self.y_dir = y_dir
-        self.user = user
-    
-    def __eq__(self,other):
-        if self.user == other.user:
-            return self.x_pos == other.x_pos and self.y_pos == other.y_pos and self.x_dir == other.x_dir and self.y_dir == other.y_dir
-        return False
+        self.outcomes = outcomes
+
+class UndoEntry:
+    """Everything `Board.unmake_move()` needs to take back a single move."""
+    __slots__ = ['squares','removed_options','added_options','finished','winner','turn','zobrist']
+
+    def __init__(self,finished,winner,turn,zobrist):
+        self.squares = []
+        self.removed_options = []
+        self.added_options = []
+        self.finished = finished
+        self.winner = winner
+        self.turn = turn
+        self.zobrist = zobrist
+
+class CaptureOption(namedtuple('CaptureOption',['user','x_pos','y_pos','x_dir','y_dir'])):
+    """A capture the given user can make. The object can't be altered, so it can be hashed and shared between boards.  
+    It compares equal to a plain `(user,x_pos,y_pos,x_dir,y_dir)` tuple, which allows looking it up without creating one."""
+    __slots__ = ()
 
     def __repr__(self):
         return "<({},{}) -> ({},{})>".format(self.x_pos,self.y_pos,self.x_pos+self.x_dir,self.y_pos+self.y_dir)
@@ -317,30 +728,158 @@ class CaptureOption:
     def still_valid(self,board) -> bool:
         """"Make sure a capture force is still valid.  
         If the kill is still valid, it returns True. Otherwise, it returns False."""
+        size = len(board)
+        x_pos, y_pos, x_dir, y_dir = self.x_pos, self.y_pos, self.x_dir, self.y_dir
 
         # Return False if any of the pieces are outside the board.
-        if self.y_pos not in range(len(board)) or self.x_pos not in range(len(board)):
+        if not (0 <= y_pos < size and 0 <= x_pos < size):
             return False
-        if self.y_pos + self.y_dir not in range(len(board)) or self.x_pos + self.x_dir not in range(len(board)):
+        if not (0 <= y_pos + y_dir < size and 0 <= x_pos + x_dir < size):
             return False
         # Return False if the spot behind the victim_piece is no longer empty.
-        if board[self.y_pos+self.y_dir][self.x_pos+self.x_dir] != 0:
+        if board[y_pos+y_dir][x_pos+x_dir] != 0:
             return False
 
-        killer_piece = board[self.y_pos][self.x_pos]
-        victim_piece = board[self.y_pos+(self.y_dir//2)][self.x_pos+(self.x_dir//2)]
+        killer_piece = board[y_pos][x_pos]
+        victim_piece = board[y_pos+(y_dir//2)][x_pos+(x_dir//2)]
 
         # Return False if the pieces are the same type or if either piece has disappeared from the spot.
-        if killer_piece == victim_piece or 0 in [killer_piece,victim_piece]:
+        if killer_piece == victim_piece or killer_piece == 0 or victim_piece == 0:
             return False
         return True
 
+class CaptureIndex:
+    """An ordered collection of CaptureOption objects that can be searched by player and by tile.  
+    Every option has a reference count, so a QBoard can track how many of its playouts allow a capture.  
+    The index compares equal to a list holding the same options in the same order."""
+    __slots__ = ['__options','__by_user','__by_origin']
+
+    def __init__(self,options=()):
+        self.__options = {}
+        self.__by_user = {}
+        self.__by_origin = {}
+        for option in options:
+            self.add(option)
+
+    def __repr__(self):
+        return repr(list(self.__options))
+
+    def __len__(self):
+        return len(self.__options)
+
+    def __iter__(self):
+        return iter(self.__options)
+
+    def __contains__(self,option):
+        return option in self.__options
+
+    def __eq__(self,other):
+        if isinstance(other,(CaptureIndex,list)):
+            return list(self.__options) == list(other)
+        return NotImplemented
+
+    def copy(self):
+        duplicate = CaptureIndex()
+        duplicate.__options = dict(self.__options)
+        duplicate.__by_user = {user: dict(options) for user, options in self.__by_user.items()}
+        duplicate.__by_origin = {tile: dict(options) for tile, options in self.__by_origin.items()}
+        return duplicate
+
+    def add(self,option,references=1):
+        """Add references to an option. Returns True if the option wasn't in the index yet."""
+        if option in self.__options:
+            self.__options[option] += references
+            return False
+
+        self.__options[option] = references
+        self.__by_user.setdefault(option.user,{})[option] = None
+        self.__by_origin.setdefault((option.x_pos,option.y_pos),{})[option] = None
+        return True
+
+    def discard(self,option,references=None):
+        """Remove references to an option, or the whole option if no amount is given."""
+        if option not in self.__options:
+            return
+        if references is not None and self.__options[option] > references:
+            self.__options[option] -= references
+            return
+
+        # Plain tuples are allowed here as well, so the fields are looked up by position.
+        del self.__options[option]
+        self.__unlink(self.__by_user,option[0],option)
+        self.__unlink(self.__by_origin,(option[1],option[2]),option)
+
+    def remove(self,option):
+        """Remove an option like `list.remove()` would, raising a ValueError if it isn't there. Returns its former position."""
+        if option not in self.__options:
+            raise ValueError("CaptureIndex.remove(x): x not in index")
+        index = list(self.__options).index(option)
+        self.discard(option)
+        return index
+
+    def insert(self,index,option,references=1):
+        """Put an option back at a given position."""
+        options = list(self.__options.items())
+        options.insert(index,(option,references))
+        self.__options = {}
+        self.__by_user = {}
+        self.__by_origin = {}
+        for option, references in options:
+            self.add(option,references)
+
+    def references(self,option):
+        return self.__options.get(option,0)
+
+    def scale(self,factor):
+        """Multiply the reference count of every option."""
+        for option in self.__options:
+            self.__options[option] *= factor
+
+    def has_user(self,user):
+        """Return whether the user can make any capture."""
+        return len(self.__by_user.get(user,())) > 0
+
+    def for_user(self,user):
+        """Return all captures of the given user."""
+        return list(self.__by_user.get(user,()))
+
+    def from_origin(self,x_pos,y_pos):
+        """Return all captures that can be made by the piece on the given tile."""
+        return list(self.__by_origin.get((x_pos,y_pos),()))
+
+    def __unlink(self,table,key,option):
+        del table[key][option]
+        if len(table[key]) == 0:
+            del table[key]
+
 class QBoard:
-    def __init__(self,size=10,population=3):
-        self.board_list = [Board(size,population)]
-        self.quantum_board = self.update_quantum_board()
-        self.capture_options = []
+    def __init__(self,size=10,population=3,rng=None,max_branches=None,over_budget='measure',pool=None,board_class=Board):
+        """Create a new board to play a game of quantum checkers on!  
+        Keyword arguments:  
+        size -> the size of the board  
+        population -> the amount of rows each player has populated with pieces  
+        rng -> the random generator used for measurements: a `random.Random` instance, a seed, or None for the `random` module  
+        max_branches -> the most positions the board may store after a move, or None for no limit  
+        over_budget -> what a split that goes over the limit does: 'measure' the board until it fits, or 'refuse' the split  
+        pool -> a `parallel.BranchPool` to make the moves of large superpositions in, or None to make them one playout at a time  
+        board_class -> the class of the playouts, like `sparse.SparseBoard` for very large boards"""
+        if pool is not None and board_class is not Board:
+            raise ValueError("Only playouts on a Board can be moved in a BranchPool.")
+
+        # Every position is only stored once. The multiplicity says how many playouts ended up in it.
+        self.board_list = [board_class(size,population)]
+        self.multiplicity = [1]
+        self.update_quantum_board()
         self.finished = False
+
+        # Every measurement that has been made, in order, so the game can be replayed exactly.
+        self.rng = make_rng(rng)
+        self.measurements = []
+        self.__replay = []
+        self.__strict_replay = False
+
+        self.pool = pool
+        self.set_budget(max_branches,over_budget)
     
     def __repr__(self):
         """Display the board to the terminal, if wished."""
@@ -358,10 +897,23 @@ class QBoard:
     def __len__(self):
         return len(self.board_list[0])
 
+    @property
+    def quantum_board(self):
+        """The chance of finding a piece on every tile, from -100 to 100. Only recalculated when asked for after a change."""
+        if self.__quantum_board is None:
+            total_weight = self.branch_count()
+            size = len(self)
+            self.__quantum_board = [[0 for column in range(size)] for row in range(size)]
+            for x_pos, y_pos in set(self.__tile_weights[1]) | set(self.__tile_weights[-1]):
+                player1 = self.__tile_weights[1].get((x_pos,y_pos),0)
+                player2 = self.__tile_weights[-1].get((x_pos,y_pos),0)
+                self.__quantum_board[y_pos][x_pos] = (100*(player1-player2)) // total_weight
+        return self.__quantum_board
+
     def quantum_split(self,x_pos,y_pos,user):
         if self.finished == True:
             return [Move.finish for i in range(len(self.board_list))]
-        if self.capture_options != []:
+        if len(self.capture_options) > 0:
             return [Move.capture_ignored for i in range(len(self.board_list))]
 
         quantum_ready = False
@@ -371,30 +923,52 @@ class QBoard:
                 quantum_ready = True
                 break
 
+        if quantum_ready and self.over_budget == 'refuse' and self.__exceeds_budget():
+            self.refused_splits += 1
+            return [Move.branch_limit]
+
         if quantum_ready:
-            left_move = copy.deepcopy(self.board_list)
-            right_move = copy.deepcopy(self.board_list)
+            # The current boards take the left step and can be rolled back, so only the right side needs copying.
+            left_move = self.board_list
+            right_move = [board.copy() for board in self.board_list]
             evaluation_table = []
 
-            for board in left_move:
-                response = board.move(x_pos,y_pos,-1,user,user)
-                evaluation_table.append(response)
-            
-            for board in right_move:
-                response = board.move(x_pos,y_pos,1,user,user)
-                evaluation_table.append(response)
+            if self.__use_pool():
+                # Both steps are worked out from the same playouts in the pool, and then taken over by either side.
+                outcomes = self.pool.apply(self.board_list,[(x_pos,y_pos,-1,user,user),(x_pos,y_pos,1,user,user)])
+                for board, outcome in zip(left_move + right_move,outcomes[0] + outcomes[1]):
+                    evaluation_table.append(board._apply_outcome(outcome))
+            else:
+                for board in left_move:
+                    response = board.make_move(x_pos,y_pos,-1,user,user)
+                    evaluation_table.append(response)
+                
+                for board in right_move:
+                    response = board.make_move(x_pos,y_pos,1,user,user)
+                    evaluation_table.append(response)
             
             if Move.success_opponents_turn in evaluation_table:
-                self.board_list = left_move
-                self.board_list.extend(right_move)
+                # Every playout now exists twice, after which only the tiles both steps touched need correcting.
+                self.__double_counters()
+                touched_tiles = set()
+                for board, weight in zip(left_move + right_move,self.multiplicity + self.multiplicity):
+                    self.__apply_changes(board,weight,board.undo_stack.pop(),touched_tiles)
+
+                self.board_list = left_move + right_move
+                self.multiplicity = self.multiplicity + self.multiplicity
+                self.__pass_turns(self.board_list,evaluation_table,user)
                 
                 self.remove_potential_collision(x_pos-1,y_pos+user)
                 self.remove_potential_collision(x_pos+1,y_pos+user)
-                self.update_quantum_board()
+                self.__merge_duplicates()
+                self.__enforce_budget()
+                self.__refresh(touched_tiles)
 
                 return [Move.success_opponents_turn]
+
+            for board in left_move:
+                board.unmake_move()
     
-            self.update_quantum_board()
             return evaluation_table
 
         return [Move.quantum_not_ready]
@@ -402,41 +976,129 @@ class QBoard:
     def move(self,x_pos,y_pos,x_dir,y_dir,user):
         if x_pos + x_dir not in range(len(self)) or y_pos + y_dir not in range(len(self)):
             return [Move.out_of_bounds for i in range(len(self.board_list))]
-        if not self.__is_capture_move(user,x_pos,y_pos,x_dir,y_dir) and self.capture_options != []:
+        if len(self.capture_options) > 0 and not self.__is_capture_move(user,x_pos,y_pos,x_dir,y_dir):
             return [Move.capture_ignored for i in range(len(self.board_list))]
 
-        response = [board.move(x_pos,y_pos,x_dir,y_dir,user) for board in self.board_list]
+        outcomes = None
+        if self.__use_pool():
+            outcomes = self.pool.apply(self.board_list,[(x_pos,y_pos,x_dir,y_dir,user)])[0]
+
+        response = []
+        touched_tiles = set()
+        for index, (board, weight) in enumerate(zip(self.board_list,self.multiplicity)):
+            if outcomes is None:
+                response.append(board.make_move(x_pos,y_pos,x_dir,y_dir,user))
+            else:
+                response.append(board._apply_outcome(outcomes[index]))
+            self.__apply_changes(board,weight,board.undo_stack.pop(),touched_tiles)
 
+        self.__pass_turns(self.board_list,response,user)
         self.remove_potential_collision(x_pos+x_dir,y_pos+y_dir)
-        self.update_quantum_board()
+        self.__merge_duplicates()
+        self.__refresh(touched_tiles)
 
         return response
     
     def update_quantum_board(self):
-        size = len(self.board_list[0])
-        quantum_table = [[0 for row in range(size)] for column in range(size)]
-        
-        for board_instance in self.board_list:
-            for row in range(size):
-                for column in range(size):
-                    quantum_value = quantum_table[row][column]
-                    extra_value = board_instance.board[row][column]
-
-                    # Remove any potential collisions. This should not happen.
-                    if quantum_value * extra_value < 0:
-                        raise ValueError("Caught unnoticed piece collision!")
-                    
-                    quantum_table[row][column] += 100*extra_value
-        
-        self.quantum_board = quantum_table
-        for row in range(size):
-            for column in range(size):
-                self.quantum_board[row][column] = self.quantum_board[row][column] // len(self.board_list)
-        
-        self.__update_finished_condition()
-        self.__load_capture_options()
+        """Recalculate the quantum board and capture options from scratch.  
+        The functions of the object keep them up to date themselves, so this is only needed after altering the playouts manually."""
+        # Per player, the weight of all playouts that have one of their pieces on a tile. Tiles without any weight are left out.
+        self.__tile_weights = {1: {}, -1: {}}
+        # Every capture option counts how many of the stored positions allow it.
+        self.capture_options = CaptureIndex()
+        # The amount of stored positions that haven't finished yet.
+        self.__unfinished = 0
+        for board_instance, weight in zip(self.board_list,self.multiplicity):
+            self.__count_board(board_instance,weight,1)
+
+        # Only a tile with weight for player 1 can hold a collision.
+        self.__refresh(list(self.__tile_weights[1]))
         return self.quantum_board
 
+    def set_budget(self,max_branches=None,over_budget='measure'):
+        """Limit the amount of positions the board stores, which bounds its memory and the time a move takes.  
+        A split doubles the positions. With 'measure', the tile that is the least certain to hold a piece is measured after
+        the split until the positions fit again, just like a collision is measured. With 'refuse', a split that could go over
+        the limit is refused with `Move.branch_limit`. Either way, the board never stores more than `max_branches` positions
+        after a move, and at most twice as many while a split is made. The counters of `usage()` start over."""
+        if max_branches is not None and max_branches < 1:
+            raise ValueError("The board needs room for at least one position.")
+        if over_budget not in ['measure','refuse']:
+            raise ValueError("A board over its budget can either 'measure' or 'refuse', not '{}'.".format(over_budget))
+        self.max_branches = max_branches
+        self.over_budget = over_budget
+
+        self.peak_branches = len(self.board_list)
+        self.forced_measurements = 0
+        self.refused_splits = 0
+        self.__enforce_budget()
+        self.__refresh([])
+
+    def usage(self):
+        """Return the counters of the budget: the positions stored now and at most, and how often the budget had to step in."""
+        return {
+            'branches': len(self.board_list),
+            'peak_branches': self.peak_branches,
+            'max_branches': self.max_branches,
+            'forced_measurements': self.forced_measurements,
+            'refused_splits': self.refused_splits,
+        }
+
+    def copy(self):
+        """Return an independent copy of the quantum board. This is a lot quicker than `copy.deepcopy()`."""
+        duplicate = copy.copy(self)
+        duplicate.board_list = [board.copy() for board in self.board_list]
+        duplicate.multiplicity = list(self.multiplicity)
+        duplicate.__tile_weights = {player: dict(weights) for player, weights in self.__tile_weights.items()}
+        duplicate.capture_options = self.capture_options.copy()
+        duplicate.measurements = list(self.measurements)
+        duplicate.__replay = list(self.__replay)
+        return duplicate
+
+    def legal_moves(self,user):
+        """Yield every move that succeeds in at least one playout. Nothing is altered.  
+        Regular moves are `(x_pos,y_pos,x_dir,y_dir)` tuples and quantum moves are `('Q',x_pos,y_pos)` tuples,
+        just like the input `QCheckers` asks for. Captures come first."""
+        if len(self.capture_options) > 0:
+            # Any capture option on the board blocks every other move, even one of the opponent.
+            # Only captures that can still be made in a playout that hasn't finished yet count.
+            found = set()
+            for board in self.board_list:
+                if board.finished:
+                    continue
+                for option in board.capture_options.for_user(user):
+                    move = (option.x_pos,option.y_pos,option.x_dir,option.y_dir)
+                    if move not in found:
+                        found.add(move)
+                        yield move
+            return
+
+        found = set()
+        for board in self.board_list:
+            for move in board.legal_moves(user):
+                if move not in found:
+                    found.add(move)
+                    yield move
+
+        if self.finished:
+            return
+        if self.over_budget == 'refuse' and self.__exceeds_budget():
+            return
+
+        candidates = set()
+        for board in self.board_list:
+            for x_pos, y_pos, piece in board.occupied():
+                if user * piece > 0 and (x_pos,y_pos) not in candidates:
+                    candidates.add((x_pos,y_pos))
+                    if any(branch.quantum_move(x_pos,y_pos,user) for branch in self.board_list):
+                        yield ('Q',x_pos,y_pos)
+
+    def play(self,move,user):
+        """Make a move as yielded by `legal_moves()`."""
+        if move[0] == 'Q':
+            return self.quantum_split(move[1],move[2],user)
+        return self.move(move[0],move[1],move[2],move[3],user)
+
     def remove_potential_collision(self,x_pos,y_pos):
         player1_found = False
         player2_found = False
@@ -445,38 +1107,290 @@ class QBoard:
             return
 
         for board in self.board_list:
-            if board.board[y_pos][x_pos] == 1:
+            piece = board.piece_at(x_pos,y_pos)
+            if piece == 1:
                 if player2_found:
                     self.__remove_collision(x_pos,y_pos)
                     return
                 player1_found = True
 
-            if board.board[y_pos][x_pos] == -1:
+            if piece == -1:
                 if player1_found:
                     self.__remove_collision(x_pos,y_pos)
                     return
                 player2_found = True
 
+    def to_bytes(self):
+        """Return a snapshot of all playouts. After a header come the multiplicities, the hashes and the tile weights as
+        64-bit numbers, then the state of every playout, and last the squares of all playouts in one block, with one signed byte per square.  
+        The random generator and the measurements made so far aren't stored."""
+        multiplicity = self.multiplicity
+        size = len(self)
+        tile_weights = [0] * (2*size*size)
+        for start, player in [(0,1),(size*size,-1)]:
+            for (x_pos, y_pos), weight in self.__tile_weights[player].items():
+                tile_weights[start + y_pos*size + x_pos] = weight
+        if max(multiplicity) >= 2**64 or max(tile_weights) >= 2**64:
+            # Only the ratio between the playouts matters.
+            divisor = 0
+            for weight in multiplicity:
+                divisor = math.gcd(divisor,weight)
+            multiplicity = [weight // divisor for weight in multiplicity]
+            tile_weights = [weight // divisor for weight in tile_weights]
+            if max(tile_weights) >= 2**64:
+                raise OverflowError("The multiplicities are too large to store.")
+
+        states = array.array('b')
+        for board in self.board_list:
+            states.extend([int(board.finished),board.winner or 0,board.turn])
+
+        squares = array.array('b')
+        for board in self.board_list:
+            for row in board.board:
+                squares.fromlist(row)
+        header = struct.pack(QBOARD_HEADER,QBOARD_MAGIC,SNAPSHOT_VERSION,len(self),len(self.board_list))
+        return b''.join([header,_pack_words(multiplicity),_pack_words([board.zobrist for board in self.board_list]),
+                         _pack_words(tile_weights),states.tobytes(),squares.tobytes()])
+
+    @classmethod
+    def from_bytes(cls,data,rng=None,max_branches=None,over_budget='measure',board_class=Board):
+        """Load a snapshot made by `to_bytes()`. Any bytes-like object works, like a `memoryview` of an mmap.  
+        The squares are read straight from the given data. The capture options are only worked out when they're first needed.  
+        The budget isn't stored in the snapshot; see `set_budget()` for the next two arguments. The playouts are loaded as `board_class`."""
+        view = memoryview(data)
+        magic, version, size, count = _unpack_header(QBOARD_HEADER,QBOARD_MAGIC,view,0)
+        offset = struct.calcsize(QBOARD_HEADER)
+        if len(view) < offset + 16*count + 16*size*size + 3*count + count*size*size:
+            raise ValueError("The snapshot has been cut off.")
+
+        quantum = cls.__new__(cls)
+        quantum.multiplicity = _unpack_words(view,offset,count)
+        offset += 8 * count
+        zobrists = _unpack_words(view,offset,count)
+        offset += 8 * count
+        tile_weights = _unpack_words(view,offset,2*size*size)
+        offset += 16 * size * size
+        states = view[offset:offset+3*count].cast('b')
+        offset += 3 * count
+        squares = view[offset:offset+count*size*size].cast('b')
+
+        quantum.board_list = [board_class._restore(squares,index*size*size,size,states[3*index],states[3*index+1],states[3*index+2],zobrists[index])
+                              for index in range(count)]
+        quantum.__tile_weights = {player: {(square % size,square // size): weight
+                                           for square, weight in enumerate(tile_weights[start:start+size*size]) if weight != 0}
+                                  for player, start in [(1,0),(-1,size*size)]}
+        quantum.rng = make_rng(rng)
+        quantum.measurements = []
+        quantum.__replay = []
+        quantum.__strict_replay = False
+        quantum.pool = None
+        quantum.__unfinished = sum(1 for board in quantum.board_list if not board.finished)
+        quantum.__refresh(list(quantum.__tile_weights[1]))
+        quantum.set_budget(max_branches,over_budget)
+        return quantum
+
+    def __getattr__(self,name):
+        # A board loaded with from_bytes() only adds up the capture options of its playouts once they're asked for.
+        if name == 'capture_options':
+            self.capture_options = CaptureIndex()
+            for board in self.board_list:
+                for option in board.capture_options:
+                    self.capture_options.add(option)
+            return self.capture_options
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__,name))
+
+    def replay_measurements(self,measurements,strict=False):
+        """Make the next measurements come out as recorded, instead of drawing them from the random generator.  
+        After the recorded measurements are used up, the random generator takes over again.  
+        If strict, a measurement beyond the recorded ones raises `MeasurementRequired` instead, which leaves the board halfway through a move."""
+        self.__replay = list(measurements)
+        self.__strict_replay = strict
+
     def __remove_collision(self,x_pos,y_pos):
         """Make a measurement on a given tile."""
-        random_board = random.choice(self.board_list).board
-        collision_measurement = random_board[y_pos][x_pos]
+        if self.__replay:
+            collision_measurement = self.__replay.pop(0).outcome_at(x_pos,y_pos)
+            if not any(board.piece_at(x_pos,y_pos) == collision_measurement for board in self.board_list):
+                raise ValueError("The recorded measurement can't come out as {} in this game.".format(collision_measurement))
+        elif self.__strict_replay:
+            raise MeasurementRequired(x_pos,y_pos,sorted({board.piece_at(x_pos,y_pos) for board in self.board_list}))
+        else:
+            generator = random if self.rng is None else self.rng
+            random_board = generator.choices(self.board_list,weights=self.multiplicity)[0]
+            collision_measurement = random_board.piece_at(x_pos,y_pos)
+        self.measurements.append(Measurement(x_pos,y_pos,collision_measurement))
         
-        self.board_list = [board for board in self.board_list if board.board[y_pos][x_pos] == collision_measurement]
+        kept = [index for index, board in enumerate(self.board_list) if board.piece_at(x_pos,y_pos) == collision_measurement]
+        for index, board in enumerate(self.board_list):
+            if board.piece_at(x_pos,y_pos) != collision_measurement:
+                self.__count_board(board,-self.multiplicity[index],-1)
+
+        self.board_list = [self.board_list[index] for index in kept]
+        self.multiplicity = [self.multiplicity[index] for index in kept]
+
+    def __use_pool(self):
+        return self.pool is not None and len(self.board_list) >= self.pool.min_branches
+
+    def __exceeds_budget(self):
+        """Return whether a split could leave more positions than the budget allows."""
+        return self.max_branches is not None and 2 * len(self.board_list) > self.max_branches
+
+    def __enforce_budget(self):
+        """Measure tiles until the positions fit in the budget again."""
+        while self.max_branches is not None and len(self.board_list) > self.max_branches:
+            tile = self.__least_certain_tile()
+            if tile is None:
+                # The positions only differ in whether they're finished, which no measurement can tell apart.
+                break
+            self.__remove_collision(*tile)
+            self.forced_measurements += 1
+        self.peak_branches = max(self.peak_branches,len(self.board_list))
+
+    def __least_certain_tile(self):
+        """Return the tile where the weight of the playouts with a piece is closest to the weight of those without one.
+        Ties go to the first tile, row by row. Returns None if every playout agrees on every tile."""
+        total_weight = self.branch_count()
+        best_tile = None
+        best_score = 0
+        # A tile without any weight scores 0, so only the tiles with weight need to be looked at.
+        for x_pos, y_pos in sorted(set(self.__tile_weights[1]) | set(self.__tile_weights[-1]),key=lambda tile: (tile[1],tile[0])):
+            weight = self.__tile_weights[1].get((x_pos,y_pos),0) + self.__tile_weights[-1].get((x_pos,y_pos),0)
+            score = min(weight,total_weight - weight)
+            if score > best_score:
+                best_tile = (x_pos,y_pos)
+                best_score = score
+        return best_tile
+
+    def branch_count(self):
+        """Return the amount of playouts on the board, counting every position as often as it occurs."""
+        return sum(self.multiplicity)
+
+    @property
+    def zobrist(self):
+        """A 64-bit hash of the superposition: the multiset of playouts, independent of the order they're stored in.  
+        Multiplicities are taken relative to each other, so doubling every playout doesn't change the hash."""
+        divisor = 0
+        for weight in self.multiplicity:
+            divisor = math.gcd(divisor,weight)
+
+        answer = 0
+        for board, weight in zip(self.board_list,self.multiplicity):
+            answer += (weight // divisor) * _mix_hash(board.square_hash())
+        return answer & 0xFFFFFFFFFFFFFFFF
+
+    def __merge_duplicates(self):
+        """Store positions that have been reached through multiple playouts only once."""
+        positions = {}
+        board_list = []
+        multiplicity = []
+
+        for board, weight in zip(self.board_list,self.multiplicity):
+            # The hash narrows the search down to a handful of candidates; only those are compared square by square.
+            candidates = positions.setdefault((board.square_hash(),board.turn,board.finished,board.winner),[])
+            for index in candidates:
+                if board_list[index].same_squares(board):
+                    multiplicity[index] += weight
+                    # The tiles keep the same weight, but this board's capture options lose a reference.
+                    self.__count_board(board,0,-1)
+                    break
+            else:
+                candidates.append(len(board_list))
+                board_list.append(board)
+                multiplicity.append(weight)
+
+        self.board_list = board_list
+        self.multiplicity = multiplicity
+
+    def __pass_turns(self,board_list,answers,user):
+        """Hand the turn on in the playouts that refused the move, the same way the game does: to the opponent if the move
+        passed the turn in any playout, and to the user if it only continued a capture chain."""
+        if Move.success_opponents_turn in answers:
+            turn = -user
+        elif Move.success_same_turn in answers:
+            turn = user
+        else:
+            return
+        accepted = [Move.success_opponents_turn,Move.success_same_turn,Move.finish]
+        for board, answer in zip(board_list,answers):
+            if answer not in accepted and not board.finished:
+                board.pass_turn(turn)
+
+    def __count_board(self,board,weight,references):
+        """Add the weight of a whole playout to the tiles, and a number of references to its capture options.  
+        The references count the playout itself as well, among the positions that haven't finished yet."""
+        if weight != 0:
+            for x_pos, y_pos, value in board.occupied():
+                weights = self.__tile_weights[value]
+                total = weights.get((x_pos,y_pos),0) + weight
+                if total != 0:
+                    weights[(x_pos,y_pos)] = total
+                else:
+                    del weights[(x_pos,y_pos)]
+        if not board.finished:
+            self.__unfinished += references
+
+        for option in board.capture_options:
+            self.__count_option(option,references)
+
+    def __apply_changes(self,board,weight,entry,touched_tiles):
+        """Update the counters with the squares and capture options a single move changed on a playout."""
+        previous_values = {}
+        for x_pos, y_pos, value in entry.squares:
+            previous_values.setdefault((x_pos,y_pos),value)
+
+        size = len(self)
+        for (x_pos, y_pos), value in previous_values.items():
+            current_value = board.piece_at(x_pos,y_pos)
+            # Coordinates just off the board wrap around, like the list index of a Board does.
+            tile = (x_pos % size,y_pos % size)
+            if value != 0:
+                self.__add_weight(value,tile,-weight)
+            if current_value != 0:
+                self.__add_weight(current_value,tile,weight)
+            touched_tiles.add(tile)
+
+        for index, option in entry.removed_options:
+            self.__count_option(option,-1)
+        for option in entry.added_options:
+            self.__count_option(option,1)
+
+        if board.finished != entry.finished:
+            self.__unfinished += 1 if entry.finished else -1
+
+    def __add_weight(self,player,tile,weight):
+        weights = self.__tile_weights[player]
+        total = weights.get(tile,0) + weight
+        if total != 0:
+            weights[tile] = total
+        else:
+            weights.pop(tile,None)
+
+    def __count_option(self,option,references):
+        if references > 0:
+            self.capture_options.add(option,references)
+        else:
+            self.capture_options.discard(option,-references)
+
+    def __double_counters(self):
+        for weights in self.__tile_weights.values():
+            for tile in weights:
+                weights[tile] *= 2
+        self.capture_options.scale(2)
+        self.__unfinished *= 2
+
+    def __refresh(self,touched_tiles):
+        """Check the changed tiles for collisions and bring the derived values up to date."""
+        for tile in touched_tiles:
+            # Remove any potential collisions. This should not happen.
+            if self.__tile_weights[1].get(tile,0) > 0 and self.__tile_weights[-1].get(tile,0) > 0:
+                raise ValueError("Caught unnoticed piece collision!")
+
+        self.__quantum_board = None
+        self.__update_finished_condition()
 
     def __update_finished_condition(self):
-        for board in self.board_list:
-            if board.finished == False:
-                self.finished = False
-                return
-        self.finished = True
+        # Every playout that finishes or goes away updates the count, so the playouts don't need to be looked at.
+        self.finished = self.__unfinished == 0
         
-    def __load_capture_options(self):
-        self.capture_options = []
-        for board_instance in self.board_list:
-            for option in board_instance.capture_options:
-                if option not in self.capture_options:
-                    self.capture_options.append(option)
-
     def __is_capture_move(self,user,x_pos,y_pos,x_dir,y_dir):
-        return CaptureOption(user,x_pos,y_pos,x_dir,y_dir) in self.capture_options                
+        return (user,x_pos,y_pos,x_dir,y_dir) in self.capture_options                
@@ -0,0 +1,491 @@
+from board import Move
+import concurrent.futures
+import contextlib
+import math
+import random
+import time
+
+# Scores are seen from the side to move. A win is worth more than any evaluation can add up to.
+WIN_SCORE = 1000000
+# Wins found this far below WIN_SCORE are still recognised as wins, however deep they were found.
+WIN_MARGIN = 10000
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time or node budget runs out."""
+    pass
+
+class TranspositionTable:
+    def __init__(self,size=2**16):
+        """Create a transposition table with a fixed amount of slots.
+        Each position is stored in the slot its hash points to. A slot is overwritten when it was filled
+        during an older search, or when the new result has been searched at least as deep.
+        Keyword arguments:
+        size -> the amount of slots"""
+        self.size = size
+        self.generation = 0
+        self.__slots = [None] * size
+
+    def __len__(self):
+        """Return the amount of slots that are filled."""
+        return sum(1 for entry in self.__slots if entry is not None)
+
+    def new_search(self):
+        """Mark every stored entry as old, so that they are the first to be replaced."""
+        self.generation += 1
+
+    def clear(self):
+        self.__slots = [None] * self.size
+
+    def probe(self,key):
+        """Return `(depth, score, flag, move)` for the position, or None if it isn't stored."""
+        entry = self.__slots[key % self.size]
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1:5]
+
+    def store(self,key,depth,score,flag,move):
+        slot = key % self.size
+        entry = self.__slots[slot]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.__slots[slot] = (key,depth,score,flag,move,self.generation)
+
+class Engine:
+    def __init__(self,max_depth=None,time_limit=None,node_limit=None,table_size=2**16,tablebase=None):
+        """Create an alpha-beta search engine that picks moves on a `Board`.
+        The engine deepens its search one ply at a time until the depth, time or node budget runs out,
+        and plays the best move of the deepest search that was completed.
+        Keyword arguments:
+        max_depth -> the deepest search to try, in plies; unlimited if None
+        time_limit -> the amount of seconds a search may take; unlimited if None
+        node_limit -> the amount of positions a search may visit; unlimited if None
+        table_size -> the amount of slots of the transposition table
+        tablebase -> a `tablebase.Tablebase` to look up positions with few pieces in, instead of searching them"""
+
+        if max_depth is None and time_limit is None and node_limit is None:
+            raise ValueError("The engine needs a depth, time or node budget.")
+
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.table = TranspositionTable(table_size)
+        self.tablebase = tablebase
+
+        # Statistics of the last search.
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.depth = 0
+        self.score = 0
+        self.best_move = None
+
+        self.__deadline = None
+
+    def nps(self):
+        """Return the amount of positions visited per second during the last search."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def search(self,board,user):
+        """Return the best move for the user as an `(x_pos,y_pos,x_dir,y_dir)` tuple, or None if there's none.
+        The board is searched with `make_move()` and `unmake_move()`, so it's back in its original state afterwards."""
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best_move = None
+        self.table.new_search()
+
+        start = time.perf_counter()
+        self.__deadline = None
+        if self.time_limit is not None:
+            self.__deadline = start + self.time_limit
+
+        moves = list(board.legal_moves(user))
+        if moves:
+            self.best_move = moves[0]
+
+        # Moves over a friendly piece print a warning on the board; a search tries thousands of them.
+        # With sys.stdout set to None, print() doesn't write anything.
+        max_depth = self.max_depth
+        if self.tablebase is not None and self.tablebase.probe(board,user) is not None:
+            # Every move leads to a position the tablebase holds, so looking a single move ahead is enough.
+            max_depth = 1
+
+        with contextlib.redirect_stdout(None):
+            depth = 0
+            while len(moves) > 1 and (max_depth is None or depth < max_depth):
+                depth += 1
+                try:
+                    score, move = self.__search_root(board,user,depth)
+                except SearchTimeout:
+                    break
+
+                self.depth = depth
+                self.score = score
+                self.best_move = move
+
+                # There's no need to look any further once the outcome is known.
+                if abs(score) >= WIN_SCORE - WIN_MARGIN:
+                    break
+
+        self.elapsed = time.perf_counter() - start
+        return self.best_move
+
+    def evaluate(self,board,user):
+        """Return a static score of the position for the user.
+        Every piece is worth 100 points, plus 10 for every row it has advanced towards the opponent's side."""
+        size = len(board)
+        score = 0
+        # Only the pieces are visited, so a SparseBoard is scored in time proportional to its pieces, not its squares.
+        for x_pos, y_pos, piece in board.occupied():
+            if piece == 1:
+                score += 100 + 10 * y_pos
+            else:
+                score -= 100 + 10 * (size - 1 - y_pos)
+        return score * user
+
+    def __search_root(self,board,user,depth):
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        alpha = -WIN_SCORE - 1
+
+        for move in self.__ordered_moves(board,user,self.best_move):
+            score = self.__search_move(board,user,move,depth,0,alpha,WIN_SCORE + 1)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha,score)
+        return best_score, best_move
+
+    def __search_move(self,board,user,move,depth,ply,alpha,beta):
+        """Make the move, score the position that follows for the user, and take the move back."""
+        answer = board.make_move(move[0],move[1],move[2],move[3],user)
+        try:
+            if answer == Move.finish:
+                # Only the player making the final move can win.
+                if board.winner == user:
+                    return WIN_SCORE - ply - 1
+                return -WIN_SCORE + ply + 1
+            if answer == Move.success_same_turn:
+                # A capture chain continues: the same player moves again.
+                return self.__negamax(board,user,depth-1,ply+1,alpha,beta)
+            return -self.__negamax(board,-user,depth-1,ply+1,-beta,-alpha)
+        finally:
+            board.unmake_move()
+
+    def __negamax(self,board,user,depth,ply,alpha,beta):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        # Asking for the time is a lot more expensive, so it only happens every now and then.
+        if self.nodes & 1023 == 0 and self.__deadline is not None and time.perf_counter() >= self.__deadline:
+            raise SearchTimeout()
+
+        if self.tablebase is not None:
+            known = self.tablebase.probe(board,user)
+            if known is not None:
+                outcome, moves = known
+                return outcome * (WIN_SCORE - ply - moves)
+
+        original_alpha = alpha
+        entry = self.table.probe(board.zobrist)
+        table_move = None
+        if entry is not None:
+            stored_depth, score, flag, table_move = entry
+            if stored_depth >= depth:
+                score = self.__score_from_table(score,ply)
+                if flag == EXACT:
+                    return score
+                if flag == LOWER_BOUND:
+                    alpha = max(alpha,score)
+                elif flag == UPPER_BOUND:
+                    beta = min(beta,score)
+                if alpha >= beta:
+                    return score
+
+        if depth <= 0:
+            return self.evaluate(board,user)
+
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        for move in self.__ordered_moves(board,user,table_move):
+            score = self.__search_move(board,user,move,depth,ply,alpha,beta)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            alpha = max(alpha,score)
+            if alpha >= beta:
+                break
+
+        if best_move is None:
+            # A player that can't move anymore has lost.
+            return -WIN_SCORE + ply
+
+        flag = EXACT
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        self.table.store(board.zobrist,depth,self.__score_to_table(best_score,ply),flag,best_move)
+        return best_score
+
+    def __ordered_moves(self,board,user,first_move):
+        """Return the legal moves: the remembered best move first, then captures, then the other moves."""
+        first = []
+        captures = []
+        others = []
+        for move in board.legal_moves(user):
+            if move == first_move:
+                first.append(move)
+            elif (user,) + move in board.capture_options:
+                captures.append(move)
+            else:
+                others.append(move)
+        return first + captures + others
+
+    def __score_to_table(self,score,ply):
+        # Wins are stored relative to the position, not to the root of the search.
+        if score >= WIN_SCORE - WIN_MARGIN:
+            return score + ply
+        if score <= -WIN_SCORE + WIN_MARGIN:
+            return score - ply
+        return score
+
+    def __score_from_table(self,score,ply):
+        if score >= WIN_SCORE - WIN_MARGIN:
+            return score - ply
+        if score <= -WIN_SCORE + WIN_MARGIN:
+            return score + ply
+        return score
+
+class DecisionNode:
+    """A position in the search tree of a `QEngine`, where the user picks a move."""
+    __slots__ = ['user','visits','untried','children']
+
+    def __init__(self,user,moves):
+        self.user = user
+        self.visits = 0
+        self.untried = moves
+        # Every move leads to a chance node.
+        self.children = {}
+
+class ChanceNode:
+    """The outcome of a move in the search tree of a `QEngine`.
+    Measurements can send a move to several positions; each one that has come up gets its own decision node."""
+    __slots__ = ['visits','value','outcomes']
+
+    def __init__(self):
+        self.visits = 0
+        # The total reward of the user that made the move.
+        self.value = 0.0
+        self.outcomes = {}
+
+class QEngine:
+    def __init__(self,time_limit=None,iterations=None,exploration=1.4,rollout_depth=20,workers=1,seed=None):
+        """Create a Monte Carlo tree search engine that picks moves on a `QBoard` or `TensorQBoard`.
+        Measurements are chance nodes: every time the search walks through a move, it is played on a copy of
+        the board, so that the outcome is drawn with the same probabilities as in a real game.
+        Keyword arguments:
+        time_limit -> the amount of seconds a search may take; unlimited if None
+        iterations -> the amount of playouts a search may make; unlimited if None
+        exploration -> how much the search favours moves it hasn't tried often
+        rollout_depth -> the amount of random moves made after leaving the tree
+        workers -> the amount of processes that search at the same time
+        seed -> the seed of the random generator of the engine"""
+
+        if time_limit is None and iterations is None:
+            raise ValueError("The engine needs a time or iteration budget.")
+
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.exploration = exploration
+        self.rollout_depth = rollout_depth
+        self.workers = workers
+        self.random = random.Random(seed)
+
+        # Statistics of the last search.
+        self.playouts = 0
+        self.elapsed = 0.0
+        self.visits = {}
+        self.best_move = None
+
+        self.__pool = None
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    def playouts_per_second(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.playouts / self.elapsed
+
+    def search(self,board,user):
+        """Return the best move for the user, as a tuple `QBoard.play()` accepts, or None if there's none.
+        The board itself is never altered."""
+        start = time.perf_counter()
+        moves = list(board.legal_moves(user))
+        self.visits = {}
+        self.playouts = 0
+        self.best_move = None
+
+        if len(moves) == 1:
+            self.best_move = moves[0]
+        elif len(moves) > 1:
+            if self.workers > 1:
+                self.__search_parallel(board,user)
+            else:
+                self.visits, self.playouts = self.run(board,user,self.time_limit,self.iterations)
+            self.best_move = max(moves,key=lambda move: self.visits.get(move,(0,0.0))[0])
+
+        self.elapsed = time.perf_counter() - start
+        return self.best_move
+
+    def run(self,board,user,time_limit,iterations):
+        """Build a search tree for the user and return `({move: (visits, reward)}, playouts)` for the root."""
+        deadline = None
+        if time_limit is not None:
+            deadline = time.perf_counter() + time_limit
+
+        root = DecisionNode(user,list(board.legal_moves(user)))
+        playouts = 0
+        # With sys.stdout set to None, the warnings of jumps over friendly pieces aren't printed.
+        with contextlib.redirect_stdout(None):
+            while iterations is None or playouts < iterations:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                # The copy measures with the generator of the engine, so the game's own generator is left alone.
+                state = board.copy()
+                state.rng = self.random
+                state.replay_measurements([])
+                self.__iterate(root,state)
+                playouts += 1
+
+        return {move: (child.visits, child.value) for move, child in root.children.items()}, playouts
+
+    def reward(self,board,user):
+        """Return how likely the user is to win the position, from 0 to 1.
+        Finished playouts count as won or lost; the others by the share of the pieces the user is expected to have."""
+        total = 0
+        won = 0.0
+        for weight, finished, winner, own, opponent in _playouts(board,user):
+            total += weight
+            if finished:
+                if winner == user:
+                    won += weight
+                continue
+            won += weight * own / max(own + opponent,1)
+        return won / total
+
+    def __iterate(self,root,board):
+        """Walk down the tree, add a node, play randomly from there and pass the result back up."""
+        node = root
+        path = []
+
+        while not board.finished:
+            if node.untried:
+                move = node.untried.pop(self.random.randrange(len(node.untried)))
+                node.children[move] = ChanceNode()
+            elif node.children:
+                move = self.__select(node)
+            else:
+                break
+
+            chance = node.children[move]
+            path.append((node,chance))
+            user = self.__play(board,move,node.user)
+
+            # Positions are told apart by their hash, so every measurement outcome gets its own node.
+            key = (board.zobrist,user)
+            if key not in chance.outcomes:
+                chance.outcomes[key] = DecisionNode(user,list(board.legal_moves(user)))
+                node = chance.outcomes[key]
+                break
+            node = chance.outcomes[key]
+
+        user = node.user
+        for depth in range(self.rollout_depth):
+            if board.finished:
+                break
+            moves = list(board.legal_moves(user))
+            if not moves:
+                break
+            user = self.__play(board,self.random.choice(moves),user)
+
+        reward = self.__final_reward(board,user)
+        for parent, chance in path:
+            parent.visits += 1
+            chance.visits += 1
+            if parent.user == 1:
+                chance.value += reward
+            else:
+                chance.value += 1 - reward
+
+    def __final_reward(self,board,user):
+        """Return the reward for player 1 at the end of a playout."""
+        if not board.finished and not any(True for move in board.legal_moves(user)):
+            # A player that can't move anymore has lost.
+            return 0.0 if user == 1 else 1.0
+        return self.reward(board,1)
+
+    def __select(self,node):
+        """Pick the move with the best upper confidence bound."""
+        scale = self.exploration * math.sqrt(math.log(node.visits))
+        best_move = None
+        best_score = -1.0
+        for move, chance in node.children.items():
+            score = chance.value / chance.visits + scale / math.sqrt(chance.visits)
+            if score > best_score:
+                best_score = score
+                best_move = move
+        return best_move
+
+    def __play(self,board,move,user):
+        """Make the move and return the player whose turn it is next."""
+        answer = board.play(move,user)
+        if Move.success_opponents_turn in answer:
+            return -user
+        return user
+
+    def __search_parallel(self,board,user):
+        if self.__pool is None:
+            self.__pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+
+        # Every worker builds its own tree with its own seed; their root statistics are added up.
+        jobs = []
+        for worker in range(self.workers):
+            settings = (self.exploration,self.rollout_depth,self.random.getrandbits(64))
+            iterations = None
+            if self.iterations is not None:
+                iterations = -(-self.iterations // self.workers)
+            jobs.append(self.__pool.submit(_run_worker,board,user,self.time_limit,iterations,settings))
+
+        for job in jobs:
+            visits, playouts = job.result()
+            self.playouts += playouts
+            for move, (count, value) in visits.items():
+                total_count, total_value = self.visits.get(move,(0,0.0))
+                self.visits[move] = (total_count + count, total_value + value)
+
+def _playouts(board,user):
+    """Yield `(weight, finished, winner, own pieces, opponent pieces)` for every position a QBoard or TensorQBoard stores."""
+    if hasattr(board,'board_list'):
+        for branch, weight in zip(board.board_list,board.multiplicity):
+            yield weight, branch.finished, branch.winner, branch.piece_count(user), branch.piece_count(-user)
+        return
+
+    pieces = board.branches.reshape(len(board.branches),-1)
+    own = (pieces == user).sum(axis=1).tolist()
+    opponent = (pieces == -user).sum(axis=1).tolist()
+    yield from zip(board.multiplicity.tolist(),board.finished_branches.tolist(),board.winners.tolist(),own,opponent)
+
+def _run_worker(board,user,time_limit,iterations,settings):
+    """Search in a worker process of `QEngine`."""
+    exploration, rollout_depth, seed = settings
+    engine = QEngine(time_limit,iterations,exploration,rollout_depth,1,seed)
+    return engine.run(board,user,time_limit,iterations)
@@ -1,9 +1,17 @@
 from board import Board, QBoard, Move
+from record import GameRecord, is_accepted
 
 class Checkers:
-    def __init__(self,size=10,population=3):
-        self.environment = Board(size,population)
+    def __init__(self,size=10,population=3,board_class=Board,engines=None):
+        self.environment = board_class(size,population)
         self.player_turn = 1
+        # Every accepted move is kept in a compact record of the game.
+        self.record = GameRecord(size,population)
+
+        # Players that are played by an Engine instead of a human, as {player: engine}.
+        self.engines = {}
+        if engines is not None:
+            self.engines = dict(engines)
     
     def tstart(self,debug=False):
         
@@ -22,9 +30,20 @@ class Checkers:
         if debug == True:
             print(self.environment.capture_options)
 
-        # Interpret the user's input.
-        question = input("What to do next? ").split(' ')
-        answer = self.environment.move(int(question[0]),int(question[1]),int(question[2]),int(question[3]), self.player_turn)
+        if self.player_turn in self.engines:
+            # Let the engine pick a move instead.
+            engine = self.engines[self.player_turn]
+            question = engine.search(self.environment,self.player_turn)
+            if question is None:
+                raise RuntimeError("The engine has no moves left to play.")
+            print("Engine plays {} {} {} {} (depth {}, {:.0f} nodes/s)".format(*question,engine.depth,engine.nps()))
+        else:
+            # Interpret the user's input.
+            question = input("What to do next? ").split(' ')
+        move = (int(question[0]),int(question[1]),int(question[2]),int(question[3]))
+        answer = self.environment.move(move[0],move[1],move[2],move[3], self.player_turn)
+        if is_accepted(answer):
+            self.record.add_move(move,self.player_turn)
 
         if debug == True:
             print(answer)
@@ -35,9 +54,16 @@ class Checkers:
 
 
 class QCheckers:
-    def __init__(self,size=10,population=3):
-        self.environment = QBoard(size,population)
+    def __init__(self,size=10,population=3,board_class=QBoard,engines=None):
+        self.environment = board_class(size,population)
         self.player_turn = 1
+        # Every accepted move is kept in a compact record of the game, along with the measurements it caused.
+        self.record = GameRecord(size,population,quantum=True)
+
+        # Players that are played by a QEngine instead of a human, as {player: engine}.
+        self.engines = {}
+        if engines is not None:
+            self.engines = dict(engines)
     
     def tstart(self,debug=False):
         
@@ -57,12 +83,28 @@ class QCheckers:
         if debug == True:
             print(self.environment.capture_options)
 
-        # Ask for the user's input
-        question = input("What to do next? ").split(' ')
+        if self.player_turn in self.engines:
+            # Let the engine pick a move instead.
+            engine = self.engines[self.player_turn]
+            question = engine.search(self.environment,self.player_turn)
+            if question is None:
+                raise RuntimeError("The engine has no moves left to play.")
+            print("Engine plays {} ({} playouts)".format(' '.join(str(value) for value in question),engine.playouts))
+        else:
+            # Ask for the user's input
+            question = input("What to do next? ").split(' ')
+        measured = len(self.environment.measurements)
         if question[0] == 'Q':
-            answer = self.environment.quantum_split(int(question[1]),int(question[2]),self.player_turn)
+            move = ('Q',int(question[1]),int(question[2]))
+            answer = self.environment.quantum_split(move[1],move[2],self.player_turn)
         else:
-            answer = self.environment.move(int(question[0]),int(question[1]),int(question[2]),int(question[3]), self.player_turn)
+            move = (int(question[0]),int(question[1]),int(question[2]),int(question[3]))
+            answer = self.environment.move(move[0],move[1],move[2],move[3], self.player_turn)
+
+        if is_accepted(answer):
+            self.record.add_move(move,self.player_turn)
+        for measurement in self.environment.measurements[measured:]:
+            self.record.add_measurement(measurement)
 
         if debug == True:
             print(answer)
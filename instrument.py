@@ -0,0 +1,154 @@
+from board import Board, QBoard, CaptureOption, Move
+import contextlib
+import time
+
+# Instrumentation works by swapping functions of the classes for wrappers that count and time them.
+# While it's disabled, the classes hold their own functions again, so it costs nothing at all.
+_originals = {}
+_counters = {}
+_latencies = {}
+_hook = None
+
+COUNTERS = ['still_valid', 'board_copies', 'qboard_copies', 'row_copies', 'capture_options_scanned', 'capture_searches',
+            'branches_created', 'branches_pruned', 'branches_merged', 'measurements']
+
+def enable(hook=None):
+    """Start counting and timing the hot paths of every Board and QBoard in this process.
+    The hook, if given, is called as `hook(name, seconds, board)` after every timed call, like `'QBoard.move'`.
+    Enabling it again only replaces the hook."""
+    global _hook
+    _hook = hook
+    if _originals:
+        return
+    if not _counters:
+        reset()
+
+    _patch(CaptureOption,'still_valid',_counted('still_valid'))
+    _patch(Board,'copy',_counted('board_copies'))
+    _patch(QBoard,'copy',_counted('qboard_copies'))
+    _patch(Board,'_Board__own_row',_own_row)
+    _patch(Board,'_Board__refresh_capture_options',_refresh_capture_options)
+    _patch(Board,'_Board__find_capture_options',_counted('capture_searches'))
+    _patch(QBoard,'_QBoard__remove_collision',_pruned('branches_pruned','measurements'))
+    _patch(QBoard,'_QBoard__merge_duplicates',_pruned('branches_merged'))
+
+    _patch(Board,'move',_timed('Board.move'))
+    _patch(QBoard,'move',_timed('QBoard.move'))
+    _patch(QBoard,'quantum_split',_quantum_split)
+    _patch(QBoard,'update_quantum_board',_timed('QBoard.update_quantum_board'))
+
+def disable():
+    """Put the functions of the classes back. The numbers gathered so far are kept until `reset()`."""
+    global _hook
+    for (cls, name), function in _originals.items():
+        setattr(cls,name,function)
+    _originals.clear()
+    _hook = None
+
+def is_enabled():
+    return bool(_originals)
+
+def reset():
+    """Set every counter and histogram back to zero."""
+    _counters.clear()
+    _counters.update({name: 0 for name in COUNTERS})
+    _latencies.clear()
+
+def snapshot():
+    """Return a copy of everything that has been gathered.
+    `counters` holds the counters by name. `latency` holds, for every timed function, the amount of `calls`, their `total`
+    and `max` seconds, and a `histogram` that counts the calls per bucket; a bucket holds the calls that took at most
+    that many microseconds, in powers of two."""
+    return {
+        'counters': dict(_counters),
+        'latency': {name: {'calls': latency['calls'], 'total': latency['total'], 'max': latency['max'],
+                           'histogram': dict(sorted(latency['histogram'].items()))}
+                    for name, latency in _latencies.items()},
+    }
+
+@contextlib.contextmanager
+def instrumented(hook=None):
+    """Gather numbers within a `with` block only, starting from zero. Yields the `snapshot` function."""
+    reset()
+    enable(hook)
+    try:
+        yield snapshot
+    finally:
+        disable()
+
+def _patch(cls,name,make_wrapper):
+    original = cls.__dict__[name]
+    _originals[(cls,name)] = original
+    setattr(cls,name,make_wrapper(original))
+
+def _record(name,seconds,board):
+    latency = _latencies.get(name)
+    if latency is None:
+        latency = _latencies[name] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'histogram': {}}
+    latency['calls'] += 1
+    latency['total'] += seconds
+    latency['max'] = max(latency['max'],seconds)
+    bucket = 1 << int(seconds * 1e6).bit_length()
+    latency['histogram'][bucket] = latency['histogram'].get(bucket,0) + 1
+
+    if _hook is not None:
+        _hook(name,seconds,board)
+
+def _counted(counter):
+    def make_wrapper(original):
+        def wrapper(*arguments,**keywords):
+            _counters[counter] += 1
+            return original(*arguments,**keywords)
+        return wrapper
+    return make_wrapper
+
+def _pruned(counter,calls=None):
+    """Count the positions a function of a QBoard removes from `board_list`, and optionally how often it's called."""
+    def make_wrapper(original):
+        def wrapper(self,*arguments):
+            before = len(self.board_list)
+            result = original(self,*arguments)
+            _counters[counter] += before - len(self.board_list)
+            if calls is not None:
+                _counters[calls] += 1
+            return result
+        return wrapper
+    return make_wrapper
+
+def _timed(name):
+    def make_wrapper(original):
+        def wrapper(self,*arguments,**keywords):
+            start = time.perf_counter()
+            result = original(self,*arguments,**keywords)
+            _record(name,time.perf_counter() - start,self)
+            return result
+        return wrapper
+    return make_wrapper
+
+def _own_row(original):
+    def wrapper(self,y_pos):
+        row = self._Board__rows[y_pos]
+        result = original(self,y_pos)
+        if result is not row:
+            _counters['row_copies'] += 1
+        return result
+    return wrapper
+
+def _refresh_capture_options(original):
+    def wrapper(self):
+        _counters['capture_options_scanned'] += len(self.capture_options)
+        return original(self)
+    return wrapper
+
+def _quantum_split(original):
+    def wrapper(self,x_pos,y_pos,user):
+        before = len(self.board_list)
+        start = time.perf_counter()
+        result = original(self,x_pos,y_pos,user)
+        seconds = time.perf_counter() - start
+        # A split that goes through copies every position once.
+        if Move.success_opponents_turn in result:
+            _counters['branches_created'] += before
+        _record('QBoard.quantum_split',seconds,self)
+        return result
+    return wrapper
@@ -0,0 +1,121 @@
+from board import Board, QBoard, Measurement, MeasurementRequired, Move
+from record import is_accepted
+import argparse
+import contextlib
+import multiprocessing
+import sys
+import time
+
+def perft(board,depth,user=1):
+    """Count the positions at the end of every path of exactly `depth` moves, starting with the given user.
+    Every capture of a chain is a move of its own, after which the same user moves again. On a quantum board, splits are
+    moves as well, and a move that measures a tile leads to a separate position for every piece the measurement could find.
+    Any board with `legal_moves()`, `play()` and `copy()` works; boards with `make_move()` are searched with `unmake_move()`,
+    others are copied for every move.
+    The board is left as it was."""
+    # With sys.stdout set to None, the warnings of jumps over friendly pieces aren't printed.
+    with contextlib.redirect_stdout(None):
+        return _perft(board,depth,user)
+
+def divide(board,depth,user=1,workers=1):
+    """Count the positions per first move, as a dictionary from move to count. It adds up to `perft()`.
+    With more than one worker, the first moves are spread over a pool of processes."""
+    if depth < 1:
+        raise ValueError("Dividing needs a depth of at least 1.")
+    moves = list(board.legal_moves(user))
+    jobs = [(board,move,depth,user) for move in moves]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            counts = pool.map(_divide_move,jobs,1)
+    else:
+        counts = [_divide_move(job) for job in jobs]
+    return dict(zip(moves,counts))
+
+def _divide_move(job):
+    board, move, depth, user = job
+    with contextlib.redirect_stdout(None):
+        return sum(_perft(child,depth - 1,next_user) for child, next_user in _children(board,move,user))
+
+def _perft(board,depth,user):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in list(board.legal_moves(user)):
+        for child, next_user in _children(board,move,user):
+            nodes += _perft(child,depth - 1,next_user)
+    return nodes
+
+def _children(board,move,user):
+    """Yield the position after the move, and the user that moves next, once for every way the measurements can come out.
+    A board that can take back its moves is altered in place, and put back once the next position is asked for."""
+    if hasattr(board,'replay_measurements'):
+        yield from _measured_children(board,move,user,[])
+        return
+    if not hasattr(board,'unmake_move'):
+        child = board.copy()
+        answer = child.play(move,user)
+        if is_accepted(answer):
+            yield child, _next_user(answer,user)
+        return
+
+    answer = board.make_move(*move,user)
+    try:
+        if is_accepted(answer):
+            yield board, _next_user(answer,user)
+    finally:
+        board.unmake_move()
+
+def _measured_children(board,move,user,measurements):
+    """Make the move on a copy, with the given outcomes for its measurements, and try every outcome of the next measurement."""
+    child = board.copy()
+    child.replay_measurements(measurements,strict=True)
+    try:
+        answer = child.play(move,user)
+    except MeasurementRequired as required:
+        for outcome in required.outcomes:
+            yield from _measured_children(board,move,user,measurements + [Measurement(required.x_pos,required.y_pos,outcome)])
+        return
+
+    child.replay_measurements([])
+    if is_accepted(answer):
+        yield child, _next_user(answer,user)
+
+def _next_user(answer,user):
+    answers = answer if isinstance(answer,list) else [answer]
+    if Move.success_opponents_turn in answers:
+        return -user
+    return user
+
+def format_move(move):
+    """Write a move the way `server.parse_move()` reads it: `x y dx dy` or `Q x y`."""
+    return ' '.join(str(value) for value in move)
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Count the positions reachable in a number of moves from the start of a game.")
+    parser.add_argument('--depth',type=int,default=4)
+    parser.add_argument('--quantum',action='store_true',help="count on a QBoard")
+    parser.add_argument('--size',type=int,default=8)
+    parser.add_argument('--population',type=int,default=3)
+    parser.add_argument('--workers',type=int,default=1,help="spread the first moves over this many processes")
+    parser.add_argument('--max-branches',type=int,help="the most positions a quantum board may store")
+    parser.add_argument('--divide',action='store_true',help="print the count of every first move")
+    options = parser.parse_args(arguments)
+
+    if options.quantum:
+        board = QBoard(options.size,options.population,max_branches=options.max_branches)
+    else:
+        board = Board(options.size,options.population)
+
+    start = time.perf_counter()
+    counts = divide(board,options.depth,1,options.workers)
+    seconds = time.perf_counter() - start
+    nodes = sum(counts.values())
+
+    if options.divide:
+        for move, count in counts.items():
+            print("{}: {}".format(format_move(move),count))
+    print("Depth {}: {} positions in {:.2f} seconds ({:.0f} positions/s)".format(options.depth,nodes,seconds,nodes / seconds if seconds > 0 else 0))
+    return nodes
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
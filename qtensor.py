@@ -0,0 +1,506 @@
+import copy
+import math
+import random
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from board import Board, CaptureOption, Measurement, MeasurementRequired, Move, make_rng, zobrist_keys, _mix_hash
+from board import QBOARD_HEADER, QBOARD_MAGIC, SNAPSHOT_VERSION, _unpack_header
+
+# The four diagonal directions a piece can travel in, as (x_dir, y_dir).
+DIRECTIONS = [(1,1),(-1,1),(1,-1),(-1,-1)]
+
+class TensorQBoard:
+    def __init__(self,size=10,population=3,rng=None,max_branches=None,over_budget='measure'):
+        """Create a quantum checkers board that stores all playouts in a single NumPy array.
+        The class behaves exactly like `QBoard`, but every move is applied to all playouts at once.
+        Keyword arguments:
+        size -> the size of the board
+        population -> the amount of rows each player has populated with pieces
+        rng -> the random generator used for measurements: a `random.Random` instance, a seed, or None for the `random` module
+        max_branches -> the most positions the board may store after a move, or None for no limit
+        over_budget -> what a split that goes over the limit does: 'measure' the board until it fits, or 'refuse' the split"""
+
+        if numpy is None:
+            raise ImportError("TensorQBoard requires NumPy. Install it with 'pip install numpy', or use QBoard instead.")
+
+        # Array of shape (playouts, size, size). Every position is stored once; the multiplicity counts its playouts.
+        self.branches = numpy.array([Board(size,population).board], dtype=numpy.int8)
+        self.multiplicity = numpy.ones(1, dtype=numpy.int64)
+        self.finished_branches = numpy.zeros(1, dtype=bool)
+        self.winners = numpy.zeros(1, dtype=numpy.int8)
+
+        self.quantum_board = self.update_quantum_board()
+        self.capture_options = []
+        self.finished = False
+
+        # Every measurement that has been made, in order, so the game can be replayed exactly.
+        self.rng = make_rng(rng)
+        self.measurements = []
+        self.__replay = []
+        self.__strict_replay = False
+
+        self.set_budget(max_branches,over_budget)
+
+    def __repr__(self):
+        """Display the board to the terminal, if wished."""
+        answer = '\n'
+        for i in range(len(self)):
+            for j in range(len(self)):
+                if (i+j)%2 == 0:
+                    answer += '{}'.format(self.quantum_board[i][j])
+                else:
+                    answer += '-'
+                answer += '\t'
+            answer += '\n'
+        return answer
+
+    def __len__(self):
+        return self.branches.shape[1]
+
+    @property
+    def zobrist(self):
+        """A 64-bit hash of the superposition, the same as `QBoard.zobrist` gives for the same playouts."""
+        divisor = 0
+        for weight in self.multiplicity.tolist():
+            divisor = math.gcd(divisor,weight)
+
+        answer = 0
+        for square_hash, weight in zip(self.__square_hashes().tolist(),self.multiplicity.tolist()):
+            answer += (weight // divisor) * _mix_hash(square_hash)
+        return answer & 0xFFFFFFFFFFFFFFFF
+
+    def branch_count(self):
+        """Return the amount of playouts on the board, counting every position as often as it occurs."""
+        return int(self.multiplicity.sum())
+
+    def quantum_split(self,x_pos,y_pos,user):
+        if self.finished == True:
+            return [Move.finish for i in range(len(self.branches))]
+        if self.capture_options != []:
+            return [Move.capture_ignored for i in range(len(self.branches))]
+
+        if not self.__quantum_ready(x_pos,y_pos,user):
+            return [Move.quantum_not_ready]
+        if self.over_budget == 'refuse' and self.max_branches is not None and 2 * len(self.branches) > self.max_branches:
+            self.refused_splits += 1
+            return [Move.branch_limit]
+
+        left_move = self.__apply(x_pos,y_pos,-1,user,user)
+        right_move = self.__apply(x_pos,y_pos,1,user,user)
+        evaluation_table = left_move[3] + right_move[3]
+
+        if Move.success_opponents_turn in evaluation_table:
+            self.branches = numpy.concatenate([left_move[0],right_move[0]])
+            self.finished_branches = numpy.concatenate([left_move[1],right_move[1]])
+            self.winners = numpy.concatenate([left_move[2],right_move[2]])
+            self.multiplicity = numpy.concatenate([self.multiplicity,self.multiplicity])
+
+            self.remove_potential_collision(x_pos-1,y_pos+user)
+            self.remove_potential_collision(x_pos+1,y_pos+user)
+            self.__merge_duplicates()
+            self.__enforce_budget()
+            self.update_quantum_board()
+
+            return [Move.success_opponents_turn]
+
+        self.update_quantum_board()
+        return evaluation_table
+
+    def move(self,x_pos,y_pos,x_dir,y_dir,user):
+        if x_pos + x_dir not in range(len(self)) or y_pos + y_dir not in range(len(self)):
+            return [Move.out_of_bounds for i in range(len(self.branches))]
+        if not self.__is_capture_move(user,x_pos,y_pos,x_dir,y_dir) and self.capture_options != []:
+            return [Move.capture_ignored for i in range(len(self.branches))]
+
+        self.branches, self.finished_branches, self.winners, response = self.__apply(x_pos,y_pos,x_dir,y_dir,user)
+
+        self.remove_potential_collision(x_pos+x_dir,y_pos+y_dir)
+        self.__merge_duplicates()
+        self.update_quantum_board()
+
+        return response
+
+    def copy(self):
+        """Return an independent copy of the quantum board."""
+        duplicate = copy.copy(self)
+        duplicate.branches = self.branches.copy()
+        duplicate.multiplicity = self.multiplicity.copy()
+        duplicate.finished_branches = self.finished_branches.copy()
+        duplicate.winners = self.winners.copy()
+        duplicate.capture_options = list(self.capture_options)
+        duplicate.measurements = list(self.measurements)
+        duplicate.__replay = list(self.__replay)
+        return duplicate
+
+    def legal_moves(self,user):
+        """Yield every move that succeeds in at least one playout: the same moves `QBoard.legal_moves()` yields.
+        Regular moves are `(x_pos,y_pos,x_dir,y_dir)` tuples and quantum moves are `('Q',x_pos,y_pos)` tuples. Captures come first."""
+        playing = self.branches[~self.finished_branches]
+
+        if self.capture_options != []:
+            # Any capture option on the board blocks every other move, even one of the opponent.
+            for direction, killers in enumerate(_capture_masks(playing,user)):
+                x_dir, y_dir = DIRECTIONS[direction]
+                for y_pos, x_pos in zip(*numpy.nonzero(killers.any(axis=0))):
+                    yield (int(x_pos),int(y_pos),2*x_dir,2*y_dir)
+            return
+
+        # The same directions as `Board.legal_moves()` tries, in the same order: steps forward, then jumps over any piece.
+        directions = [(-1,user),(1,user),(2,2),(-2,2),(2,-2),(-2,-2)]
+        own = playing == user
+        allowed = []
+        for x_dir, y_dir in directions:
+            movable = own & (_shifted(playing,x_dir,y_dir) == 0)
+            if abs(x_dir) == 2:
+                movable &= _shifted(playing,x_dir//2,y_dir//2) != 0
+            allowed.append(movable.any(axis=0))
+        allowed = numpy.stack(allowed)
+
+        for y_pos, x_pos in zip(*numpy.nonzero(allowed.any(axis=0))):
+            for index, (x_dir, y_dir) in enumerate(directions):
+                if allowed[index,y_pos,x_pos]:
+                    yield (int(x_pos),int(y_pos),x_dir,y_dir)
+
+        if self.finished:
+            return
+        if self.over_budget == 'refuse' and self.max_branches is not None and 2 * len(self.branches) > self.max_branches:
+            return
+        for y_pos, x_pos in zip(*numpy.nonzero((self.branches == user).any(axis=0))):
+            if self.__quantum_ready(int(x_pos),int(y_pos),user):
+                yield ('Q',int(x_pos),int(y_pos))
+
+    def play(self,move,user):
+        """Make a move as yielded by `legal_moves()`."""
+        if move[0] == 'Q':
+            return self.quantum_split(move[1],move[2],user)
+        return self.move(move[0],move[1],move[2],move[3],user)
+
+    def set_budget(self,max_branches=None,over_budget='measure'):
+        """Limit the amount of positions the board stores, the same way `QBoard.set_budget()` does."""
+        if max_branches is not None and max_branches < 1:
+            raise ValueError("The board needs room for at least one position.")
+        if over_budget not in ['measure','refuse']:
+            raise ValueError("A board over its budget can either 'measure' or 'refuse', not '{}'.".format(over_budget))
+        self.max_branches = max_branches
+        self.over_budget = over_budget
+
+        self.peak_branches = len(self.branches)
+        self.forced_measurements = 0
+        self.refused_splits = 0
+        if self.max_branches is not None and len(self.branches) > self.max_branches:
+            self.__enforce_budget()
+            self.update_quantum_board()
+
+    def usage(self):
+        """Return the counters of the budget, like `QBoard.usage()`."""
+        return {
+            'branches': len(self.branches),
+            'peak_branches': self.peak_branches,
+            'max_branches': self.max_branches,
+            'forced_measurements': self.forced_measurements,
+            'refused_splits': self.refused_splits,
+        }
+
+    def update_quantum_board(self):
+        # A tile holding pieces of both players in different playouts should have been measured already.
+        if numpy.any((self.branches > 0).any(axis=0) & (self.branches < 0).any(axis=0)):
+            raise ValueError("Caught unnoticed piece collision!")
+
+        weighted = numpy.tensordot(self.multiplicity, self.branches.astype(numpy.int64), axes=1)
+        self.quantum_board = ((100 * weighted) // self.branch_count()).tolist()
+
+        self.finished = bool(self.finished_branches.all())
+        self.__load_capture_options()
+        return self.quantum_board
+
+    def remove_potential_collision(self,x_pos,y_pos):
+        if x_pos not in range(len(self)) or y_pos not in range(len(self)):
+            return
+
+        tile = self.branches[:,y_pos,x_pos]
+        if (tile == 1).any() and (tile == -1).any():
+            self.__remove_collision(x_pos,y_pos)
+
+    def to_bytes(self):
+        """Return a snapshot in the same format as `QBoard.to_bytes()`, so either class can load it.
+        A TensorQBoard doesn't keep track of turns; every playout is stored with player 1 on turn."""
+        size = len(self)
+        count = len(self.branches)
+        zobrists = self.__square_hashes()
+
+        tile_weights = [numpy.tensordot(self.multiplicity,(self.branches == player).astype(numpy.int64),axes=1) for player in [1,-1]]
+        states = numpy.stack([self.finished_branches.astype(numpy.int8),self.winners,numpy.ones(count,dtype=numpy.int8)],axis=1)
+
+        header = struct.pack(QBOARD_HEADER,QBOARD_MAGIC,SNAPSHOT_VERSION,size,count)
+        return b''.join([header,self.multiplicity.astype('<u8').tobytes(),zobrists.astype('<u8').tobytes(),
+                         numpy.concatenate(tile_weights).astype('<u8').tobytes(),states.astype(numpy.int8).tobytes(),
+                         numpy.ascontiguousarray(self.branches,dtype=numpy.int8).tobytes()])
+
+    @classmethod
+    def from_bytes(cls,data,rng=None,max_branches=None,over_budget='measure'):
+        """Load a snapshot made by `to_bytes()` of either class. The playouts aren't copied: `branches` is a read-only view
+        on the given data, so a snapshot in an mmap is only read from disk when it's needed."""
+        if numpy is None:
+            raise ImportError("TensorQBoard requires NumPy. Install it with 'pip install numpy', or use QBoard instead.")
+
+        view = memoryview(data)
+        magic, version, size, count = _unpack_header(QBOARD_HEADER,QBOARD_MAGIC,view,0)
+        offset = struct.calcsize(QBOARD_HEADER)
+        if len(view) < offset + 16*count + 16*size*size + 3*count + count*size*size:
+            raise ValueError("The snapshot has been cut off.")
+
+        quantum = cls.__new__(cls)
+        quantum.multiplicity = numpy.frombuffer(view,dtype='<u8',count=count,offset=offset).astype(numpy.int64)
+        # The hashes and tile weights are worked out again when needed.
+        offset += 16 * count + 16 * size * size
+        states = numpy.frombuffer(view,dtype=numpy.int8,count=3*count,offset=offset).reshape(count,3)
+        offset += 3 * count
+        quantum.branches = numpy.frombuffer(view,dtype=numpy.int8,count=count*size*size,offset=offset).reshape(count,size,size)
+        quantum.finished_branches = states[:,0] != 0
+        quantum.winners = states[:,1].copy()
+
+        quantum.rng = make_rng(rng)
+        quantum.measurements = []
+        quantum.__replay = []
+        quantum.__strict_replay = False
+        quantum.quantum_board = quantum.update_quantum_board()
+        quantum.set_budget(max_branches,over_budget)
+        return quantum
+
+    def replay_measurements(self,measurements,strict=False):
+        """Make the next measurements come out as recorded, instead of drawing them from the random generator.
+        After the recorded measurements are used up, the random generator takes over again.
+        If strict, a measurement beyond the recorded ones raises `MeasurementRequired` instead, which leaves the board halfway through a move."""
+        self.__replay = list(measurements)
+        self.__strict_replay = strict
+
+    def __square_hashes(self):
+        """Return the Zobrist hash of the squares of every playout, like `Board.square_hash()`, as an array."""
+        count = len(self.branches)
+        flat = self.branches.reshape(count,-1)
+        square_keys, side_key = zobrist_keys(len(self))
+        zobrists = numpy.zeros(count,dtype=numpy.uint64)
+        for player in [1,-1]:
+            keys = numpy.array(square_keys[player],dtype=numpy.uint64)
+            zobrists ^= numpy.bitwise_xor.reduce(numpy.where(flat == player,keys,numpy.uint64(0)),axis=1)
+        return zobrists
+
+    def __remove_collision(self,x_pos,y_pos):
+        """Make a measurement on a given tile."""
+        if self.__replay:
+            collision_measurement = self.__replay.pop(0).outcome_at(x_pos,y_pos)
+            if not (self.branches[:,y_pos,x_pos] == collision_measurement).any():
+                raise ValueError("The recorded measurement can't come out as {} in this game.".format(collision_measurement))
+        elif self.__strict_replay:
+            raise MeasurementRequired(x_pos,y_pos,sorted(numpy.unique(self.branches[:,y_pos,x_pos]).tolist()))
+        else:
+            # Same draw as QBoard makes, so both boards measure alike when their generators are seeded alike.
+            generator = random if self.rng is None else self.rng
+            random_branch = generator.choices(range(len(self.branches)),weights=self.multiplicity.tolist())[0]
+            collision_measurement = int(self.branches[random_branch,y_pos,x_pos])
+        self.measurements.append(Measurement(x_pos,y_pos,collision_measurement))
+
+        self.__keep(self.branches[:,y_pos,x_pos] == collision_measurement)
+
+    def __enforce_budget(self):
+        """Measure the least certain tiles until the positions fit in the budget again, picking the same tiles as `QBoard`."""
+        while self.max_branches is not None and len(self.branches) > self.max_branches:
+            occupied = numpy.tensordot(self.multiplicity,(self.branches != 0).astype(numpy.int64),axes=1)
+            score = numpy.minimum(occupied,self.branch_count() - occupied)
+            # argmax picks the first of the best tiles, row by row.
+            tile = int(numpy.argmax(score))
+            if score.flat[tile] == 0:
+                break
+            y_pos, x_pos = divmod(tile,len(self))
+            self.__remove_collision(x_pos,y_pos)
+            self.forced_measurements += 1
+        self.peak_branches = max(self.peak_branches,len(self.branches))
+
+    def __keep(self,selection):
+        self.branches = self.branches[selection]
+        self.multiplicity = self.multiplicity[selection]
+        self.finished_branches = self.finished_branches[selection]
+        self.winners = self.winners[selection]
+
+    def __merge_duplicates(self):
+        """Store positions that have been reached through multiple playouts only once."""
+        if len(self.branches) < 2:
+            return
+
+        flat = self.branches.reshape(len(self.branches),-1)
+        keys = numpy.concatenate([flat,self.finished_branches[:,None].astype(numpy.int8),self.winners[:,None]],axis=1)
+        unique, first, inverse = numpy.unique(keys,axis=0,return_index=True,return_inverse=True)
+        if len(unique) == len(self.branches):
+            return
+
+        # numpy.unique sorts its result; put the positions back in the order they were first seen in.
+        inverse = inverse.reshape(-1)
+        order = numpy.argsort(first)
+        rank = numpy.empty_like(order)
+        rank[order] = numpy.arange(len(order))
+
+        multiplicity = numpy.bincount(rank[inverse],weights=self.multiplicity,minlength=len(order))
+        self.__keep(numpy.sort(first))
+        self.multiplicity = multiplicity.astype(numpy.int64)
+
+    def __apply(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Make a regular move in every playout, the way `Board.move()` would.
+        Returns the new branches, finished flags and winners, plus a list with the response of every playout.
+        The board itself is left untouched."""
+
+        count = len(self.branches)
+        size = len(self)
+        branches = self.branches.copy()
+        finished_branches = self.finished_branches.copy()
+        winners = self.winners.copy()
+        response = numpy.zeros(count, dtype=numpy.int8)
+
+        def refuse(selection,reason):
+            selection &= response == 0
+            response[selection] = reason.value
+
+        refuse(finished_branches.copy(),Move.finish)
+
+        # A list-backed board would wrap negative coordinates around; the same move is refused here.
+        if x_pos not in range(size) or y_pos not in range(size):
+            refuse(numpy.ones(count,dtype=bool),Move.no_piece_found)
+            return branches, finished_branches, winners, [Move(value) for value in response.tolist()]
+
+        moving_piece = branches[:,y_pos,x_pos]
+        refuse((moving_piece == 0) | (user * moving_piece.astype(numpy.int64) < 0),Move.no_piece_found)
+
+        if abs(x_dir) != abs(y_dir) or abs(x_dir) == 0 or abs(x_dir) > 2:
+            refuse(numpy.ones(count,dtype=bool),Move.invalid_destination)
+
+        refuse(branches[:,y_pos+y_dir,x_pos+x_dir] != 0,Move.path_blocked)
+
+        if (response == 0).any():
+            side = 1 if user > 0 else -1
+            capture_required = numpy.zeros(count,dtype=bool)
+            for killers in _capture_masks(branches,side):
+                capture_required |= killers.reshape(count,-1).any(axis=1)
+
+            is_capture = numpy.zeros(count,dtype=bool)
+            if abs(x_dir) == 2:
+                is_capture = branches[:,y_pos+(y_dir//2),x_pos+(x_dir//2)] == -side
+            refuse(capture_required & ~is_capture,Move.capture_ignored)
+
+            if abs(x_dir) == 1:
+                if side * y_dir < 0:
+                    refuse(numpy.ones(count,dtype=bool),Move.invalid_destination)
+            else:
+                victim = branches[:,y_pos+(y_dir//2),x_pos+(x_dir//2)]
+                refuse(victim == 0,Move.no_victim_found)
+
+        moved = response == 0
+        if moved.any():
+            branches[moved,y_pos+y_dir,x_pos+x_dir] = side
+            branches[moved,y_pos,x_pos] = 0
+
+            if abs(x_dir) == 1:
+                finishing = moved & _reached_end(branches)
+                response[moved] = Move.success_opponents_turn.value
+            else:
+                # Jumping over a friendly piece isn't a CaptureOption, which Board reports.
+                for friendly_jump in range(int((moved & (victim == side)).sum())):
+                    print("WARNING: Failed attempt to remove a CaptureOption that wasn\'t present.")
+                branches[moved,y_pos+(y_dir//2),x_pos+(x_dir//2)] = 0
+
+                another_capture = numpy.zeros(count,dtype=bool)
+                for direction, killers in enumerate(_capture_masks(branches,side)):
+                    another_capture |= killers[:,y_pos+y_dir,x_pos+x_dir]
+
+                pieces = branches.reshape(count,-1)
+                victory = _reached_end(branches) | ~(pieces == 1).any(axis=1) | ~(pieces == -1).any(axis=1)
+                finishing = moved & victory
+                response[moved] = Move.success_opponents_turn.value
+                response[moved & another_capture] = Move.success_same_turn.value
+
+            response[finishing] = Move.finish.value
+            finished_branches[finishing] = True
+            winners[finishing] = user
+
+        return branches, finished_branches, winners, [Move(value) for value in response.tolist()]
+
+    def __quantum_ready(self,x_pos,y_pos,user):
+        """Check whether the piece can make a quantum move in at least one playout, like `Board.quantum_move()`."""
+        size = len(self)
+        if x_pos not in range(size) or y_pos not in range(size):
+            return False
+        if y_pos + user not in range(size) or x_pos - 1 < 0 or x_pos + 1 >= size:
+            return False
+
+        moving_piece = self.branches[:,y_pos,x_pos]
+        ready = ~self.finished_branches & (moving_piece != 0) & (user * moving_piece.astype(numpy.int64) >= 0)
+        ready &= (self.branches[:,y_pos+user,x_pos-1] == 0) & (self.branches[:,y_pos+user,x_pos+1] == 0)
+        ready &= ~_reached_end(self.branches)
+
+        for side in [1,-1]:
+            capture_possible = numpy.zeros(len(self.branches),dtype=bool)
+            for killers in _capture_masks(self.branches,side):
+                capture_possible |= killers.reshape(len(self.branches),-1).any(axis=1)
+            ready &= ~((moving_piece == side) & capture_possible)
+
+        # The steps may not end the game.
+        ready &= ~((moving_piece == 1) & (y_pos + user == size - 1))
+        ready &= ~((moving_piece == -1) & (y_pos + user == 0))
+        return bool(ready.any())
+
+    def __load_capture_options(self):
+        self.capture_options = []
+        for user in [1,-1]:
+            for direction, killers in enumerate(_capture_masks(self.branches,user)):
+                x_dir, y_dir = DIRECTIONS[direction]
+                for y_pos, x_pos in zip(*numpy.nonzero(killers.any(axis=0))):
+                    self.capture_options.append(CaptureOption(user,int(x_pos),int(y_pos),2*x_dir,2*y_dir))
+
+    def __is_capture_move(self,user,x_pos,y_pos,x_dir,y_dir):
+        return CaptureOption(user,x_pos,y_pos,x_dir,y_dir) in self.capture_options
+
+def _capture_masks(branches,user):
+    """Return, per direction in `DIRECTIONS`, a boolean array of all pieces of the user that can capture that way."""
+    size = branches.shape[1]
+    own = branches == user
+    opponent = branches == -user
+    empty = branches == 0
+
+    def ranges(step):
+        # The killer, victim and landing tiles along one axis.
+        if step > 0:
+            return slice(0,size-2), slice(1,size-1), slice(2,size)
+        return slice(2,size), slice(1,size-1), slice(0,size-2)
+
+    masks = []
+    for x_dir, y_dir in DIRECTIONS:
+        killer_x, victim_x, landing_x = ranges(x_dir)
+        killer_y, victim_y, landing_y = ranges(y_dir)
+
+        killers = numpy.zeros(branches.shape,dtype=bool)
+        if size > 2:
+            killers[:,killer_y,killer_x] = own[:,killer_y,killer_x] & opponent[:,victim_y,victim_x] & empty[:,landing_y,landing_x]
+        masks.append(killers)
+    return masks
+
+def _shifted(branches,x_dir,y_dir):
+    """Return for every tile of every playout the piece `(x_dir,y_dir)` away from it. Tiles beyond the board count as occupied."""
+    size = branches.shape[1]
+    def ranges(step):
+        # The tiles that have a neighbour on the board, and those neighbours, along one axis.
+        if step > 0:
+            return slice(0,max(0,size-step)), slice(step,size)
+        return slice(-step,size), slice(0,max(0,size+step))
+
+    tile_x, neighbour_x = ranges(x_dir)
+    tile_y, neighbour_y = ranges(y_dir)
+    shifted = numpy.ones(branches.shape,dtype=branches.dtype)
+    shifted[:,tile_y,tile_x] = branches[:,neighbour_y,neighbour_x]
+    return shifted
+
+def _reached_end(branches):
+    """Return for every playout whether a piece has reached the opposite side of the board."""
+    return (branches[:,-1,:] == 1).any(axis=1) | (branches[:,0,:] == -1).any(axis=1)
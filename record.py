@@ -0,0 +1,256 @@
+from board import Board, QBoard, Measurement, Move
+
+# A record starts with the size, the population and a flag byte, followed by events and an END event.
+# If the budget flag is set, the branch budget of the board comes right after the flag byte.
+# Every value is a varint: 7 bits per byte, lowest bits first, the top bit set on all bytes but the last.
+# The lowest two bits of an event say what it is; the other bits hold its contents.
+END = 0
+STEP = 1
+SPLIT = 2
+MEASUREMENT = 3
+
+QUANTUM_FLAG = 1
+BUDGET_FLAG = 2
+
+# The four diagonal directions a piece can travel in, as (x_dir, y_dir).
+DIRECTIONS = [(1,1),(-1,1),(1,-1),(-1,-1)]
+
+class GameRecord:
+    def __init__(self,size,population,quantum=False,events=None,max_branches=None):
+        """The moves of a single game, and the measurements they caused.
+        Keyword arguments:
+        size -> the size of the board
+        population -> the amount of rows each player has populated with pieces
+        quantum -> whether the game is played on a quantum board
+        events -> a list of `(move, user)` tuples and `Measurement` objects, in the order they happened
+        max_branches -> the branch budget of the quantum board, which decides when it measures by itself"""
+        self.size = size
+        self.population = population
+        self.quantum = quantum
+        self.max_branches = max_branches
+        self.events = []
+        if events is not None:
+            self.events = list(events)
+
+    def __eq__(self,other):
+        if not isinstance(other,GameRecord):
+            return NotImplemented
+        return ((self.size,self.population,self.quantum,self.max_branches,self.events) ==
+                (other.size,other.population,other.quantum,other.max_branches,other.events))
+
+    def __len__(self):
+        """Return the amount of moves in the game."""
+        return sum(1 for event in self.events if not isinstance(event,Measurement))
+
+    def add_move(self,move,user):
+        """Add a move, either as `(x_pos,y_pos,x_dir,y_dir)` or as `('Q',x_pos,y_pos)`."""
+        self.events.append((tuple(move),user))
+
+    def add_measurement(self,measurement):
+        self.events.append(measurement)
+
+    def moves(self):
+        """Return the moves of the game as `(move, user)` tuples."""
+        return [event for event in self.events if not isinstance(event,Measurement)]
+
+    def measurements(self):
+        return [event for event in self.events if isinstance(event,Measurement)]
+
+    def to_bytes(self):
+        """Encode the game. Moves and measurements take one or two bytes each on boards up to 8 by 8."""
+        data = bytearray()
+        _write_varint(data,self.size)
+        _write_varint(data,self.population)
+        flags = QUANTUM_FLAG if self.quantum else 0
+        if self.max_branches is not None:
+            flags |= BUDGET_FLAG
+        data.append(flags)
+        if self.max_branches is not None:
+            _write_varint(data,self.max_branches)
+
+        for event in self.events:
+            if isinstance(event,Measurement):
+                square = event.y_pos * self.size + event.x_pos
+                _write_varint(data,((square * 3 + event.outcome + 1) << 2) | MEASUREMENT)
+                continue
+
+            move, user = event
+            player = 0 if user == 1 else 1
+            if move[0] == 'Q':
+                square = move[2] * self.size + move[1]
+                _write_varint(data,((square << 1 | player) << 2) | SPLIT)
+                continue
+
+            x_pos, y_pos, x_dir, y_dir = move
+            distance = abs(x_dir)
+            if distance not in [1,2] or abs(y_dir) != distance:
+                raise ValueError("The move {} can't be recorded.".format(move))
+            direction = DIRECTIONS.index((x_dir // distance, y_dir // distance))
+            square = y_pos * self.size + x_pos
+            _write_varint(data,((square << 4 | player << 3 | (distance - 1) << 2 | direction) << 2) | STEP)
+
+        _write_varint(data,END)
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls,data):
+        """Decode a single game."""
+        reader = _ByteReader(iter([data]))
+        record = cls._read(reader)
+        if record is None:
+            raise ValueError("There is no game in the given data.")
+        return record
+
+    @classmethod
+    def _read(cls,reader):
+        """Read the next game from a `_ByteReader`, or return None at the end of the data."""
+        size = reader.varint()
+        if size is None:
+            return None
+        population = reader.varint()
+        flags = reader.byte()
+        if population is None or flags is None:
+            raise ValueError("The game record has been cut off.")
+
+        max_branches = None
+        if flags & BUDGET_FLAG:
+            max_branches = reader.varint()
+            if max_branches is None:
+                raise ValueError("The game record has been cut off.")
+
+        record = cls(size,population,bool(flags & QUANTUM_FLAG),max_branches=max_branches)
+        while True:
+            value = reader.varint()
+            if value is None:
+                raise ValueError("The game record has been cut off.")
+
+            kind = value & 3
+            value >>= 2
+            if kind == END:
+                return record
+
+            if kind == MEASUREMENT:
+                square, outcome = divmod(value,3)
+                y_pos, x_pos = divmod(square,size)
+                record.events.append(Measurement(x_pos,y_pos,outcome - 1))
+            elif kind == SPLIT:
+                user = -1 if value & 1 else 1
+                y_pos, x_pos = divmod(value >> 1,size)
+                record.events.append((('Q',x_pos,y_pos),user))
+            else:
+                x_dir, y_dir = DIRECTIONS[value & 3]
+                distance = ((value >> 2) & 1) + 1
+                user = -1 if (value >> 3) & 1 else 1
+                y_pos, x_pos = divmod(value >> 4,size)
+                record.events.append(((x_pos,y_pos,distance*x_dir,distance*y_dir),user))
+
+def write_record(stream,record):
+    """Add a game to the end of a binary file."""
+    stream.write(record.to_bytes())
+
+def read_records(stream,chunk_size=65536):
+    """Yield the games in a binary file one by one, reading it in chunks, so an archive never has to fit in memory."""
+    def chunks():
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    reader = _ByteReader(chunks())
+    while True:
+        record = GameRecord._read(reader)
+        if record is None:
+            return
+        yield record
+
+def replay(record,board=None):
+    """Play a recorded game again, and yield `(move, user, answer)` after every move.
+    On a quantum board, the measurements come out as recorded. The board is made from the record, unless one is given."""
+    if board is None:
+        board = _new_board(record)
+    if record.quantum:
+        board.replay_measurements(record.measurements())
+
+    for move, user in record.moves():
+        if move[0] == 'Q':
+            answer = board.quantum_split(move[1],move[2],user)
+        else:
+            answer = board.move(move[0],move[1],move[2],move[3],user)
+        yield move, user, answer
+
+def replay_records(stream):
+    """Replay every game in a binary file, one at a time. Yields `(record, board)` after each game has been replayed."""
+    for record in read_records(stream):
+        board = _new_board(record)
+        for step in replay(record,board):
+            pass
+        yield record, board
+
+def _new_board(record):
+    if record.quantum:
+        return QBoard(record.size,record.population,max_branches=record.max_branches)
+    return Board(record.size,record.population)
+
+def is_accepted(answer):
+    """Return whether a move changed the game, judging by what `move()` or `quantum_split()` answered."""
+    accepted = [Move.success_opponents_turn,Move.success_same_turn,Move.finish]
+    if isinstance(answer,list):
+        return any(response in accepted for response in answer)
+    return answer in accepted
+
+def game_winner(board,user,reason,quantum):
+    """Return the winning player of a game that ended for the given reason, or None if there is none.
+    The reason is 'no_moves' if `user` had no legal move left, 'finished' if the board finished, and anything else for a draw."""
+    if reason == 'no_moves':
+        # A player that can't move anymore has lost.
+        return -user
+    if reason != 'finished':
+        return None
+    if not quantum:
+        return board.winner
+
+    # Every playout has its own winner; the player that won most of them wins the game.
+    score = 0
+    for branch, weight in zip(board.board_list,board.multiplicity):
+        score += weight * branch.winner
+    if score == 0:
+        return None
+    return 1 if score > 0 else -1
+
+def _write_varint(data,value):
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+
+class _ByteReader:
+    """Reads bytes and varints from an iterator of byte strings."""
+    def __init__(self,chunks):
+        self.__chunks = chunks
+        self.__buffer = b''
+        self.__position = 0
+
+    def byte(self):
+        if self.__position >= len(self.__buffer):
+            self.__buffer = next(self.__chunks,b'')
+            self.__position = 0
+            if not self.__buffer:
+                return None
+        value = self.__buffer[self.__position]
+        self.__position += 1
+        return value
+
+    def varint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.byte()
+            if byte is None:
+                if shift > 0:
+                    raise ValueError("The game record has been cut off.")
+                return None
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
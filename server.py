@@ -0,0 +1,335 @@
+from board import Board, QBoard, Move
+from record import GameRecord, game_winner, is_accepted
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import itertools
+import random
+
+# Lines from clients longer than this are refused, so a client can't make the server buffer without end.
+LINE_LIMIT = 1024
+# The largest board a client can ask for. Every board is built on the event loop, so a huge one would stall every game.
+MAX_SIZE = 100
+
+class Session:
+    def __init__(self,number,quantum,size,population,seed=None,max_branches=None):
+        """A single game on the server, with a seat for both players.
+        Keyword arguments:
+        number -> the number clients use to join the session
+        quantum -> play on a QBoard instead of a Board
+        size -> the size of the board
+        population -> the amount of rows each player has populated with pieces
+        seed -> the seed of the measurements of a quantum game
+        max_branches -> the branch budget of a quantum game, or None for no limit"""
+        self.number = number
+        self.quantum = quantum
+        self.rng = random.Random(seed)
+        if quantum:
+            self.board = QBoard(size,population,rng=self.rng,max_branches=max_branches)
+            self.record = GameRecord(size,population,quantum,max_branches=max_branches)
+        else:
+            self.board = Board(size,population)
+            self.record = GameRecord(size,population,quantum)
+        self.player_turn = 1
+        self.players = {1: None, -1: None}
+        # Only one move is made at a time, even while a move is being worked out in the pool.
+        self.lock = asyncio.Lock()
+
+    def is_full(self):
+        return self.players[1] is not None and self.players[-1] is not None
+
+class Connection:
+    """A client of the server, and the seat it has taken."""
+    def __init__(self,reader,writer):
+        self.reader = reader
+        self.writer = writer
+        self.session = None
+        self.player = None
+        self.closed = False
+
+class GameServer:
+    def __init__(self,host='127.0.0.1',port=7777,idle_timeout=300,write_timeout=10,workers=1,offload_branches=64,max_sessions=10000,max_branches=None):
+        """Host many games of (quantum) checkers at once over TCP, one line of text per command.
+        Keyword arguments:
+        host -> the address to listen on
+        port -> the port to listen on; 0 picks a free one
+        idle_timeout -> the amount of seconds a client may stay silent before it's disconnected
+        write_timeout -> the amount of seconds a client may take to read what it's sent before it's disconnected
+        workers -> the amount of processes that make heavy quantum moves; 0 makes every move on the event loop
+        offload_branches -> quantum moves on boards with at least this many playouts are made in a worker process
+        max_sessions -> the amount of games that can be played at the same time
+        max_branches -> the most positions a quantum game may store, which bounds its memory and the time a move takes"""
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.write_timeout = write_timeout
+        self.workers = workers
+        self.offload_branches = offload_branches
+        self.max_sessions = max_sessions
+        self.max_branches = max_branches
+
+        self.sessions = {}
+        self.__numbers = itertools.count(1)
+        self.__server = None
+        self.__pool = None
+
+    async def start(self):
+        """Start listening. The port that is listened on ends up in `Object.port`."""
+        if self.workers > 0:
+            self.__pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.__server = await asyncio.start_server(self.__handle,self.host,self.port,limit=LINE_LIMIT)
+        self.port = self.__server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    async def close(self):
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    async def __handle(self,reader,writer):
+        connection = Connection(reader,writer)
+        try:
+            await self.__send(connection,"HELLO")
+            while not connection.closed:
+                try:
+                    line = await asyncio.wait_for(reader.readline(),self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self.__send(connection,"ERROR idle timeout")
+                    break
+                except ValueError:
+                    # The line was longer than the limit of the reader.
+                    await self.__send(connection,"ERROR line too long")
+                    break
+                if not line:
+                    break
+                try:
+                    await self.__command(connection,line.decode('ascii','replace').split())
+                except ConnectionError:
+                    raise
+                except Exception:
+                    # A command that goes wrong in an unforeseen way only costs the client an answer, not its connection.
+                    await self.__send(connection,"ERROR internal error")
+        except ConnectionError:
+            pass
+        finally:
+            await self.__leave(connection)
+            connection.closed = True
+            writer.close()
+
+    async def __command(self,connection,words):
+        if not words:
+            return
+        command = words[0].upper()
+
+        if command == 'NEW':
+            await self.__new_session(connection,words[1:])
+        elif command == 'JOIN':
+            await self.__join_session(connection,words[1:])
+        elif command == 'BOARD':
+            await self.__show_board(connection)
+        elif command == 'QUIT':
+            connection.closed = True
+        else:
+            try:
+                move = parse_move(words)
+            except ValueError:
+                await self.__send(connection,"ERROR unknown command")
+                return
+            await self.__move(connection,move)
+
+    async def __new_session(self,connection,arguments):
+        """NEW [Q|C] [size] [population] [seed]: open a game and take the seat of player 1."""
+        if connection.session is not None:
+            await self.__send(connection,"ERROR already in a session")
+            return
+        if len(self.sessions) >= self.max_sessions:
+            await self.__send(connection,"ERROR server full")
+            return
+
+        try:
+            mode = arguments[0].upper() if arguments else 'Q'
+            if mode not in ['Q','C']:
+                raise ValueError("A game is either quantum (Q) or classic (C), not '{}'.".format(arguments[0]))
+            quantum = mode == 'Q'
+            size = int(arguments[1]) if len(arguments) > 1 else 10
+            population = int(arguments[2]) if len(arguments) > 2 else 3
+            seed = int(arguments[3]) if len(arguments) > 3 else None
+            if not 2 <= size <= MAX_SIZE or not 1 <= population <= size // 2:
+                raise ValueError("The board has to be from 2 to {} tiles wide, with room for at least one row of pieces per player.".format(MAX_SIZE))
+            session = Session(next(self.__numbers),quantum,size,population,seed,self.max_branches)
+        except ValueError:
+            await self.__send(connection,"ERROR invalid game settings")
+            return
+
+        self.sessions[session.number] = session
+        self.__seat(connection,session,1)
+        await self.__send(connection,"SESSION {} PLAYER 1".format(session.number))
+
+    async def __join_session(self,connection,arguments):
+        """JOIN number: take the seat of player 2 in an open game."""
+        if connection.session is not None:
+            await self.__send(connection,"ERROR already in a session")
+            return
+        try:
+            session = self.sessions[int(arguments[0])]
+        except (IndexError, ValueError, KeyError):
+            await self.__send(connection,"ERROR no such session")
+            return
+        if session.is_full():
+            await self.__send(connection,"ERROR session full")
+            return
+
+        player = 1 if session.players[1] is None else -1
+        self.__seat(connection,session,player)
+        await self.__send(connection,"SESSION {} PLAYER {}".format(session.number,player))
+        await self.__broadcast(session,"START","TURN {}".format(session.player_turn))
+
+    async def __show_board(self,connection):
+        if connection.session is None:
+            await self.__send(connection,"ERROR not in a session")
+            return
+        board = connection.session.board
+        rows = board.quantum_board if connection.session.quantum else board.board
+        await self.__send(connection,*["ROW " + ' '.join(str(value) for value in row) for row in rows],"END")
+
+    async def __move(self,connection,move):
+        session = connection.session
+        if session is None:
+            await self.__send(connection,"ERROR not in a session")
+            return
+
+        async with session.lock:
+            if not session.is_full():
+                await self.__send(connection,"ERROR waiting for opponent")
+                return
+            if session.board.finished:
+                await self.__send(connection,"ERROR game finished")
+                return
+            if session.player_turn != connection.player:
+                await self.__send(connection,"ERROR not your turn")
+                return
+            if move[0] == 'Q' and not session.quantum:
+                await self.__send(connection,"ERROR no quantum moves in this game")
+                return
+
+            answer = await self.__play(session,move,connection.player)
+            answers = answer if isinstance(answer,list) else [answer]
+            text = ' '.join(response.name for response in answers)
+            if not is_accepted(answer):
+                await self.__send(connection,"REFUSED " + text)
+                return
+
+            session.record.add_move(move,connection.player)
+            moved = "MOVED {} {} {}".format(connection.player,' '.join(str(value) for value in move),text)
+            if session.board.finished:
+                # On a quantum board, the playouts can have different winners; the one that won most of them wins the game.
+                winner = game_winner(session.board,session.player_turn,'finished',session.quantum)
+                await self.__broadcast(session,moved,"DRAW" if winner is None else "WINNER {}".format(winner))
+                return
+            if Move.success_opponents_turn in answers:
+                session.player_turn *= -1
+            await self.__broadcast(session,moved,"TURN {}".format(session.player_turn))
+
+    async def __play(self,session,move,player):
+        """Make the move. Quantum moves on large boards are made in the pool, so the other games carry on meanwhile."""
+        board = session.board
+        if session.quantum and self.__pool is not None and board.branch_count() >= self.offload_branches:
+            seed = session.rng.getrandbits(64)
+            loop = asyncio.get_running_loop()
+            # The board goes to the worker and back as it is. The pool pickles and unpickles it in threads of its own,
+            # so the event loop doesn't spend any time on the playouts.
+            answer, played = await loop.run_in_executor(self.__pool,_play_board,board,move,player,seed)
+
+            measurements = played.measurements[len(board.measurements):]
+            played.rng = session.rng
+            session.board = played
+        else:
+            measured = len(board.measurements) if session.quantum else 0
+            # With sys.stdout set to None, the warnings of jumps over friendly pieces aren't printed.
+            with contextlib.redirect_stdout(None):
+                answer = board.play(move,player)
+            measurements = board.measurements[measured:] if session.quantum else []
+
+        for measurement in measurements:
+            session.record.add_measurement(measurement)
+        return answer
+
+    def __seat(self,connection,session,player):
+        connection.session = session
+        connection.player = player
+        session.players[player] = connection
+
+    async def __leave(self,connection):
+        """Give up the seat of a client that has gone. The game is over once both players are gone."""
+        session = connection.session
+        if session is None:
+            return
+        session.players[connection.player] = None
+        connection.session = None
+
+        opponent = session.players[-connection.player]
+        if opponent is None:
+            self.sessions.pop(session.number,None)
+        else:
+            await self.__send(opponent,"LEFT {}".format(connection.player))
+
+    async def __broadcast(self,session,*lines):
+        for player in [1,-1]:
+            if session.players[player] is not None:
+                await self.__send(session.players[player],*lines)
+
+    async def __send(self,connection,*lines):
+        """Send lines to a client. A client that doesn't read what it's sent in time is disconnected."""
+        if connection.closed:
+            return
+        connection.writer.write(''.join(line + '\n' for line in lines).encode('ascii'))
+        try:
+            await asyncio.wait_for(connection.writer.drain(),self.write_timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            connection.closed = True
+            connection.writer.close()
+
+def parse_move(words):
+    """Turn the words of a move, `x y dx dy` or `Q x y`, into a tuple like `legal_moves()` yields."""
+    if len(words) == 3 and words[0].upper() == 'Q':
+        return ('Q',int(words[1]),int(words[2]))
+    if len(words) == 4:
+        return tuple(int(word) for word in words)
+    raise ValueError("A move is either 'x y dx dy' or 'Q x y'.")
+
+def _play_board(board,move,player,seed):
+    """Make a move on a quantum board in a worker process, drawing its measurements from the given seed.
+    Returns the answer and the board after the move, with its measurements and budget counters."""
+    board.rng = random.Random(seed)
+    with contextlib.redirect_stdout(None):
+        answer = board.play(move,player)
+    return answer, board
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Host games of (quantum) checkers over TCP.")
+    parser.add_argument('--host',default='127.0.0.1')
+    parser.add_argument('--port',type=int,default=7777)
+    parser.add_argument('--idle-timeout',type=float,default=300)
+    parser.add_argument('--workers',type=int,default=1)
+    parser.add_argument('--offload-branches',type=int,default=64)
+    parser.add_argument('--max-branches',type=int,help="the most positions a quantum game may store")
+    options = parser.parse_args(arguments)
+
+    server = GameServer(options.host,options.port,options.idle_timeout,workers=options.workers,offload_branches=options.offload_branches,
+                        max_branches=options.max_branches)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+from board import Board, QBoard, Move
+from engine import Engine, QEngine
+from record import GameRecord, game_winner
+import argparse
+import contextlib
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+class RandomPolicy:
+    """Play any legal move."""
+    def choose(self,board,user,rng):
+        return rng.choice(list(board.legal_moves(user)))
+
+class GreedyCapturePolicy:
+    """Capture whenever possible, and play any legal move otherwise."""
+    def choose(self,board,user,rng):
+        moves = list(board.legal_moves(user))
+        captures = [move for move in moves if move[0] != 'Q' and (user,) + move in board.capture_options]
+        if captures:
+            return rng.choice(captures)
+        return rng.choice(moves)
+
+class EnginePolicy:
+    def __init__(self,engine=None):
+        """Let an engine pick the moves. Without an engine, a quick `Engine` or `QEngine` is made, depending on the board."""
+        self.engine = engine
+
+    def choose(self,board,user,rng):
+        if self.engine is None:
+            if isinstance(board,QBoard):
+                self.engine = QEngine(iterations=100,seed=rng.getrandbits(64))
+            else:
+                self.engine = Engine(max_depth=3)
+        return self.engine.search(board,user)
+
+POLICIES = {'random': RandomPolicy, 'greedy': GreedyCapturePolicy, 'engine': EnginePolicy}
+
+def make_policy(policy):
+    """Turn a policy name from `POLICIES` into a policy; policy objects are returned as they are."""
+    if isinstance(policy,str):
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy '{}', pick one of {}.".format(policy,', '.join(POLICIES)))
+        return POLICIES[policy]()
+    return policy
+
+def play_game(seed,quantum=False,size=8,population=3,policies=('random','random'),max_moves=500,record=False,max_branches=None):
+    """Play a single game without any input or output, and return a dictionary that describes how it went.
+    The seed fixes the choices of the policies as well as the measurements of a quantum game.
+    Keyword arguments:
+    seed -> the seed of the game
+    quantum -> play on a QBoard instead of a Board
+    size -> the size of the board
+    population -> the amount of rows each player has populated with pieces
+    policies -> the policies of player 1 and player -1, as names or objects
+    max_moves -> the amount of moves after which the game is called off
+    record -> add the binary `GameRecord` of the game to the result, as `record`
+    max_branches -> the branch budget of a quantum board, or None for no limit"""
+    players = {1: make_policy(policies[0]), -1: make_policy(policies[1])}
+    rng = random.Random(seed)
+
+    # With sys.stdout set to None, the warnings of jumps over friendly pieces aren't printed.
+    with contextlib.redirect_stdout(None):
+        if quantum:
+            board = QBoard(size,population,rng=rng.getrandbits(64),max_branches=max_branches)
+            game_record = GameRecord(size,population,quantum,max_branches=max_branches)
+        else:
+            board = Board(size,population)
+            game_record = GameRecord(size,population,quantum)
+        result = _play(board,players,rng,quantum,max_moves,game_record)
+
+    result['seed'] = seed
+    if record:
+        result['record'] = game_record.to_bytes()
+    return result
+
+def _play(board,players,rng,quantum,max_moves,game_record):
+    user = 1
+    moves = 0
+    branch_peak = 1
+    latencies = []
+    measured = 0
+    reason = 'move_limit'
+
+    while moves < max_moves:
+        if board.finished:
+            reason = 'finished'
+            break
+        if not any(True for move in board.legal_moves(user)):
+            reason = 'no_moves'
+            break
+
+        start = time.perf_counter()
+        move = players[user].choose(board,user,rng)
+        answer = board.play(move,user)
+        latencies.append(time.perf_counter() - start)
+        moves += 1
+
+        game_record.add_move(move,user)
+        if quantum:
+            for measurement in board.measurements[measured:]:
+                game_record.add_measurement(measurement)
+            measured = len(board.measurements)
+
+        if quantum:
+            branch_peak = max(branch_peak,board.branch_count())
+            passed = Move.success_opponents_turn in answer
+        else:
+            passed = answer == Move.success_opponents_turn
+        if passed:
+            user = -user
+
+    if reason == 'move_limit' and board.finished:
+        reason = 'finished'
+
+    return {
+        'winner': game_winner(board,user,reason,quantum),
+        'reason': reason,
+        'length': moves,
+        'branch_peak': branch_peak,
+        'mean_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+        'max_latency': max(latencies) if latencies else 0.0,
+    }
+
+def simulate(games,quantum=False,size=8,population=3,policies=('random','random'),workers=1,seed=0,output=None,max_moves=500,records=None,max_branches=None):
+    """Play a batch of games and return a summary of the results.
+    Game `i` is played with seed `seed + i`, so the results don't depend on the amount of workers.
+    The result of every game is written to the output as a line of JSON as soon as it's done.
+    Keyword arguments:
+    games -> the amount of games to play
+    workers -> the amount of processes to spread the games over
+    output -> a file object to write the results to; nothing is written if None
+    records -> a binary file object to write the `GameRecord` of every game to; nothing is written if None
+    The other arguments are passed on to `play_game()`."""
+    settings = (quantum,size,population,tuple(policies),max_moves,records is not None,max_branches)
+    seeds = [seed + game for game in range(games)]
+    wins = {1: 0, -1: 0, None: 0}
+
+    start = time.perf_counter()
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            # Small chunks keep every worker busy until the end, while still writing results as they come in.
+            chunk_size = max(1,games // (workers * 8))
+            for result in pool.imap_unordered(_play_seed,[(game_seed,settings) for game_seed in seeds],chunk_size):
+                _record(result,output,records,wins)
+    else:
+        for game_seed in seeds:
+            _record(_play_seed((game_seed,settings)),output,records,wins)
+    seconds = time.perf_counter() - start
+
+    return {
+        'games': games,
+        'seconds': seconds,
+        'games_per_second': games / seconds if seconds > 0 else 0.0,
+        'wins': wins,
+    }
+
+def _play_seed(job):
+    game_seed, (quantum, size, population, policies, max_moves, record, max_branches) = job
+    return play_game(game_seed,quantum,size,population,policies,max_moves,record,max_branches)
+
+def _record(result,output,records,wins):
+    wins[result['winner']] += 1
+    if records is not None:
+        records.write(result.pop('record'))
+    if output is not None:
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Play games of (quantum) checkers without any input.")
+    parser.add_argument('--games',type=int,default=100)
+    parser.add_argument('--quantum',action='store_true',help="play on a QBoard")
+    parser.add_argument('--size',type=int,default=8)
+    parser.add_argument('--population',type=int,default=3)
+    parser.add_argument('--policies',nargs=2,default=['random','random'],choices=sorted(POLICIES))
+    parser.add_argument('--workers',type=int,default=multiprocessing.cpu_count())
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--max-moves',type=int,default=500)
+    parser.add_argument('--output',help="file to write the results to, one line of JSON per game")
+    parser.add_argument('--records',help="file to write the binary record of every game to")
+    parser.add_argument('--max-branches',type=int,help="the most positions a quantum board may store")
+    options = parser.parse_args(arguments)
+
+    output = open(options.output,'w') if options.output else None
+    records = open(options.records,'wb') if options.records else None
+    try:
+        summary = simulate(options.games,options.quantum,options.size,options.population,options.policies,
+                           options.workers,options.seed,output,options.max_moves,records,options.max_branches)
+    finally:
+        if output is not None:
+            output.close()
+        if records is not None:
+            records.close()
+
+    print("{} games in {:.2f} seconds ({:.1f} games/s)".format(summary['games'],summary['seconds'],summary['games_per_second']))
+    print("Player 1: {}, player 2: {}, no winner: {}".format(summary['wins'][1],summary['wins'][-1],summary['wins'][None]))
+    return summary
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,422 @@
+from board import CaptureIndex, CaptureOption, Move, UndoEntry, zobrist_keys
+from board import BOARD_HEADER, BOARD_MAGIC, SNAPSHOT_VERSION, _unpack_header
+import copy
+import struct
+
+class SparseBoard:
+    def __init__(self,size,population):
+        """Create a new board to play a game of checkers on, that only stores the squares that hold a piece.
+        The class plays by exactly the same rules as `Board` and returns the same `Move` values, but the memory it takes
+        and the time a move takes depend on the amount of pieces, not on the size of the board.
+        Keyword arguments:
+        size -> the size of the board
+        population -> the amount of rows each player has populated with pieces"""
+
+        if size < 2 * population:
+            raise ValueError("Game board not big enough to fit population for both players.")
+
+        self.size = size
+        # The piece on every occupied square, by square number `y_pos*size+x_pos`.
+        self.pieces = {}
+        self.capture_options = CaptureIndex()
+        self.finished = False
+        self.winner = None
+        self.turn = 1
+        self.undo_stack = []
+        self.__journal = None
+        self.__square_keys, self.__side_key = zobrist_keys(size)
+        self.zobrist = 0
+
+        for row in range(size):
+            if row < population or row > size - population - 1:
+                player = 1 if row < population else -1
+                for column in range(row % 2,size,2):
+                    self.pieces[row*size + column] = player
+                    self.zobrist ^= self.__square_keys[player][row*size + column]
+        self.__count_pieces()
+
+    def __repr__(self):
+        """Display the board to the terminal, if wished."""
+        board = self.board
+        answer = '\n'
+        for i in range(len(self)):
+            for j in range(len(self)):
+                if (i+j)%2 == 0:
+                    answer += '{}'.format(board[i][j])
+                else:
+                    answer += '-'
+                answer += '\t'
+            answer += '\n'
+        return answer
+
+    def __len__(self):
+        """Return the size of the board. One dimension is provided, not all squares comined."""
+        return self.size
+
+    @property
+    def board(self):
+        """The current game state as a list of lists, in the same layout as `Board.board`. It's built anew on every call."""
+        rows = [[0] * self.size for row in range(self.size)]
+        for square, piece in self.pieces.items():
+            rows[square // self.size][square % self.size] = piece
+        return rows
+
+    def piece_at(self,x_pos,y_pos):
+        """Return the piece on a tile: 1, -1, or 0 if it's empty or off the board."""
+        if 0 <= x_pos < self.size and 0 <= y_pos < self.size:
+            return self.pieces.get(y_pos*self.size + x_pos,0)
+        return 0
+
+    def occupied(self):
+        """Return a list of `(x_pos,y_pos,piece)` for every piece on the board, row by row."""
+        return [(square % self.size,square // self.size,self.pieces[square]) for square in sorted(self.pieces)]
+
+    def same_squares(self,other):
+        """Return whether both boards have the same pieces on the same squares."""
+        return self.pieces == other.pieces
+
+    def pass_turn(self,user):
+        """Put the user on turn without making a move, keeping `zobrist` up to date, like `Board.pass_turn()`."""
+        self.__pass_turn(user)
+
+    def piece_count(self,user):
+        """Return the amount of pieces the user has left on the board."""
+        if user == 1:
+            return self.__player1_pieces
+        return self.__player2_pieces
+
+    def move(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Move a certain piece, if possible. Returns the same `Move` value as `Board.move()` would.
+        Just like on a `BitBoard`, a piece position outside of the board is reported as `Move.no_piece_found`."""
+        refusal = self.__check_move(x_pos,y_pos,x_dir,y_dir,user)
+        if refusal is not None:
+            return refusal
+
+        moving_piece = self.piece_at(x_pos,y_pos)
+        if abs(x_dir) == 1:
+            return self.__move_single_tile(moving_piece,x_pos,y_pos,x_dir,y_dir,user)
+        return self.__move_double_tile(moving_piece,x_pos,y_pos,x_dir,y_dir,user)
+
+    def is_legal(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Return whether `move()` would accept the given move, without making it."""
+        return self.__check_move(x_pos,y_pos,x_dir,y_dir,user) is None
+
+    def make_move(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Make a move just like `move()`, but remember how to take it back, just like `Board.make_move()`."""
+        self.__journal = UndoEntry(self.finished,self.winner,self.turn,self.zobrist)
+        try:
+            return self.move(x_pos,y_pos,x_dir,y_dir,user)
+        finally:
+            self.undo_stack.append(self.__journal)
+            self.__journal = None
+
+    def unmake_move(self):
+        """Take back the last move made with `make_move()`."""
+        entry = self.undo_stack.pop()
+
+        for x_pos, y_pos, value in reversed(entry.squares):
+            self.__write_square(y_pos*self.size + x_pos,value)
+
+        for option in entry.added_options:
+            self.capture_options.discard(option)
+        for index, option in reversed(entry.removed_options):
+            self.capture_options.insert(index,option)
+
+        self.finished = entry.finished
+        self.winner = entry.winner
+        self.turn = entry.turn
+        self.zobrist = entry.zobrist
+
+    def copy(self):
+        """Return an independent copy of the board, without its undo history. It copies the pieces only, not the empty squares."""
+        duplicate = copy.copy(self)
+        duplicate.pieces = dict(self.pieces)
+        duplicate.capture_options = self.capture_options.copy()
+        duplicate.undo_stack = []
+        return duplicate
+
+    def legal_moves(self,user):
+        """Yield every move `move()` would accept from the user, in the same order as `Board.legal_moves()`."""
+        if self.finished:
+            return
+
+        if self.capture_options.has_user(user):
+            for option in self.capture_options.for_user(user):
+                yield (option.x_pos,option.y_pos,option.x_dir,option.y_dir)
+            return
+
+        for x_pos, y_pos, piece in self.occupied():
+            if user * piece < 0:
+                continue
+
+            # Regular steps can only go forward.
+            for x_dir in [-1,1]:
+                if 0 <= x_pos + x_dir < self.size and 0 <= y_pos + piece < self.size:
+                    if self.piece_at(x_pos+x_dir,y_pos+piece) == 0:
+                        yield (x_pos,y_pos,x_dir,piece)
+
+            # Without any capture to make, jumping over a friendly piece is allowed as well.
+            for x_dir, y_dir in [(2,2),(-2,2),(2,-2),(-2,-2)]:
+                if 0 <= x_pos + x_dir < self.size and 0 <= y_pos + y_dir < self.size:
+                    if self.piece_at(x_pos+x_dir,y_pos+y_dir) == 0 and self.piece_at(x_pos+(x_dir//2),y_pos+(y_dir//2)) != 0:
+                        yield (x_pos,y_pos,x_dir,y_dir)
+
+    def play(self,move,user):
+        """Make a move as yielded by `legal_moves()`."""
+        return self.move(move[0],move[1],move[2],move[3],user)
+
+    def to_bytes(self):
+        """Return a snapshot in the same format as `Board.to_bytes()`, so either class can load it."""
+        header = struct.pack(BOARD_HEADER,BOARD_MAGIC,SNAPSHOT_VERSION,int(self.finished),self.winner or 0,self.turn,self.size,self.zobrist)
+        squares = bytearray(self.size * self.size)
+        for square, piece in self.pieces.items():
+            squares[square] = piece & 0xFF
+        return header + bytes(squares)
+
+    @classmethod
+    def from_bytes(cls,data):
+        """Load a snapshot made by `to_bytes()` of either class."""
+        view = memoryview(data)
+        magic, version, finished, winner, turn, size, zobrist = _unpack_header(BOARD_HEADER,BOARD_MAGIC,view,0)
+        offset = struct.calcsize(BOARD_HEADER)
+        squares = view[offset:offset+size*size]
+        if len(squares) < size * size:
+            raise ValueError("The snapshot has been cut off.")
+        return cls._restore(squares.cast('b'),0,size,finished,winner,turn,zobrist)
+
+    @classmethod
+    def _restore(cls,squares,offset,size,finished,winner,turn,zobrist):
+        """Build a board from a block of squares, like `Board._restore()` does."""
+        board = cls.__new__(cls)
+        board.size = size
+        block = squares[offset:offset+size*size]
+        board.pieces = {square: piece for square, piece in enumerate(block.tolist()) if piece != 0}
+        board.finished = bool(finished)
+        board.winner = winner or None
+        board.turn = turn
+        board.undo_stack = []
+        board.__journal = None
+        board.__square_keys, board.__side_key = zobrist_keys(size)
+        board.zobrist = zobrist
+        board.__count_pieces()
+        board.capture_options = board.__find_capture_options()
+        return board
+
+    def square_hash(self):
+        """Return the Zobrist hash of the squares only, leaving out the side to move. It's the same as that of a `Board`."""
+        if self.turn == -1:
+            return self.zobrist ^ self.__side_key
+        return self.zobrist
+
+    def quantum_move(self,x_pos,y_pos,user):
+        """Return whether the piece can make a quantum move, just like `Board.quantum_move()`."""
+        if not (0 <= x_pos < self.size and 0 <= y_pos < self.size):
+            return False
+
+        for x_dir in [-1,1]:
+            if self.__check_move(x_pos,y_pos,x_dir,user,user) is not None:
+                return False
+            if self.__finishes_step(y_pos+user,self.piece_at(x_pos,y_pos)):
+                return False
+        return True
+
+    def __move_single_tile(self,moving_piece,x_pos,y_pos,x_dir,y_dir,user):
+        self.__set_square(x_pos+x_dir,y_pos+y_dir,moving_piece)
+        self.__set_square(x_pos,y_pos,0)
+        self.__refresh_capture_options()
+
+        # Look for kills that appear now the user has left the space empty.
+        for x_direct, y_direct in [(2,2),(2,-2),(-2,2),(-2,-2)]:
+            self.__consider_capture(x_pos-x_direct,y_pos-y_direct,x_direct,y_direct)
+        # Look for kills that appear because the user stepped on the new tile.
+        for x_killer, y_killer in [(1,1),(1,-1),(-1,1),(-1,-1)]:
+            self.__consider_capture(x_pos+x_dir-x_killer,y_pos+y_dir-y_killer,2*x_killer,2*y_killer)
+        # Last, look if the user could kill someone next turn.
+        for x_direct, y_direct in [(2,2),(2,-2),(-2,2),(-2,-2)]:
+            self.__consider_capture(x_pos+x_dir,y_pos+y_dir,x_direct,y_direct)
+
+        self.__pass_turn(-user)
+        if self.__reached_end():
+            self.__finish(user)
+            return Move.finish
+        return Move.success_opponents_turn
+
+    def __move_double_tile(self,moving_piece,x_pos,y_pos,x_dir,y_dir,user):
+        try:
+            self.__remove_capture_option(CaptureOption(moving_piece,x_pos,y_pos,x_dir,y_dir))
+        except ValueError:
+            print("WARNING: Failed attempt to remove a CaptureOption that wasn\'t present.")
+
+        self.__set_square(x_pos,y_pos,0)
+        self.__set_square(x_pos+(x_dir//2),y_pos+(y_dir//2),0)
+        self.__set_square(x_pos+x_dir,y_pos+y_dir,moving_piece)
+        self.__refresh_capture_options()
+
+        # Look for kills that appear now the user has left their own space and the victim's space empty.
+        for x_direct, y_direct in [(2,2),(2,-2),(-2,2),(-2,-2)]:
+            self.__consider_capture(x_pos-x_direct,y_pos-y_direct,x_direct,y_direct)
+        for x_direct, y_direct in [(2,2),(2,-2),(-2,2),(-2,-2)]:
+            self.__consider_capture(x_pos+(x_dir//2)-x_direct,y_pos+(y_dir//2)-y_direct,x_direct,y_direct)
+        # Look for kills that appear because the user stepped on the new tile.
+        for x_killer, y_killer in [(1,1),(1,-1),(-1,1),(-1,-1)]:
+            self.__consider_capture(x_pos+x_dir-x_killer,y_pos+y_dir-y_killer,2*x_killer,2*y_killer)
+        # Last, look if the user could kill someone next turn.
+        another_capture_found = False
+        for x_direct, y_direct in [(2,2),(2,-2),(-2,2),(-2,-2)]:
+            if self.__consider_capture(x_pos+x_dir,y_pos+y_dir,x_direct,y_direct):
+                another_capture_found = True
+
+        if another_capture_found and not self.__victory_found():
+            self.__pass_turn(user)
+        else:
+            self.__pass_turn(-user)
+
+        if self.__victory_found():
+            self.__finish(user)
+            return Move.finish
+        if another_capture_found:
+            return Move.success_same_turn
+        return Move.success_opponents_turn
+
+    def __check_move(self,x_pos,y_pos,x_dir,y_dir,user):
+        """Return the reason why a move can't be made, or None if `move()` would accept it."""
+        if self.finished:
+            return Move.finish
+        if not (0 <= x_pos + x_dir < self.size and 0 <= y_pos + y_dir < self.size):
+            return Move.out_of_bounds
+
+        moving_piece = self.piece_at(x_pos,y_pos)
+        if moving_piece == 0 or user * moving_piece < 0:
+            return Move.no_piece_found
+        if abs(x_dir) != abs(y_dir) or x_dir == 0 or abs(x_dir) > 2:
+            return Move.invalid_destination
+        if self.piece_at(x_pos+x_dir,y_pos+y_dir) != 0:
+            return Move.path_blocked
+
+        # The user has to capture if possible.
+        if self.capture_options.has_user(moving_piece):
+            if (moving_piece,x_pos,y_pos,x_dir,y_dir) not in self.capture_options:
+                return Move.capture_ignored
+
+        if abs(x_dir) == 1 and moving_piece * y_dir < 0:
+            return Move.invalid_destination
+        if abs(x_dir) == 2 and self.piece_at(x_pos+(x_dir//2),y_pos+(y_dir//2)) == 0:
+            return Move.no_victim_found
+        return None
+
+    def __set_square(self,x_pos,y_pos,value):
+        square = y_pos*self.size + x_pos
+        previous_value = self.pieces.get(square,0)
+        if self.__journal is not None:
+            self.__journal.squares.append((x_pos,y_pos,previous_value))
+        self.__write_square(square,value)
+
+        if previous_value != 0:
+            self.zobrist ^= self.__square_keys[previous_value][square]
+        if value != 0:
+            self.zobrist ^= self.__square_keys[value][square]
+
+    def __write_square(self,square,value):
+        """Put a value on a square and keep the piece counters up to date, without touching the hash or the undo history."""
+        previous_value = self.pieces.pop(square,0)
+        if value != 0:
+            self.pieces[square] = value
+        if previous_value != 0:
+            self.__count_piece(previous_value,square,-1)
+        if value != 0:
+            self.__count_piece(value,square,1)
+
+    def __count_piece(self,piece,square,change):
+        if piece == 1:
+            self.__player1_pieces += change
+            if square // self.size == self.size - 1:
+                self.__player1_at_end += change
+        else:
+            self.__player2_pieces += change
+            if square // self.size == 0:
+                self.__player2_at_end += change
+
+    def __count_pieces(self):
+        pieces = list(self.pieces.items())
+        self.__player1_pieces = sum(1 for square, piece in pieces if piece == 1)
+        self.__player2_pieces = len(pieces) - self.__player1_pieces
+        self.__player1_at_end = sum(1 for square, piece in pieces if piece == 1 and square // self.size == self.size - 1)
+        self.__player2_at_end = sum(1 for square, piece in pieces if piece == -1 and square // self.size == 0)
+
+    def __pass_turn(self,user):
+        if user != self.turn:
+            self.zobrist ^= self.__side_key
+            self.turn = user
+
+    def __still_valid(self,option):
+        """Return whether a capture can still be made, like `CaptureOption.still_valid()` does on a `Board`."""
+        x_pos, y_pos, x_dir, y_dir = option.x_pos, option.y_pos, option.x_dir, option.y_dir
+        if not (0 <= x_pos + x_dir < self.size and 0 <= y_pos + y_dir < self.size):
+            return False
+        if self.piece_at(x_pos+x_dir,y_pos+y_dir) != 0:
+            return False
+        killer_piece = self.piece_at(x_pos,y_pos)
+        victim_piece = self.piece_at(x_pos+(x_dir//2),y_pos+(y_dir//2))
+        return killer_piece != victim_piece and killer_piece != 0 and victim_piece != 0
+
+    def __consider_capture(self,x_killer,y_killer,x_direct,y_direct):
+        """Add the capture as a CaptureOption if it is possible and not known yet. Returns whether it was added."""
+        if not (0 <= x_killer < self.size and 0 <= y_killer < self.size):
+            return False
+        key = (self.piece_at(x_killer,y_killer),x_killer,y_killer,x_direct,y_direct)
+        if key in self.capture_options:
+            return False
+
+        order = CaptureOption(*key)
+        if not self.__still_valid(order):
+            return False
+        self.capture_options.add(order)
+        if self.__journal is not None:
+            self.__journal.added_options.append(order)
+        return True
+
+    def __remove_capture_option(self,order):
+        index = self.capture_options.remove(order)
+        if self.__journal is not None:
+            self.__journal.removed_options.append((index,order))
+
+    def __refresh_capture_options(self):
+        """Drop every CaptureOption that is no longer valid."""
+        kept = 0
+        for forced_move in list(self.capture_options):
+            if self.__still_valid(forced_move):
+                kept += 1
+                continue
+            self.capture_options.discard(forced_move)
+            if self.__journal is not None:
+                self.__journal.removed_options.append((kept,forced_move))
+
+    def __find_capture_options(self):
+        """Look for every capture on the board from scratch, in the same order as `Board` finds them."""
+        options = CaptureIndex()
+        for x_pos, y_pos, piece in self.occupied():
+            for x_dir, y_dir in [(2,2),(2,-2),(-2,2),(-2,-2)]:
+                option = CaptureOption(piece,x_pos,y_pos,x_dir,y_dir)
+                if self.__still_valid(option):
+                    options.add(option)
+        return options
+
+    def __finish(self,user):
+        self.finished = True
+        self.winner = user
+
+    def __finishes_step(self,y_pos,moving_piece):
+        """Return whether a regular step of the piece onto the given row would end the game."""
+        if self.__reached_end():
+            return True
+        if moving_piece == 1:
+            return y_pos == self.size - 1
+        return y_pos == 0
+
+    def __victory_found(self):
+        if self.__reached_end():
+            return True
+        return self.__player1_pieces == 0 or self.__player2_pieces == 0
+
+    def __reached_end(self):
+        return self.__player1_at_end > 0 or self.__player2_at_end > 0
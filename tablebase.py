@@ -0,0 +1,246 @@
+from board import Board, Move
+import argparse
+import array
+import collections
+import contextlib
+import itertools
+import math
+import mmap
+import struct
+import sys
+import time
+
+# A tablebase starts with a header; one little-endian 16-bit value per position follows.
+# A value of 0 is a draw. Otherwise, the player to move wins (positive) or loses (negative) with best play,
+# and the game ends after `abs(value) - 1` more moves.
+TABLEBASE_VERSION = 1
+TABLEBASE_MAGIC = b'QCTB'
+# Magic, version, the most pieces, size and the amount of positions.
+TABLEBASE_HEADER = '<4sBBHQ'
+
+class Tablebase:
+    def __init__(self,data):
+        """A solved table of every position with at most a given amount of pieces on a board of a given size.
+        The positions are looked up straight from the data, which can be any bytes-like object, like the mmap `open()` makes.
+        Make one with `generate()`."""
+        view = memoryview(data)
+        if len(view) < struct.calcsize(TABLEBASE_HEADER):
+            raise ValueError("The tablebase has been cut off.")
+        magic, version, max_pieces, size, count = struct.unpack_from(TABLEBASE_HEADER,view,0)
+        if magic != TABLEBASE_MAGIC:
+            raise ValueError("The data isn't a tablebase.")
+        if version != TABLEBASE_VERSION:
+            raise ValueError("Tablebases of version {} can't be read.".format(version))
+        if len(view) < struct.calcsize(TABLEBASE_HEADER) + 2 * count:
+            raise ValueError("The tablebase has been cut off.")
+
+        self.size = size
+        self.max_pieces = max_pieces
+        self.__data = data
+        self.__view = view
+        self.__file = None
+        self.__binomials, self.__offsets, self.__count = _layout(size,max_pieces)
+        if count != self.__count:
+            raise ValueError("The tablebase doesn't hold the amount of positions its size and pieces call for.")
+
+    @classmethod
+    def open(cls,path):
+        """Map a tablebase file into memory. Only the positions that are looked up are read from the disk."""
+        with open(path,'rb') as file:
+            data = mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+        tablebase = cls(data)
+        tablebase.__file = data
+        return tablebase
+
+    def close(self):
+        """Close the file of a tablebase made with `open()`."""
+        self.__view.release()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exception):
+        self.close()
+
+    def __len__(self):
+        """Return the amount of positions in the table."""
+        return self.__count
+
+    def to_bytes(self):
+        return bytes(self.__view)
+
+    def save(self,path):
+        with open(path,'wb') as file:
+            file.write(self.__view)
+
+    def probe(self,board,user):
+        """Return `(outcome, moves)` for the user on turn on a `Board`, or None if the table doesn't hold the position.
+        The outcome is 1 if the user wins with best play, -1 if the user loses, and 0 for a draw. `moves` is the amount of
+        moves until the game ends, counting every capture of a chain; 0 for a draw."""
+        if board.finished:
+            return (1 if board.winner == user else -1), 0
+        if len(board) != self.size or board.piece_count(1) + board.piece_count(-1) > self.max_pieces:
+            return None
+        index = self.index(board.board,user)
+        if index is None:
+            return None
+
+        value = struct.unpack_from('<h',self.__view,struct.calcsize(TABLEBASE_HEADER) + 2*index)[0]
+        if value == 0:
+            return 0, 0
+        return (1 if value > 0 else -1), abs(value) - 1
+
+    def index(self,rows,user):
+        """Return where the position is stored, or None if it has too many pieces or a piece off the dark squares.
+        The dark squares are numbered row by row. The occupied ones, and which of those hold a piece of player 1,
+        are ranked in the combinatorial number system, within the block of positions with the same amount of pieces."""
+        binomials = self.__binomials
+        size = self.size
+        occupied = 0
+        rank = 0
+        ones = 0
+        ones_rank = 0
+        for y_pos, row in enumerate(rows):
+            if not any(row):
+                continue
+            for x_pos, piece in enumerate(row):
+                if piece == 0:
+                    continue
+                if (x_pos + y_pos) % 2 != 0 or occupied == self.max_pieces:
+                    return None
+                if piece == 1:
+                    ones += 1
+                    ones_rank += binomials[occupied][ones]
+                occupied += 1
+                rank += binomials[(y_pos*size + x_pos) // 2][occupied]
+
+        ranked = rank * binomials[occupied][ones] + ones_rank
+        return self.__offsets[(ones,occupied - ones)] + 2*ranked + (0 if user == 1 else 1)
+
+def _layout(size,max_pieces):
+    """Return the binomial coefficients the index needs, where every block of positions starts, and the amount of positions.
+    A block holds the positions with a given amount of pieces of either player, twice: once for either player on turn."""
+    squares = (size * size + 1) // 2
+    binomials = [[math.comb(n,k) for k in range(max_pieces + 2)] for n in range(max(squares,max_pieces) + 1)]
+    offsets = {}
+    count = 0
+    for pieces in range(max_pieces + 1):
+        for ones in range(pieces + 1):
+            offsets[(ones,pieces - ones)] = count
+            count += 2 * binomials[squares][pieces] * binomials[pieces][ones]
+    return binomials, offsets, count
+
+def generate(size,max_pieces,output=None):
+    """Solve every position with at most `max_pieces` pieces on a board of the given size, and return the `Tablebase`.
+    The moves of every position are made on a `Board`, so the table follows the rules exactly: captures are forced,
+    a chain of captures is made by the same player, and a player that can't move anymore has lost.
+    Positions that are over, because a piece reached the other end or a player has no pieces left, are lost for the
+    player on turn. From those, the outcomes are worked backwards, move by move, until nothing changes anymore.
+    Keyword arguments:
+    size -> the size of the board
+    max_pieces -> the most pieces of both players together
+    output -> a file object to write the progress to; nothing is written if None"""
+    binomials, offsets, count = _layout(size,max_pieces)
+    indexer = Tablebase(struct.pack(TABLEBASE_HEADER,TABLEBASE_MAGIC,TABLEBASE_VERSION,max_pieces,size,count) + bytes(2*count))
+    dark_squares = [(x_pos,y_pos) for y_pos in range(size) for x_pos in range(size) if (x_pos + y_pos) % 2 == 0]
+
+    values = array.array('h',bytes(2*count))
+    solved = bytearray(count)
+    # The amount of moves of every position whose outcome isn't known yet, and every move as (position, next position).
+    remaining = array.array('H',bytes(2*count))
+    sources = array.array('I')
+    targets = array.array('I')
+    queue = collections.deque()
+
+    start = time.perf_counter()
+    # With sys.stdout set to None, the warnings of jumps over friendly pieces aren't printed.
+    with contextlib.redirect_stdout(None):
+        for pieces in range(max_pieces + 1):
+            for tiles in itertools.combinations(dark_squares,pieces):
+                for owners in itertools.product([1,-1],repeat=pieces):
+                    squares = array.array('b',bytes(size*size))
+                    for (x_pos, y_pos), owner in zip(tiles,owners):
+                        squares[y_pos*size + x_pos] = owner
+                    for user in [1,-1]:
+                        board = Board._restore(squares,0,size,False,0,user,0)
+                        index = indexer.index(board.board,user)
+                        moves = [] if _is_over(board) else list(board.legal_moves(user))
+                        if not moves:
+                            # The game is over, or the player on turn can't move: either way, it's lost.
+                            values[index] = -1
+                            solved[index] = 1
+                            queue.append(index)
+                            continue
+
+                        remaining[index] = len(moves)
+                        for move in moves:
+                            answer = board.make_move(move[0],move[1],move[2],move[3],user)
+                            next_user = user if answer == Move.success_same_turn else -user
+                            sources.append(index)
+                            targets.append(indexer.index(board.board,next_user))
+                            board.unmake_move()
+        if output is not None:
+            output.write("{} positions and {} moves found in {:.1f} seconds\n".format(count,len(sources),time.perf_counter() - start))
+
+    # Every position, with the positions its moves come from, to walk the moves backwards.
+    first = array.array('I',bytes(4*(count + 1)))
+    for target in targets:
+        first[target + 1] += 1
+    for index in range(count):
+        first[index + 1] += first[index]
+    filled = array.array('I',first)
+    predecessors = array.array('I',bytes(4*len(sources)))
+    for source, target in zip(sources,targets):
+        predecessors[filled[target]] = source
+        filled[target] += 1
+    del sources, targets, filled
+
+    # Positions are solved in the order of the amount of moves left, so a win is as quick as it gets, and a loss as slow.
+    while queue:
+        index = queue.popleft()
+        value = values[index]
+        moves = abs(value)
+        for previous in predecessors[first[index]:first[index+1]]:
+            if solved[previous]:
+                continue
+            # A chain of captures leaves the same player on turn; any other move hands the turn over.
+            same_user = (previous & 1) == (index & 1)
+            if (value > 0) == same_user:
+                values[previous] = moves + 1
+            else:
+                remaining[previous] -= 1
+                if remaining[previous] > 0:
+                    continue
+                values[previous] = -(moves + 1)
+            solved[previous] = 1
+            queue.append(previous)
+
+    if output is not None:
+        output.write("{} positions solved in {:.1f} seconds\n".format(sum(solved),time.perf_counter() - start))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return Tablebase(struct.pack(TABLEBASE_HEADER,TABLEBASE_MAGIC,TABLEBASE_VERSION,max_pieces,size,count) + values.tobytes())
+
+def _is_over(board):
+    """Return whether a position is over: a piece has reached the other end, or a player has no pieces left."""
+    if 1 in board.board[-1] or -1 in board.board[0]:
+        return True
+    return board.piece_count(1) == 0 or board.piece_count(-1) == 0
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Solve every position with a few pieces on a small board.")
+    parser.add_argument('--size',type=int,default=5)
+    parser.add_argument('--max-pieces',type=int,default=3,help="the most pieces of both players together")
+    parser.add_argument('--output',required=True,help="file to write the tablebase to")
+    options = parser.parse_args(arguments)
+
+    tablebase = generate(options.size,options.max_pieces,sys.stdout)
+    tablebase.save(options.output)
+    print("{} positions written to {}".format(len(tablebase),options.output))
+    return tablebase
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,6 +1,31 @@
-from board import Board, CaptureOption, QBoard, Move
+from board import Board, CaptureIndex, CaptureOption, Measurement, MeasurementRequired, QBoard, Move
+from bench import compare, run_benchmarks
+from bitboard import BitBoard
+from engine import Engine, QEngine, TranspositionTable, WIN_SCORE
+from game import Checkers, QCheckers
+from instrument import instrumented
+from parallel import BranchPool
+from perft import divide, perft
+from record import GameRecord, game_winner, read_records, replay, write_record
+from server import GameServer
+from simulate import play_game, simulate
+from sparse import SparseBoard
+from tablebase import Tablebase, generate
+from qtensor import TensorQBoard, numpy
+from vecenv import VectorEnv
 
+import array
+import asyncio
+import contextlib
+import instrument
+import io
+import json
+import mmap
+import pickle
+import tempfile
+import random
 import unittest
+from unittest import mock
 
 class Test_Board(unittest.TestCase):
     def test_simple_game(self):
@@ -78,11 +103,1080 @@ class Test_Board(unittest.TestCase):
         with self.assertRaises(ValueError):
             Board(4,3)
 
+    def test_converging_playouts(self):
+        # Both halves of a split piece walk to the same tile, so the playouts become identical.
+        checkers = QBoard(7,1)
+        checkers.quantum_split(2,0,1)
+        checkers.move(0,6,1,-1,-1)
+        self.assertEqual(checkers.move(1,1,1,1,1), [Move.success_opponents_turn, Move.no_piece_found])
+        checkers.move(6,6,-1,-1,-1)
+        self.assertEqual(checkers.move(3,1,-1,1,1), [Move.no_piece_found, Move.success_opponents_turn])
+        self.assertEqual(len(checkers.board_list), 1)
+        self.assertEqual(checkers.multiplicity, [2])
+        self.assertEqual(checkers.branch_count(), 2)
+        self.assertEqual(checkers.quantum_board[2][2], 100)
+        # The playout that had no piece to move hands on the turn as well.
+        self.assertEqual(checkers.board_list[0].turn, -1)
+
+        checkers.move(5,5,-1,-1,-1)
+        self.assertEqual(checkers.quantum_split(2,2,1), [Move.success_opponents_turn])
+        self.assertEqual(checkers.multiplicity, [2,2])
+        self.assertEqual(checkers.quantum_board[3][1], 50)
+
+    def test_merge_keeps_turns(self):
+        # Two playouts with the same squares, but a different player on turn, are different positions.
+        checkers = QBoard(7,1)
+        other = checkers.board_list[0].copy()
+        other.pass_turn(-1)
+        checkers.board_list.append(other)
+        checkers.multiplicity.append(1)
+        checkers.update_quantum_board()
+        self.assertEqual(checkers.move(1,1,1,1,1), [Move.no_piece_found, Move.no_piece_found])
+        self.assertEqual([board.turn for board in checkers.board_list], [1,-1])
+        self.assertEqual(checkers.multiplicity, [1,1])
+
+    def test_incremental_quantum_board(self):
+        # The quantum board is kept up to date move by move; recalculating it from scratch shouldn't change a thing.
+        rng = random.Random(5)
+        checkers = QBoard(7,2)
+        user = 1
+        for attempt in range(400):
+            x_pos, y_pos = rng.randrange(7), rng.randrange(7)
+            if rng.random() < 0.3:
+                answer = checkers.quantum_split(x_pos,y_pos,user)
+            else:
+                distance = rng.choice([1,1,2])
+                with contextlib.redirect_stdout(io.StringIO()):
+                    answer = checkers.move(x_pos,y_pos,rng.choice([-distance,distance]),rng.choice([-distance,distance]),user)
+
+            quantum_board = checkers.quantum_board
+            capture_options = list(checkers.capture_options)
+            self.assertEqual(checkers.update_quantum_board(), quantum_board)
+            self.assertEqual(len(checkers.capture_options), len(capture_options))
+            for option in capture_options:
+                self.assertIn(option, checkers.capture_options)
+
+            if Move.success_opponents_turn in answer:
+                user *= -1
+            if checkers.finished:
+                break
+
     def test_quantum_split(self):
         checkers = QBoard(5,1)
         self.assertEqual(checkers.quantum_split(2,0,1),[Move.success_opponents_turn])
         self.assertEqual(checkers.quantum_board,[[100,0,0,0,100],[0,50,0,50,0],[0,0,0,0,0],[0,0,0,0,0],[-100,0,-100,0,-100]])
 
+class Test_CaptureIndex(unittest.TestCase):
+    def test_capture_option_record(self):
+        option = CaptureOption(-1,4,4,-2,-2)
+        self.assertEqual(option, CaptureOption(-1,4,4,-2,-2))
+        self.assertNotEqual(option, CaptureOption(1,4,4,-2,-2))
+        self.assertEqual(hash(option), hash((-1,4,4,-2,-2)))
+        with self.assertRaises(AttributeError):
+            option.x_pos = 3
+
+    def test_lookups(self):
+        checkers = Board(5,1)
+        checkers.move(0,0,1,1,1)
+        checkers.move(1,1,1,1,1)
+        checkers.move(2,2,1,1,1)
+        self.assertIn((-1,4,4,-2,-2), checkers.capture_options)
+        self.assertTrue(checkers.capture_options.has_user(-1))
+        self.assertFalse(checkers.capture_options.has_user(1))
+        self.assertEqual(checkers.capture_options.from_origin(2,4), [CaptureOption(-1,2,4,2,-2)])
+
+        index = CaptureIndex([CaptureOption(1,0,0,2,2)])
+        index.add(CaptureOption(1,0,0,2,2))
+        index.discard(CaptureOption(1,0,0,2,2),1)
+        self.assertEqual(index, [CaptureOption(1,0,0,2,2)])
+        index.discard(CaptureOption(1,0,0,2,2),1)
+        self.assertEqual(index, [])
+        with self.assertRaises(ValueError):
+            index.remove(CaptureOption(1,0,0,2,2))
+
+
+class Test_MakeMove(unittest.TestCase):
+    def test_unmake_restores_position(self):
+        rng = random.Random(3)
+        checkers = Board(7,2)
+        history = []
+        user = 1
+        for attempt in range(3000):
+            x_pos, y_pos = rng.randrange(7), rng.randrange(7)
+            distance = rng.choice([1,1,2])
+            x_dir, y_dir = rng.choice([-distance,distance]), rng.choice([-distance,distance])
+
+            snapshot = ([list(row) for row in checkers.board], list(checkers.capture_options), checkers.finished, checkers.winner)
+            legal = checkers.is_legal(x_pos,y_pos,x_dir,y_dir,user)
+            with contextlib.redirect_stdout(io.StringIO()):
+                answer = checkers.make_move(x_pos,y_pos,x_dir,y_dir,user)
+            self.assertEqual(legal, answer in [Move.success_opponents_turn, Move.success_same_turn, Move.finish] and not snapshot[2])
+            history.append(snapshot)
+
+            if answer == Move.success_opponents_turn:
+                user *= -1
+            if checkers.finished:
+                break
+
+        self.assertEqual(len(checkers.undo_stack), len(history))
+        while history:
+            checkers.unmake_move()
+            board, capture_options, finished, winner = history.pop()
+            self.assertEqual(checkers.board, board)
+            self.assertEqual(checkers.capture_options, capture_options)
+            self.assertEqual((checkers.finished, checkers.winner), (finished, winner))
+
+    def test_quantum_move_leaves_board_alone(self):
+        checkers = Board(5,1)
+        self.assertTrue(checkers.quantum_move(2,0,1))
+        self.assertFalse(checkers.quantum_move(0,0,1))
+        self.assertFalse(checkers.quantum_move(1,0,1))
+        self.assertEqual(checkers.board, Board(5,1).board)
+
+        # A split that would reach the last row ends the game, so it isn't a quantum move.
+        checkers = Board(3,1)
+        self.assertEqual(checkers.move(0,0,1,1,1), Move.success_opponents_turn)
+        self.assertFalse(checkers.quantum_move(1,1,1))
+
+
+class Test_LegalMoves(unittest.TestCase):
+    def test_board_moves(self):
+        checkers = Board(5,1)
+        self.assertEqual(sorted(checkers.legal_moves(1)), [(0,0,1,1),(2,0,-1,1),(2,0,1,1),(4,0,-1,1)])
+        checkers.move(0,0,1,1,1)
+        checkers.move(4,4,-1,-1,-1)
+        checkers.move(1,1,1,1,1)
+        # The opponent is forced to capture.
+        self.assertEqual(list(checkers.legal_moves(-1)), [(3,3,-2,-2)])
+
+    def test_every_generated_move_is_legal(self):
+        rng = random.Random(3)
+        for size, population in [(5,1),(6,2),(7,2)]:
+            checkers = QBoard(size,population)
+            user = 1
+            for turn in range(40):
+                moves = list(checkers.legal_moves(user))
+                if not moves:
+                    break
+                self.assertEqual(len(moves), len(set(moves)))
+                for board in checkers.board_list:
+                    expected = set()
+                    for y_pos in range(size):
+                        for x_pos in range(size):
+                            for x_dir, y_dir in [(1,1),(-1,1),(1,-1),(-1,-1),(2,2),(-2,2),(2,-2),(-2,-2)]:
+                                if board.is_legal(x_pos,y_pos,x_dir,y_dir,user):
+                                    expected.add((x_pos,y_pos,x_dir,y_dir))
+                    self.assertEqual(set(board.legal_moves(user)), expected)
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    answer = checkers.play(rng.choice(moves),user)
+                self.assertTrue(set(answer) & {Move.success_opponents_turn, Move.success_same_turn, Move.finish})
+                if Move.success_opponents_turn in answer:
+                    user *= -1
+                if checkers.finished:
+                    break
+
+
+class Test_Zobrist(unittest.TestCase):
+    def test_transposition(self):
+        first = Board(7,1)
+        first.move(0,0,1,1,1)
+        first.move(0,6,1,-1,-1)
+        first.move(2,0,1,1,1)
+        second = Board(7,1)
+        second.move(2,0,1,1,1)
+        second.move(0,6,1,-1,-1)
+        second.move(0,0,1,1,1)
+        self.assertEqual(first.board, second.board)
+        self.assertEqual(first.zobrist, second.zobrist)
+
+        # The same squares with the other player on turn hash differently.
+        self.assertEqual(first.turn, -1)
+        self.assertNotEqual(first.zobrist, Board(7,1).zobrist)
+        first.make_move(6,6,-1,-1,-1)
+        self.assertNotEqual(first.zobrist, second.zobrist)
+        first.unmake_move()
+        self.assertEqual(first.zobrist, second.zobrist)
+
+    def test_superposition_hash(self):
+        checkers = QBoard(7,1)
+        checkers.quantum_split(2,0,1)
+        checkers.move(0,6,1,-1,-1)
+        checkers.quantum_split(4,0,1)
+        answer = checkers.zobrist
+
+        checkers.board_list.reverse()
+        checkers.multiplicity.reverse()
+        self.assertEqual(checkers.zobrist, answer)
+        checkers.multiplicity = [3*weight for weight in checkers.multiplicity]
+        self.assertEqual(checkers.zobrist, answer)
+        checkers.multiplicity[0] += 1
+        self.assertNotEqual(checkers.zobrist, answer)
+
+
+def rows(board):
+    """The rows a board stores, without copying the ones it shares the way `Board.board` does."""
+    return board._Board__rows
+
+
+class Test_CopyOnWrite(unittest.TestCase):
+    def test_board_copy(self):
+        board = Board(8,3)
+        duplicate = board.copy()
+        self.assertIs(rows(duplicate)[0], rows(board)[0])
+        self.assertIs(duplicate.capture_options, board.capture_options)
+
+        duplicate.move(2,2,1,1,1)
+        self.assertEqual(rows(board), Board(8,3).board)
+        self.assertEqual(board.capture_options, [])
+        self.assertIsNot(rows(duplicate)[2], rows(board)[2])
+        self.assertIs(rows(duplicate)[4], rows(board)[4])
+
+        # Taking back a move only writes to the rows of the board it was made on.
+        duplicate.move(5,5,-1,-1,-1)
+        board.make_move(4,2,-1,1,1)
+        board.unmake_move()
+        self.assertEqual(board.board, Board(8,3).board)
+        self.assertEqual(len(duplicate.capture_options), 2)
+
+    def test_quantum_split_shares_rows(self):
+        checkers = QBoard(8,3)
+        checkers.quantum_split(2,2,1)
+        left, right = checkers.board_list
+        self.assertIs(rows(left)[0], rows(right)[0])
+        self.assertIsNot(rows(left)[2], rows(right)[2])
+        self.assertEqual(checkers.quantum_board[3][1], 50)
+        self.assertEqual(checkers.quantum_board[3][3], 50)
+
+    def test_public_rows(self):
+        board = Board(8,3)
+        duplicate = board.copy()
+        duplicate.board[4][4] = 1
+        self.assertEqual(board.board, Board(8,3).board)
+        self.assertEqual(duplicate.board[4][4], 1)
+
+        checkers = QBoard(8,3)
+        checkers.quantum_split(2,2,1)
+        left, right = checkers.board_list
+        left.board[4][4] = -1
+        self.assertEqual(right.board[4][4], 0)
+        self.assertIsNot(rows(left)[0], rows(right)[0])
+
+
+class Test_PieceCounters(unittest.TestCase):
+    def assertCounted(self,board):
+        for user in [1,-1]:
+            self.assertEqual(board.piece_count(user), sum(row.count(user) for row in board.board))
+
+    def test_counters_follow_moves(self):
+        rng = random.Random(21)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for game in range(20):
+                board = Board(6,2)
+                user = 1
+                while not board.finished:
+                    move = rng.choice(list(board.legal_moves(user)))
+                    duplicate = board.copy()
+                    board.make_move(*move,user)
+                    self.assertCounted(board)
+                    self.assertCounted(duplicate)
+                    if rng.random() < 0.2:
+                        board.unmake_move()
+                        self.assertCounted(board)
+                        continue
+                    user = board.turn
+                self.assertCounted(Board.from_bytes(board.to_bytes()))
+                # The game ends when a piece reaches the other end, or when one of the players has no pieces left.
+                self.assertTrue(1 in board.board[-1] or -1 in board.board[0] or 0 in [board.piece_count(1),board.piece_count(-1)])
+
+    def test_empty_board(self):
+        checkers = Board(0,0)
+        self.assertEqual(checkers.board, [])
+        self.assertEqual(checkers.piece_count(1), 0)
+        self.assertEqual(Board.from_bytes(checkers.to_bytes()).piece_count(-1), 0)
+
+    def test_quantum_finished(self):
+        for seed in range(10):
+            checkers = QBoard(6,2,rng=seed)
+            for move, user in play_random_moves(QBoard(6,2,rng=seed),seed):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    checkers.play(move,user)
+                self.assertEqual(checkers.finished, all(board.finished for board in checkers.board_list))
+            copy = QBoard.from_bytes(checkers.to_bytes())
+            self.assertEqual(copy.finished, checkers.finished)
+
+
+class Test_Perft(unittest.TestCase):
+    def test_board(self):
+        board = Board(6,2)
+        self.assertEqual([perft(board,depth) for depth in range(5)], [1,9,81,396,1439])
+        counts = divide(board,3,workers=2)
+        self.assertEqual(counts, divide(board,3))
+        self.assertEqual(sum(counts.values()), 396)
+        self.assertEqual((board.board, board.zobrist, board.undo_stack), (Board(6,2).board, Board(6,2).zobrist, []))
+
+    def test_quantum(self):
+        checkers = QBoard(6,2)
+        self.assertEqual(sum(divide(checkers,4).values()), 1677)
+        self.assertEqual((len(checkers.board_list), checkers.measurements), (1, []))
+
+    def test_backends_agree(self):
+        for board_class in [Board,BitBoard,SparseBoard]:
+            self.assertEqual([perft(board_class(6,2),depth) for depth in range(5)], [1,9,81,396,1439])
+        quantum_classes = [QBoard] if numpy is None else [QBoard,TensorQBoard]
+        for quantum_class in quantum_classes:
+            self.assertEqual([perft(quantum_class(5,1),depth) for depth in range(5)], [1,5,25,160,506])
+            self.assertEqual(perft(quantum_class(6,2),3), 458)
+
+    def test_strict_replay(self):
+        checkers = QBoard(6,2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for move, user in [(('Q',1,1),1),((0,4,1,-1),-1),((2,2,-2,2),1)]:
+                checkers.play(move,user)
+        # The step goes to a tile that a capture has filled in one of the playouts only.
+        first = checkers.copy()
+        first.replay_measurements([],strict=True)
+        with self.assertRaises(MeasurementRequired) as required:
+            first.move(1,5,-1,-1,-1)
+        self.assertEqual((required.exception.x_pos, required.exception.y_pos, required.exception.outcomes), (0,4,[-1,1]))
+        second = checkers.copy()
+        second.replay_measurements([Measurement(0,4,1)],strict=True)
+        second.move(1,5,-1,-1,-1)
+        self.assertEqual(second.measurements, [Measurement(0,4,1)])
+
+
+def board_with(size,pieces,user):
+    """Make a board that holds only the given pieces, as `{(x_pos,y_pos): piece}`, with the user on turn."""
+    squares = array.array('b',bytes(size*size))
+    for (x_pos, y_pos), piece in pieces.items():
+        squares[y_pos*size + x_pos] = piece
+    return Board._restore(squares,0,size,False,0,user,0)
+
+
+class Test_Tablebase(unittest.TestCase):
+    def test_file(self):
+        tablebase = generate(5,3)
+        board = board_with(5,{(0,0): 1, (2,4): -1, (1,3): -1},1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/5x5.qctb'
+            tablebase.save(path)
+            with Tablebase.open(path) as mapped:
+                self.assertEqual(len(mapped), len(tablebase))
+                self.assertEqual(mapped.probe(board,1), tablebase.probe(board,1))
+                self.assertEqual(mapped.probe(board,-1), tablebase.probe(board,-1))
+        self.assertIsNone(tablebase.probe(Board(5,1),1))
+        with self.assertRaises(ValueError):
+            Tablebase(b'QCQB' + tablebase.to_bytes()[4:])
+
+    def test_same_as_search(self):
+        tablebase = generate(5,3)
+        rng = random.Random(24)
+        dark_squares = [(x_pos,y_pos) for y_pos in range(5) for x_pos in range(5) if (x_pos + y_pos) % 2 == 0]
+        checked = 0
+        while checked < 30:
+            pieces = {tile: rng.choice([1,-1]) for tile in rng.sample(dark_squares,3)}
+            board = board_with(5,pieces,rng.choice([1,-1]))
+            if len(set(pieces.values())) < 2 or 1 in board.board[-1] or -1 in board.board[0] or len(list(board.legal_moves(board.turn))) < 2:
+                continue
+            outcome, moves = tablebase.probe(board,board.turn)
+            engine = Engine(max_depth=moves + 1)
+            engine.search(board,board.turn)
+            self.assertEqual(engine.score, outcome * (WIN_SCORE - moves))
+            # With the tablebase, a single move ahead is enough.
+            engine = Engine(max_depth=moves + 1,tablebase=tablebase)
+            engine.search(board,board.turn)
+            self.assertEqual((engine.score, engine.depth), (outcome * (WIN_SCORE - moves), 1))
+            checked += 1
+
+
+class Test_Engine(unittest.TestCase):
+    def test_search_leaves_board_alone(self):
+        checkers = Board(6,2)
+        checkers.move(0,0,1,1,1)
+        before = (checkers.board, checkers.zobrist, list(checkers.capture_options), checkers.turn)
+        engine = Engine(max_depth=4)
+        move = engine.search(checkers,-1)
+        self.assertTrue(checkers.is_legal(move[0],move[1],move[2],move[3],-1))
+        self.assertEqual((checkers.board, checkers.zobrist, list(checkers.capture_options), checkers.turn), before)
+        self.assertEqual(checkers.undo_stack, [])
+        self.assertEqual(engine.depth, 4)
+        self.assertGreater(engine.nps(), 0)
+
+    def test_budget(self):
+        engine = Engine(node_limit=500,table_size=64)
+        engine.search(Board(8,3),1)
+        self.assertLessEqual(engine.nodes, 500)
+        self.assertLessEqual(len(engine.table), 64)
+
+        table = TranspositionTable(4)
+        table.store(5,3,10,0,None)
+        table.store(9,1,20,0,None)
+        self.assertEqual(table.probe(5), (3,10,0,None))
+        table.new_search()
+        table.store(9,1,20,0,None)
+        self.assertEqual(table.probe(5), None)
+        self.assertEqual(table.probe(9), (1,20,0,None))
+
+    def test_engine_beats_first_move(self):
+        match = Checkers(6,2,engines={1: Engine(max_depth=3)})
+        with contextlib.redirect_stdout(io.StringIO()):
+            while not match.environment.finished:
+                if match.player_turn == 1:
+                    match.ask_for_next_move(False)
+                    continue
+                move = next(match.environment.legal_moves(-1))
+                if match.environment.move(move[0],move[1],move[2],move[3],-1) == Move.success_opponents_turn:
+                    match.player_turn = 1
+        self.assertEqual(match.environment.winner, 1)
+
+
+class Test_QEngine(unittest.TestCase):
+    def test_search_leaves_board_alone(self):
+        checkers = QBoard(6,2)
+        checkers.quantum_split(0,0,1)
+        before = (checkers.quantum_board, checkers.zobrist, checkers.multiplicity)
+        engine = QEngine(iterations=200,seed=5)
+        move = engine.search(checkers,-1)
+        self.assertIn(move, list(checkers.legal_moves(-1)))
+        self.assertEqual((checkers.quantum_board, checkers.zobrist, checkers.multiplicity), before)
+        self.assertEqual(engine.playouts, 200)
+        self.assertEqual(sum(visits for visits, reward in engine.visits.values()), 200)
+        self.assertTrue(0 <= engine.reward(checkers,1) <= 1)
+
+    def test_quantum_classes(self):
+        quantum_classes = [QBoard] if numpy is None else [QBoard,TensorQBoard]
+        for quantum_class in quantum_classes:
+            checkers = quantum_class(6,2)
+            checkers.quantum_split(0,0,1)
+            before = (checkers.quantum_board, checkers.zobrist)
+            engine = QEngine(iterations=50,seed=5)
+            self.assertIn(engine.search(checkers,-1), list(checkers.legal_moves(-1)))
+            self.assertEqual((checkers.quantum_board, checkers.zobrist), before)
+            self.assertTrue(0 <= engine.reward(checkers,1) <= 1)
+        # The hash of a TensorQBoard matches the one of a QBoard with the same playouts.
+        reference = QBoard(6,2)
+        reference.quantum_split(0,0,1)
+        self.assertEqual(checkers.zobrist, reference.zobrist)
+
+    def test_parallel_search(self):
+        engine = QEngine(iterations=40,workers=2,seed=5)
+        try:
+            move = engine.search(QBoard(6,2),1)
+        finally:
+            engine.close()
+        self.assertIn(move, list(QBoard(6,2).legal_moves(1)))
+        self.assertEqual(engine.playouts, 40)
+
+    def test_engine_plays_a_game(self):
+        match = QCheckers(5,1,engines={1: QEngine(iterations=50,seed=1), -1: QEngine(iterations=50,seed=2)})
+        with contextlib.redirect_stdout(io.StringIO()):
+            for turn in range(100):
+                if match.environment.finished or not list(match.environment.legal_moves(match.player_turn)):
+                    break
+                match.ask_for_next_move(False)
+        self.assertGreater(turn, 0)
+
+
+class Test_Simulate(unittest.TestCase):
+    def test_play_game(self):
+        state = random.getstate()
+        result = play_game(3,quantum=True,size=6,population=2,policies=('greedy','random'))
+        self.assertEqual(random.getstate(), state)
+        again = play_game(3,quantum=True,size=6,population=2,policies=('greedy','random'))
+        for key in ['winner','reason','length','branch_peak']:
+            self.assertEqual(again[key], result[key])
+        self.assertIn(result['winner'], [1,-1,None])
+        self.assertGreater(result['length'], 0)
+        self.assertGreaterEqual(result['branch_peak'], 1)
+
+    def test_workers_agree(self):
+        results = []
+        for workers in [1,2]:
+            output = io.StringIO()
+            summary = simulate(12,size=6,population=2,workers=workers,seed=40,output=output)
+            self.assertEqual(sum(summary['wins'].values()), 12)
+            results.append(sorted(json.loads(line)['seed'] for line in output.getvalue().splitlines()))
+            results.append(summary['wins'])
+        self.assertEqual(results[0], list(range(40,52)))
+        self.assertEqual(results[0:2], results[2:4])
+
+
+def play_random_moves(checkers,seed):
+    """Play random legal moves on a quantum board until the game is over, and return them."""
+    rng = random.Random(seed)
+    moves = []
+    user = 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        for turn in range(60):
+            options = list(checkers.legal_moves(user))
+            if checkers.finished or not options:
+                break
+            move = rng.choice(options)
+            moves.append((move,user))
+            if Move.success_opponents_turn in checkers.play(move,user):
+                user *= -1
+    return moves
+
+
+class Test_Measurements(unittest.TestCase):
+    def test_seeded_measurements(self):
+        state = random.getstate()
+        first = QBoard(6,2,rng=19)
+        second = QBoard(6,2,rng=random.Random(19))
+        play_random_moves(first,19)
+        play_random_moves(second,19)
+        self.assertEqual(random.getstate(), state)
+        self.assertEqual(len(first.measurements), 2)
+        self.assertEqual(first.measurements, second.measurements)
+        self.assertEqual(first.zobrist, second.zobrist)
+
+    def test_replay(self):
+        original = QBoard(6,2,rng=5)
+        moves = play_random_moves(original,5)
+        self.assertEqual(len(original.measurements), 2)
+
+        # Another generator would measure differently, but the record takes precedence.
+        replay = QBoard(6,2,rng=1234)
+        replay.replay_measurements(original.measurements)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for move, user in moves:
+                replay.play(move,user)
+        self.assertEqual(replay.measurements, original.measurements)
+        self.assertEqual([board.board for board in replay.board_list], [board.board for board in original.board_list])
+        self.assertEqual(replay.multiplicity, original.multiplicity)
+
+        wrong = QBoard(6,2)
+        wrong.replay_measurements([Measurement(0,0,1)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(ValueError):
+                for move, user in moves:
+                    wrong.play(move,user)
+
+
+class Test_Budget(unittest.TestCase):
+    def test_measure(self):
+        checkers = QBoard(8,3,rng=1,max_branches=2)
+        checkers.quantum_split(2,2,1)
+        self.assertEqual(checkers.quantum_split(5,5,-1), [Move.success_opponents_turn])
+        # The split made four positions, so the least certain tile was measured.
+        self.assertEqual(len(checkers.board_list), 2)
+        self.assertEqual(checkers.measurements, [Measurement(1,3,1)])
+        self.assertEqual(checkers.usage(), {'branches': 2, 'peak_branches': 2, 'max_branches': 2,
+                                            'forced_measurements': 1, 'refused_splits': 0})
+
+    def test_refuse(self):
+        checkers = QBoard(8,3,max_branches=2,over_budget='refuse')
+        checkers.quantum_split(2,2,1)
+        self.assertEqual(checkers.quantum_split(5,5,-1), [Move.branch_limit])
+        self.assertEqual(len(checkers.board_list), 2)
+        self.assertEqual(checkers.refused_splits, 1)
+        self.assertNotIn('Q', [move[0] for move in checkers.legal_moves(-1)])
+        self.assertRaises(ValueError, QBoard, 8, 3, None, 0)
+
+    def test_replay(self):
+        result = play_game(11,quantum=True,size=8,population=2,record=True,max_branches=4)
+        record = GameRecord.from_bytes(result['record'])
+        self.assertEqual(record.max_branches, 4)
+
+        board = QBoard(8,2,max_branches=4)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for step in replay(record,board):
+                self.assertLessEqual(len(board.board_list), 4)
+        self.assertEqual(board.measurements, record.measurements())
+        self.assertGreater(board.forced_measurements, 0)
+
+
+class Test_BranchPool(unittest.TestCase):
+    def test_same_game(self):
+        with BranchPool(2,min_branches=1) as pool:
+            copy = pickle.loads(pickle.dumps(pool))
+            self.assertEqual((copy.workers, copy.min_branches), (2, 1))
+
+            boards = [QBoard(8,3,rng=4), QBoard(8,3,rng=4,pool=pool)]
+            games = [play_random_moves(board,6) for board in boards]
+            self.assertEqual(games[0], games[1])
+            self.assertEqual(boards[0].measurements, boards[1].measurements)
+            self.assertEqual(boards[0].quantum_board, boards[1].quantum_board)
+            self.assertEqual(boards[0].zobrist, boards[1].zobrist)
+            for playout, other in zip(boards[0].board_list,boards[1].board_list):
+                self.assertEqual(playout.board, other.board)
+                self.assertEqual(playout.capture_options, other.capture_options)
+                self.assertEqual(playout.turn, other.turn)
+
+
+class Test_Record(unittest.TestCase):
+    def test_encoding(self):
+        record = GameRecord(10,3,quantum=True)
+        record.add_move((0,2,1,1),1)
+        record.add_move(('Q',9,7),-1)
+        record.add_measurement(Measurement(8,6,-1))
+        record.add_move((4,4,-2,2),1)
+        record.add_measurement(Measurement(2,6,0))
+        data = record.to_bytes()
+        self.assertLessEqual(len(data), 3 + 2*5 + 1)
+        self.assertEqual(GameRecord.from_bytes(data), record)
+        self.assertEqual(len(record), 3)
+
+        with self.assertRaises(ValueError):
+            GameRecord.from_bytes(data[:-1])
+
+    def test_streaming_replay(self):
+        records = []
+        boards = []
+        for seed in [5,19]:
+            checkers = QBoard(6,2,rng=seed)
+            record = GameRecord(6,2,quantum=True)
+            for move, user in play_random_moves(checkers,seed):
+                record.add_move(move,user)
+            # The measurements can be added in one go, as they are replayed in order.
+            for measurement in checkers.measurements:
+                record.add_measurement(measurement)
+            records.append(record)
+            boards.append(checkers)
+
+        stream = io.BytesIO()
+        for record in records:
+            write_record(stream,record)
+        stream.seek(0)
+
+        # Read with tiny chunks, so records and varints are split over several reads.
+        for record, original in zip(read_records(stream,chunk_size=3),boards):
+            replayed = QBoard(6,2)
+            with contextlib.redirect_stdout(io.StringIO()):
+                answers = list(replay(record,replayed))
+            self.assertEqual(len(answers), len(record))
+            self.assertEqual(replayed.measurements, original.measurements)
+            self.assertEqual([board.board for board in replayed.board_list], [board.board for board in original.board_list])
+
+    def test_game_keeps_record(self):
+        match = Checkers(5,1,engines={1: Engine(max_depth=2), -1: Engine(max_depth=2)})
+        with contextlib.redirect_stdout(io.StringIO()):
+            match.tstart()
+        checkers = Board(5,1)
+        for move, user, answer in replay(match.record,checkers):
+            pass
+        self.assertEqual(checkers.board, match.environment.board)
+        self.assertTrue(checkers.finished)
+
+    def test_game_winner(self):
+        board = Board(3,1)
+        self.assertEqual(game_winner(board,1,'no_moves',False), -1)
+        self.assertEqual(game_winner(board,1,'move_limit',False), None)
+        board.finished, board.winner = True, 1
+        self.assertEqual(game_winner(board,-1,'finished',False), 1)
+
+        quantum = QBoard(3,1)
+        quantum.board_list = [Board(3,1),Board(3,1),Board(3,1)]
+        quantum.multiplicity = [1,1,1]
+        for branch, winner in zip(quantum.board_list,[1,-1,-1]):
+            branch.winner = winner
+        self.assertEqual(game_winner(quantum,1,'finished',True), -1)
+        quantum.multiplicity = [2,1,1]
+        self.assertEqual(game_winner(quantum,1,'finished',True), None)
+
+
+class Test_Snapshot(unittest.TestCase):
+    def test_board(self):
+        checkers = Board(5,1)
+        checkers.move(0,0,1,1,1)
+        checkers.move(4,4,-1,-1,-1)
+        checkers.move(1,1,1,1,1)
+        data = checkers.to_bytes()
+        self.assertEqual(len(data), 18 + 25)
+
+        loaded = Board.from_bytes(memoryview(data))
+        self.assertEqual(loaded.board, checkers.board)
+        self.assertEqual((loaded.zobrist, loaded.turn, loaded.finished, loaded.winner), (checkers.zobrist, checkers.turn, False, None))
+        self.assertNotIn('capture_options', vars(loaded))
+        self.assertEqual(set(loaded.capture_options), set(checkers.capture_options))
+        self.assertEqual(loaded.move(3,3,-2,-2,-1), checkers.move(3,3,-2,-2,-1))
+        self.assertEqual(loaded.board, checkers.board)
+
+        with self.assertRaises(ValueError):
+            Board.from_bytes(data[:-1])
+        with self.assertRaises(ValueError):
+            QBoard.from_bytes(data)
+
+    def test_quantum_board(self):
+        checkers = QBoard(6,2,rng=5)
+        play_random_moves(checkers,5)
+        with tempfile.TemporaryFile() as snapshot:
+            snapshot.write(checkers.to_bytes())
+            snapshot.flush()
+            with mmap.mmap(snapshot.fileno(),0,access=mmap.ACCESS_READ) as mapped:
+                loaded = QBoard.from_bytes(mapped)
+
+        self.assertEqual([board.board for board in loaded.board_list], [board.board for board in checkers.board_list])
+        self.assertEqual(loaded.multiplicity, checkers.multiplicity)
+        self.assertEqual(loaded.quantum_board, checkers.quantum_board)
+        self.assertEqual(loaded.zobrist, checkers.zobrist)
+        self.assertEqual(len(loaded.capture_options), len(checkers.capture_options))
+        for option in checkers.capture_options:
+            self.assertEqual(loaded.capture_options.references(option), checkers.capture_options.references(option))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_tensor_board(self):
+        checkers = QBoard(6,2,rng=19)
+        play_random_moves(checkers,19)
+        loaded = TensorQBoard.from_bytes(checkers.to_bytes())
+        self.assertEqual(loaded.branches.tolist(), [board.board for board in checkers.board_list])
+        self.assertEqual(loaded.quantum_board, checkers.quantum_board)
+        self.assertEqual(QBoard.from_bytes(loaded.to_bytes()).quantum_board, checkers.quantum_board)
+
+
+class Test_Server(unittest.IsolatedAsyncioTestCase):
+    async def connect(self,server):
+        reader, writer = await asyncio.open_connection('127.0.0.1',server.port)
+        self.addAsyncCleanup(self.disconnect,writer)
+        self.assertEqual(await reader.readline(), b'HELLO\n')
+        return reader, writer
+
+    async def disconnect(self,writer):
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
+
+    async def ask(self,client,line,answers):
+        """Send a line, unless it's empty, and return the amount of lines asked for."""
+        reader, writer = client
+        if line:
+            writer.write((line + '\n').encode('ascii'))
+            await writer.drain()
+        return [(await asyncio.wait_for(reader.readline(),5)).decode('ascii').strip() for answer in range(answers)]
+
+    async def test_session(self):
+        server = GameServer(port=0,workers=1,offload_branches=2)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        a = await self.connect(server)
+        b = await self.connect(server)
+
+        self.assertEqual(await self.ask(a,'NEW Q 6 2 7',1), ['SESSION 1 PLAYER 1'])
+        self.assertEqual(await self.ask(a,'Q 1 1',1), ['ERROR waiting for opponent'])
+        self.assertEqual(await self.ask(b,'JOIN 1',3), ['SESSION 1 PLAYER -1','START','TURN 1'])
+        self.assertEqual(await self.ask(a,'',2), ['START','TURN 1'])
+        self.assertEqual(await self.ask(b,'4 4 -1 -1',1), ['ERROR not your turn'])
+
+        moved = ['MOVED 1 Q 1 1 success_opponents_turn','TURN -1']
+        self.assertEqual(await self.ask(a,'Q 1 1',2), moved)
+        self.assertEqual(await self.ask(b,'',2), moved)
+
+        # With two playouts, the next moves are made in the worker process.
+        moved = await self.ask(b,'4 4 -1 -1',2)
+        self.assertEqual(moved[1], 'TURN 1')
+        self.assertEqual(await self.ask(a,'',2), moved)
+        self.assertEqual(await self.ask(a,'Q 3 1',1), ['REFUSED capture_ignored capture_ignored'])
+        moved = await self.ask(a,'2 2 2 2',2)
+        self.assertEqual(moved[1], 'TURN -1')
+        self.assertEqual(await self.ask(b,'',2), moved)
+
+        session = server.sessions[1]
+        self.assertEqual(len(session.record), 3)
+        self.assertEqual(session.board.branch_count(), 2)
+        # The board that comes back from the worker draws its measurements from the session again.
+        self.assertIs(session.board.rng, session.rng)
+        board = await self.ask(b,'BOARD',7)
+        self.assertEqual(board[-1], 'END')
+        self.assertEqual(board[0].split()[1:], [str(value) for value in session.board.quantum_board[0]])
+
+    async def test_invalid_commands(self):
+        server = GameServer(port=0,workers=0)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        a = await self.connect(server)
+        b = await self.connect(server)
+
+        for line in ['NEW Q 0 0','NEW C 0 0','NEW C 40000 1','NEW C 6 0','NEW C 6 4','NEW C six','NEW X 8']:
+            self.assertEqual(await self.ask(a,line,1), ['ERROR invalid game settings'])
+        self.assertEqual(await self.ask(a,'NEW C 6 2',1), ['SESSION 1 PLAYER 1'])
+        await self.ask(b,'JOIN 1',3)
+        await self.ask(a,'',2)
+
+        # A command that fails unexpectedly is answered with an error, and the client stays connected.
+        with mock.patch.object(Board,'move',side_effect=RuntimeError):
+            self.assertEqual(await self.ask(a,'1 1 1 1',1), ['ERROR internal error'])
+        self.assertEqual(await self.ask(a,'1 1 1 1',2), ['MOVED 1 1 1 1 1 success_opponents_turn','TURN -1'])
+
+    async def test_winner(self):
+        server = GameServer(port=0,workers=0)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        for number, weights, result in [(1,[2,1],'WINNER -1'),(2,[1,1],'DRAW')]:
+            a = await self.connect(server)
+            b = await self.connect(server)
+            await self.ask(a,'NEW Q 4 1',1)
+            await self.ask(b,'JOIN {}'.format(number),3)
+            await self.ask(a,'',2)
+            # Player -1 has won the first playout already; the step of player 1 wins the other one.
+            finished = board_with(4,{(1,2): 1,(3,0): -1},1)
+            finished.finished, finished.winner = True, -1
+            session = server.sessions[number]
+            session.board.board_list = [finished,board_with(4,{(1,2): 1,(3,0): -1},1)]
+            session.board.multiplicity = weights
+            session.board.update_quantum_board()
+
+            self.assertEqual(await self.ask(a,'1 2 1 1',2), ['MOVED 1 1 2 1 1 finish finish',result])
+            self.assertEqual(await self.ask(b,'',2), ['MOVED 1 1 2 1 1 finish finish',result])
+
+    async def test_idle_timeout(self):
+        server = GameServer(port=0,idle_timeout=0.5,workers=0)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        a = await self.connect(server)
+        b = await self.connect(server)
+
+        await self.ask(a,'NEW C 6 2',1)
+        await self.ask(b,'JOIN 1',3)
+        await self.ask(a,'',2)
+        self.assertEqual(await self.ask(a,'1 1 1 1',2), ['MOVED 1 1 1 1 1 success_opponents_turn','TURN -1'])
+        # Only the client that keeps talking stays connected.
+        self.assertEqual(await self.ask(b,'',2), ['MOVED 1 1 1 1 1 success_opponents_turn','TURN -1'])
+        # Player -1 speaks up well after player 1 went silent, so player 1 is the first to time out.
+        await asyncio.sleep(0.25)
+        b[1].write(b'BOARD\n')
+        self.assertEqual(await self.ask(a,'',1), ['ERROR idle timeout'])
+        self.assertEqual((await self.ask(b,'',8))[-1], 'LEFT 1')
+        self.assertEqual(await self.ask(b,'',1), ['ERROR idle timeout'])
+        self.assertEqual(server.sessions, {})
+
+
+class Test_BitBoard(unittest.TestCase):
+    def test_full_game(self):
+        checkers = BitBoard(7,1)
+        self.assertEqual(checkers.board, Board(7,1).board)
+        self.assertEqual(checkers.move(0,0,1,1,1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(0,0,1,1,1), Move.no_piece_found)
+        self.assertEqual(checkers.move(0,6,1,-1,-1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(6,0,-1,1,1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(2,6,1,-1,-1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(5,1,1,1,1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(4,6,1,-1,-1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(1,1,-1,1,1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(1,5,1,-1,-1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(6,2,-1,1,1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(2,4,-1,-1,-1), Move.success_opponents_turn)
+        self.assertEqual(checkers.move(0,2,2,2,1), Move.success_same_turn)
+        self.assertEqual(checkers.finished,False)
+        self.assertEqual(checkers.move(2,4,2,2,1), Move.finish)
+        self.assertEqual(checkers.finished,True)
+
+    def test_same_as_board(self):
+        # Throw the same random (and often illegal) moves at both boards and compare the outcome.
+        rng = random.Random(7)
+        for size, population in [(5,1),(7,2),(8,3)]:
+            reference = Board(size,population)
+            checkers = BitBoard(size,population)
+            user = 1
+            for attempt in range(2000):
+                x_pos, y_pos = rng.randrange(size), rng.randrange(size)
+                distance = rng.choice([1,1,2])
+                x_dir, y_dir = rng.choice([-distance,distance]), rng.choice([-distance,distance])
+                with contextlib.redirect_stdout(io.StringIO()):
+                    answer = reference.move(x_pos,y_pos,x_dir,y_dir,user)
+                    self.assertEqual(checkers.move(x_pos,y_pos,x_dir,y_dir,user), answer)
+                self.assertEqual(checkers.board, reference.board)
+                self.assertEqual(checkers.quantum_move(x_pos,y_pos,user), reference.quantum_move(x_pos,y_pos,user))
+                self.assertEqual(len(checkers.capture_options), len(reference.capture_options))
+                for option in checkers.capture_options:
+                    self.assertIn(option, reference.capture_options)
+                if answer == Move.success_opponents_turn:
+                    user *= -1
+                if reference.finished:
+                    break
+
+
+class Test_SparseBoard(unittest.TestCase):
+    def test_same_as_board(self):
+        # Play the same random moves on both boards, taking some of them back, and compare everything after every move.
+        rng = random.Random(11)
+        engine = Engine(max_depth=1)
+        for size, population in [(6,2),(8,3),(10,2)]:
+            reference = Board(size,population)
+            checkers = SparseBoard(size,population)
+            user = 1
+            for attempt in range(300):
+                moves = list(reference.legal_moves(user))
+                self.assertEqual(list(checkers.legal_moves(user)), moves)
+                if not moves:
+                    break
+                move = rng.choice(moves)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    answer = reference.make_move(*move,user)
+                    self.assertEqual(checkers.make_move(*move,user), answer)
+                if rng.random() < 0.2:
+                    reference.unmake_move()
+                    checkers.unmake_move()
+                elif answer == Move.success_opponents_turn:
+                    user *= -1
+                self.assertEqual(checkers.board, reference.board)
+                self.assertEqual(checkers.capture_options, reference.capture_options)
+                self.assertEqual(checkers.zobrist, reference.zobrist)
+                self.assertEqual(checkers.to_bytes(), reference.to_bytes())
+                self.assertEqual(checkers.piece_count(-1), reference.piece_count(-1))
+                self.assertEqual(engine.evaluate(checkers,user), engine.evaluate(reference,user))
+                if reference.finished:
+                    break
+        self.assertEqual(perft(SparseBoard(6,2),4), 1439)
+        self.assertEqual(len(SparseBoard(200,2).pieces), 400)
+
+    def test_quantum(self):
+        # The playouts of a QBoard can be sparse; the game goes exactly the same.
+        checkers = QBoard(8,3,rng=27,max_branches=4,board_class=SparseBoard)
+        reference = QBoard(8,3,rng=27,max_branches=4)
+        self.assertIsInstance(checkers.board_list[0], SparseBoard)
+        rng = random.Random(27)
+        user = 1
+        for attempt in range(60):
+            moves = list(reference.legal_moves(user))
+            self.assertEqual(list(checkers.legal_moves(user)), moves)
+            if not moves or reference.finished:
+                break
+            move = rng.choice(moves)
+            with contextlib.redirect_stdout(io.StringIO()):
+                answer = reference.play(move,user)
+                self.assertEqual(checkers.play(move,user), answer)
+            if Move.success_opponents_turn in answer:
+                user *= -1
+            self.assertEqual(checkers.quantum_board, reference.quantum_board)
+            self.assertEqual(checkers.zobrist, reference.zobrist)
+        self.assertEqual(len(checkers.measurements), 4)
+        self.assertEqual(checkers.measurements, reference.measurements)
+        self.assertEqual(checkers.to_bytes(), reference.to_bytes())
+
+        loaded = QBoard.from_bytes(reference.to_bytes(),board_class=SparseBoard)
+        self.assertIsInstance(loaded.board_list[0], SparseBoard)
+        self.assertEqual(loaded.quantum_board, reference.quantum_board)
+        with self.assertRaises(ValueError):
+            QBoard(8,3,pool=BranchPool(1),board_class=SparseBoard)
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class Test_TensorQBoard(unittest.TestCase):
+    def test_entanglement(self):
+        checkers = TensorQBoard(7,1)
+        checkers.quantum_split(2,0,1)
+        checkers.move(0,6,1,-1,-1)
+        checkers.quantum_split(4,0,1)
+        checkers.move(1,5,1,-1,-1)
+        checkers.move(5,1,1,1,1)
+        checkers.move(2,4,-1,-1,-1)
+        checkers.move(1,1,1,1,1)
+        self.assertEqual(checkers.quantum_board,[[100,0,0,0,25,0,100],[0,0,0,75,0,0,0],[0,0,50,0,0,0,50],[0,-100,0,0,0,0,0],[0,0,0,0,0,0,0],[0,0,0,0,0,0,0],[0,0,-100,0,-100,0,-100]])
+
+    def test_same_as_qboard(self):
+        # Play the same random moves on both boards, with the same measurement outcomes.
+        rng = random.Random(11)
+        for size, population in [(5,1),(7,1),(8,2)]:
+            reference = QBoard(size,population)
+            checkers = TensorQBoard(size,population)
+            user = 1
+            for attempt in range(300):
+                x_pos, y_pos = rng.randrange(size), rng.randrange(size)
+                distance = rng.choice([1,1,2])
+                x_dir, y_dir = rng.choice([-distance,distance]), rng.choice([-distance,distance])
+                quantum = rng.random() < 0.3
+
+                state = random.getstate()
+                answers = []
+                for board in [reference, checkers]:
+                    random.setstate(state)
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        if quantum:
+                            answers.append(board.quantum_split(x_pos,y_pos,user))
+                        else:
+                            answers.append(board.move(x_pos,y_pos,x_dir,y_dir,user))
+
+                self.assertEqual(answers[0], answers[1])
+                self.assertEqual(checkers.quantum_board, reference.quantum_board)
+                self.assertEqual(checkers.branches.tolist(), [board.board for board in reference.board_list])
+                self.assertEqual(checkers.multiplicity.tolist(), reference.multiplicity)
+                self.assertEqual(len(checkers.capture_options), len(reference.capture_options))
+                self.assertEqual(checkers.finished, reference.finished)
+
+                if Move.success_opponents_turn in answers[0]:
+                    user *= -1
+                if reference.finished:
+                    break
+
+
+class Test_Instrument(unittest.TestCase):
+    def test_counters(self):
+        calls = []
+        with instrumented(lambda name, seconds, board: calls.append((name,board))) as snapshot:
+            checkers = QBoard(8,3,rng=1,max_branches=2)
+            checkers.quantum_split(2,2,1)
+            checkers.quantum_split(5,5,-1)
+            stats = snapshot()
+
+        counters = stats['counters']
+        self.assertEqual(counters['branches_created'], 3)
+        self.assertEqual(counters['branches_pruned'], 2)
+        self.assertEqual(counters['measurements'], 1)
+        self.assertEqual(counters['board_copies'], 3)
+        self.assertGreater(counters['still_valid'], 0)
+        self.assertGreater(counters['row_copies'], 0)
+
+        self.assertEqual(stats['latency']['QBoard.quantum_split']['calls'], 2)
+        self.assertEqual(sum(stats['latency']['Board.move']['histogram'].values()), 6)
+        self.assertIn(('QBoard.quantum_split',checkers), calls)
+
+    def test_disabled(self):
+        move = Board.move
+        instrument.enable()
+        self.assertIsNot(Board.move, move)
+        instrument.disable()
+        self.assertIs(Board.move, move)
+        self.assertFalse(instrument.is_enabled())
+
+        counters = instrument.snapshot()['counters']
+        Board(8,3).move(2,2,1,1,1)
+        self.assertEqual(instrument.snapshot()['counters'], counters)
+
+
+class Test_Bench(unittest.TestCase):
+    def test_report(self):
+        report = run_benchmarks(['capture_chain','qboard_move'],sizes=[8,16],branches=[1,16],repeat=2,min_time=0.001,max_squares=2000)
+        cases = [(case['name'],case['size'],case['branches']) for case in report['results']]
+        self.assertEqual(cases, [('capture_chain',8,1),('capture_chain',16,1),('qboard_move',8,1),('qboard_move',8,16),('qboard_move',16,1)])
+        self.assertEqual(report['skipped'], [{'name': 'qboard_move', 'size': 16, 'branches': 16}])
+        self.assertEqual(json.loads(json.dumps(report)), report)
+
+        baseline = json.loads(json.dumps(report))
+        baseline['results'][0]['best'] /= 2
+        self.assertEqual([(case['name'],case['size']) for case in compare(report,baseline)], [('capture_chain',8)])
+        self.assertEqual(compare(report,baseline,tolerance=1.5), [])
+
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class Test_VectorEnv(unittest.TestCase):
+    def test_masks_and_resets(self):
+        for quantum in [False,True]:
+            env = VectorEnv(4,quantum,size=6,population=2,seed=22,max_moves=30)
+            observations, masks = env.reset()
+            self.assertEqual(observations.shape, (4,6,6))
+            self.assertEqual(masks.shape, (4,env.action_count))
+            rng = random.Random(22)
+            done = 0
+            for turn in range(100):
+                for game in range(4):
+                    legal = sorted(env.move_action(move) for move in env.boards[game].legal_moves(int(env.players[game])))
+                    self.assertEqual(list(numpy.flatnonzero(masks[game])), legal)
+                actions = [rng.choice(numpy.flatnonzero(mask)) for mask in masks]
+                observations, rewards, dones, masks = env.step(actions)
+                self.assertTrue(set(rewards[~dones]) <= {0})
+                done += dones.sum()
+            self.assertGreater(done, 0)
+            self.assertTrue(all(moves < 30 for moves in env.moves))
+
+    def test_actions(self):
+        env = VectorEnv(1,True,size=6,population=2)
+        for move in [(0,0,1,1),(3,2,-2,-2),('Q',4,1)]:
+            self.assertEqual(env.action_move(env.move_action(move)), move)
+        env.reset()
+        observations, rewards, dones, masks = env.step([env.move_action(('Q',1,1))])
+        self.assertEqual(list(observations[0][2][:3]), [0.5,0,0.5])
+        self.assertEqual(env.players[0], -1)
 
 if __name__ == '__main__':
     unittest.main()
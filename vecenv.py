@@ -0,0 +1,135 @@
+from board import Board, QBoard, Move
+from record import game_winner
+import contextlib
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Every square has an action for each direction a piece can go in: four steps and four jumps.
+# On quantum boards, a split of the piece on every square follows after all of those.
+DIRECTIONS = [(1,1),(-1,1),(1,-1),(-1,-1),(2,2),(-2,2),(2,-2),(-2,-2)]
+DIRECTION_INDEX = {direction: index for index, direction in enumerate(DIRECTIONS)}
+
+class VectorEnv:
+    def __init__(self,games,quantum=False,size=8,population=3,seed=None,max_moves=500,max_branches=None):
+        """Play a batch of independent games in lockstep, for training agents in bulk.
+        Every call of `step()` makes one move in every game, and a game that ends starts over right away.
+        The observations, rewards and masks of the batch come in NumPy arrays, but the games themselves are moved one at a time.
+        The agent plays both sides; `Object.players` says who is to move in every game.
+        Keyword arguments:
+        games -> the amount of games to play at once
+        quantum -> play on QBoards instead of Boards
+        size -> the size of the board
+        population -> the amount of rows each player has populated with pieces
+        seed -> the seed of the measurements of the quantum games
+        max_moves -> the amount of moves after which a game is called off as a draw
+        max_branches -> the branch budget of a quantum board, or None for no limit"""
+        if numpy is None:
+            raise ImportError("VectorEnv requires NumPy. Install it with 'pip install numpy'.")
+
+        self.games = games
+        self.quantum = quantum
+        self.size = size
+        self.population = population
+        self.max_moves = max_moves
+        self.max_branches = max_branches
+        self.rng = random.Random(seed)
+
+        self.action_count = size * size * (len(DIRECTIONS) + (1 if quantum else 0))
+        self.boards = [None for game in range(games)]
+        self.players = numpy.ones(games,dtype=numpy.int8)
+        self.moves = numpy.zeros(games,dtype=numpy.int64)
+
+        self.observations = numpy.zeros((games,size,size),dtype=numpy.float32)
+        self.masks = numpy.zeros((games,self.action_count),dtype=bool)
+
+    def reset(self):
+        """Start every game over. Returns the observations and the legal-action masks."""
+        for game in range(self.games):
+            self.__new_game(game)
+        return self.observations.copy(), self.masks.copy()
+
+    def step(self,actions):
+        """Make an action in every game, for the player that is to move there.
+        Returns the observations, the rewards, the done flags and the legal-action masks, as NumPy arrays.
+        The reward goes to the player that made the action: 1 if it won the game, -1 if it lost, and 0 otherwise.
+        A game that is done has started over already, so its observation and mask are those of the new game.
+        An action that isn't legal is refused: the game stays as it was, but the move still counts towards `max_moves`."""
+        if len(actions) != self.games:
+            raise ValueError("Expected {} actions, one for every game, but got {}.".format(self.games,len(actions)))
+        rewards = numpy.zeros(self.games,dtype=numpy.float32)
+        dones = numpy.zeros(self.games,dtype=bool)
+
+        # With sys.stdout set to None, the warnings of jumps over friendly pieces aren't printed.
+        with contextlib.redirect_stdout(None):
+            for game, action in enumerate(actions):
+                board = self.boards[game]
+                user = int(self.players[game])
+                answer = board.play(self.action_move(int(action)),user)
+                self.moves[game] += 1
+
+                answers = answer if isinstance(answer,list) else [answer]
+                if Move.success_opponents_turn in answers:
+                    self.players[game] = -user
+
+                winner, done = self.__update(game)
+                if done:
+                    rewards[game] = 0 if winner is None else (1 if winner == user else -1)
+                    dones[game] = True
+                    self.__new_game(game)
+
+        return self.observations.copy(), rewards, dones, self.masks.copy()
+
+    def action_move(self,action):
+        """Turn an action into the move it stands for: `(x_pos,y_pos,x_dir,y_dir)`, or `('Q',x_pos,y_pos)` for a split."""
+        squares = self.size * self.size
+        if not 0 <= action < self.action_count:
+            raise ValueError("Action {} is out of range; there are {} actions.".format(action,self.action_count))
+        if action >= squares * len(DIRECTIONS):
+            square = action - squares * len(DIRECTIONS)
+            return ('Q',square % self.size,square // self.size)
+        square, direction = divmod(action,len(DIRECTIONS))
+        x_dir, y_dir = DIRECTIONS[direction]
+        return (square % self.size,square // self.size,x_dir,y_dir)
+
+    def move_action(self,move):
+        """Turn a move, as yielded by `legal_moves()`, into its action."""
+        if move[0] == 'Q':
+            return self.size * self.size * len(DIRECTIONS) + move[2] * self.size + move[1]
+        x_pos, y_pos, x_dir, y_dir = move
+        return (y_pos * self.size + x_pos) * len(DIRECTIONS) + DIRECTION_INDEX[(x_dir,y_dir)]
+
+    def __new_game(self,game):
+        if self.quantum:
+            self.boards[game] = QBoard(self.size,self.population,rng=self.rng.getrandbits(64),max_branches=self.max_branches)
+        else:
+            self.boards[game] = Board(self.size,self.population)
+        self.players[game] = 1
+        self.moves[game] = 0
+        self.__update(game)
+
+    def __update(self,game):
+        """Write the observation and mask of a game, and return its winner and whether it's done."""
+        board = self.boards[game]
+        user = int(self.players[game])
+        mask = self.masks[game]
+        mask[:] = False
+
+        if self.quantum:
+            self.observations[game] = board.quantum_board
+            self.observations[game] /= 100
+        else:
+            self.observations[game] = board.board
+
+        if board.finished:
+            return game_winner(board,user,'finished',self.quantum), True
+        for move in board.legal_moves(user):
+            mask[self.move_action(move)] = True
+        if not mask.any():
+            return game_winner(board,user,'no_moves',self.quantum), True
+        if self.moves[game] >= self.max_moves:
+            return None, True
+        return None, False